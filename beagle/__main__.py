@@ -2,19 +2,99 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
 from beagle.logging import init_logger
+from beagle import metrics
 from beagle.collection import Collection
-from beagle.index import InvertedIndexType, load_index, InvertedIndex, load_doc_index
+from beagle.pipeline import default_pipeline
+from beagle.index import (
+    InvertedIndexType,
+    IndexFormat,
+    INDEX_FILE_NAMES,
+    load_index,
+    find_index_file,
+    InvertedIndex,
+    load_doc_index,
+    find_doc_index_file,
+    DocIndex,
+    DOC_INDEX_FILE_NAME,
+    LEGACY_DOC_INDEX_FILE_NAME,
+    benchmark_codecs,
+)
+from beagle.postings import Codec
+from beagle.lemmatizer import (
+    LEMMAS_FILE_NAME,
+    load_lemma_cache,
+    set_lemma_cache,
+    get_lemma_cache,
+)
 from beagle.binary_search_engine import BinarySearchEngine
-from beagle.vectorial_search_engine import VectorialSearchEngine
+from beagle.vectorial_search_engine import (
+    DEFAULT_PONDERATIONS,
+    VectorialSearchEngine,
+    compute_norms,
+)
+from beagle.norms import (
+    Norms,
+    NORMS_FILE_NAME,
+    LEGACY_NORMS_FILE_NAME,
+    find_norms_file,
+    load_norms,
+)
+from beagle.bitmap import (
+    Bitmap,
+    BITMAPS_FILE_NAME,
+    build_bitmaps,
+    save_bitmaps,
+    load_bitmaps,
+)
+from beagle.wildcard import KGRAMS_FILE_NAME, KGramIndex, load_kgrams
+from beagle.sharding import (
+    ShardedIndex,
+    ShardedSearchEngine,
+    shard_path,
+    has_shards,
+    save_shards_manifest,
+    remove_shards,
+    load_sharded_index,
+)
 from beagle.search_engines import (
     EngineType,
     SearchEngine,
     DocumentPonderation,
     TermPonderation,
 )
-from beagle.stats import load_stats, Stats
-from typing import List
+from beagle.stats import (
+    STATS_FILE_NAME,
+    LEGACY_STATS_FILE_NAME,
+    find_stats_file,
+    load_stats,
+    Stats,
+)
+from beagle.query_cache import QueryCache
+from beagle.server import Server
+from beagle.segments import (
+    DEFAULT_MERGE_FACTOR,
+    SegmentWatcher,
+    add_segment,
+    merge_segments,
+    has_segments,
+    remove_segments,
+    load_segments,
+    read_generation,
+)
+from beagle.batch import run_batch, read_queries
+from beagle.bench import (
+    CS276_SHARDS,
+    CS276_MEAN_LENGTH,
+    run_bench,
+    compare_results,
+)
+from typing import Callable, List, Dict, Tuple, Optional
 from enum import Enum
 
 DOCUMENTS_LIST_LIMIT = 10
@@ -59,6 +139,69 @@ def main() -> None:
         help="do not filter the tokens with the stop words list",
         action="store_true",
     )
+    index_parser.add_argument(
+        "--format",
+        type=IndexFormat,
+        choices=list(IndexFormat),
+        default=IndexFormat.JSON,
+        help="on-disk format of the index",
+    )
+    index_parser.add_argument(
+        "-c",
+        "--codec",
+        type=Codec,
+        choices=list(Codec),
+        default=Codec.VBYTE,
+        help="postings compression codec of a binary index",
+    )
+    index_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes among which the shards are indexed",
+    )
+    index_parser.add_argument(
+        "-m",
+        "--memory-budget",
+        type=int,
+        default=None,
+        help="memory budget (in MiB) of a single-pass indexing that streams the documents and merges sorted runs from disk (requires the binary format)",
+    )
+    index_parser.add_argument(
+        "--bitmaps-min-df",
+        type=int,
+        default=None,
+        help="precompute the doc ids bitmaps of the terms that appear in at least this number of documents, for the binary engine",
+    )
+    index_parser.add_argument(
+        "--per-shard",
+        help="keep the index of every shard on its own, so that the queries are answered shard by shard",
+        action="store_true",
+    )
+    index_parser.add_argument(
+        "--lemma-cache-size",
+        type=int,
+        default=None,
+        help="maximum number of lemmas kept in the cache (unbounded by default)",
+    )
+    index_parser.add_argument(
+        "-i",
+        "--incremental",
+        help="only index the files added or changed since the previous incremental indexing, in a new segment (requires the binary format)",
+        action="store_true",
+    )
+    index_parser.add_argument(
+        "--merge-factor",
+        type=int,
+        default=DEFAULT_MERGE_FACTOR,
+        help="number of segments of the same size tier that are merged together",
+    )
+    index_parser.add_argument(
+        "--no-merge",
+        help="do not merge the segments after an incremental indexing",
+        action="store_true",
+    )
 
     search_parser = subparsers.add_parser("search", help="to query the collection")
     search_parser.formatter_class = argparse.ArgumentDefaultsHelpFormatter
@@ -89,42 +232,424 @@ def main() -> None:
         "--output",
         type=str,
         default=None,
-        help="to save the results of a direct query to a file",
+        help="to save the results of a direct query (or of a batch, as JSON lines) to a file",
+    )
+    search_parser.add_argument(
+        "-b",
+        "--batch",
+        type=str,
+        default=None,
+        help="path to a file of queries (one per line) to answer in a batch",
+    )
+    search_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes among which the queries of a batch are spread",
+    )
+    search_parser.add_argument(
+        "-k",
+        "--top",
+        type=int,
+        default=None,
+        help="only retrieve the k best documents (all the matching documents by default)",
+    )
+    search_parser.add_argument(
+        "--max-edits",
+        type=int,
+        default=0,
+        help="edit distance under which the vocabulary terms replace a query term missing from the index (0 to disable the fuzzy matching)",
+    )
+    search_parser.add_argument(
+        "--lemma-cache-size",
+        type=int,
+        default=None,
+        help="maximum number of lemmas kept in the cache (unbounded by default)",
+    )
+    search_parser.add_argument(
+        "--cache-entries",
+        type=int,
+        default=1024,
+        help="maximum number of queries results kept in the cache (0 to disable it)",
+    )
+    search_parser.add_argument(
+        "--cache-memory",
+        type=int,
+        default=64,
+        help="maximum memory (in MiB) used by the queries results cache",
+    )
+    search_parser.add_argument(
+        "--no-metrics",
+        help="do not record the metrics of the interactive console",
+        action="store_true",
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="to answer queries over HTTP with the index loaded once"
+    )
+    serve_parser.formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    serve_parser.add_argument(
+        "-x",
+        "--index",
+        type=str,
+        default="./index/",
+        help="path to the saved index and stats",
+    )
+    serve_parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="address to listen on"
+    )
+    serve_parser.add_argument(
+        "-p", "--port", type=int, default=8080, help="port to listen on"
+    )
+    serve_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="maximum number of queries evaluated at the same time",
+    )
+    serve_parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=64,
+        help="maximum number of queries waiting for their evaluation, beyond which the server answers 503",
+    )
+    serve_parser.add_argument(
+        "--cache-entries",
+        type=int,
+        default=1024,
+        help="maximum number of queries results kept in the cache (0 to disable it)",
+    )
+    serve_parser.add_argument(
+        "--cache-memory",
+        type=int,
+        default=64,
+        help="maximum memory (in MiB) used by the queries results cache",
+    )
+    serve_parser.add_argument(
+        "--max-edits",
+        type=int,
+        default=0,
+        help="edit distance under which the vocabulary terms replace a query term missing from the index (0 to disable the fuzzy matching)",
+    )
+    serve_parser.add_argument(
+        "--lemma-cache-size",
+        type=int,
+        default=None,
+        help="maximum number of lemmas kept in the cache (unbounded by default)",
+    )
+    serve_parser.add_argument(
+        "--no-metrics",
+        help="do not record the metrics exposed on /metrics",
+        action="store_true",
+    )
+    serve_parser.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=1.0,
+        help="seconds between two checks for new segments of an incremental index",
+    )
+    serve_parser.add_argument(
+        "--merge-factor",
+        type=int,
+        default=DEFAULT_MERGE_FACTOR,
+        help="number of segments of the same size tier that are merged together in the background (0 to disable the merges)",
+    )
+
+    codecs_parser = subparsers.add_parser(
+        "benchmark-codecs",
+        help="to measure the size and decoding speed of the postings codecs",
+    )
+    codecs_parser.formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    codecs_parser.add_argument(
+        "-x",
+        "--index",
+        type=str,
+        default="./index/",
+        help="path to the saved index",
+    )
+
+    bench_parser = subparsers.add_parser(
+        "bench",
+        help="to time the indexing, the index loading and the queries on a synthetic collection shaped as CS276",
+    )
+    bench_parser.formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    bench_parser.add_argument(
+        "-s",
+        "--scale",
+        type=float,
+        default=0.01,
+        help="size of the synthetic collection relatively to CS276 (1 for about 99k documents)",
+    )
+    bench_parser.add_argument(
+        "--shards", type=int, default=CS276_SHARDS, help="number of shards"
+    )
+    bench_parser.add_argument(
+        "--vocabulary",
+        type=int,
+        default=None,
+        help="number of distinct words (scaled from the CS276 vocabulary by default)",
+    )
+    bench_parser.add_argument(
+        "--mean-length",
+        type=int,
+        default=CS276_MEAN_LENGTH,
+        help="mean number of tokens of the documents",
+    )
+    bench_parser.add_argument(
+        "--zipf-exponent",
+        type=float,
+        default=1.0,
+        help="exponent of the Zipf distribution of the words frequencies",
+    )
+    bench_parser.add_argument(
+        "-t",
+        "--type",
+        type=InvertedIndexType,
+        choices=list(InvertedIndexType),
+        default=InvertedIndexType.POSITIONS_INDEX,
+        help="type of index",
+    )
+    bench_parser.add_argument(
+        "--format",
+        type=IndexFormat,
+        choices=list(IndexFormat),
+        default=IndexFormat.BINARY,
+        help="on-disk format of the index",
+    )
+    bench_parser.add_argument(
+        "-c",
+        "--codec",
+        type=Codec,
+        choices=list(Codec),
+        default=Codec.VBYTE,
+        help="postings compression codec of a binary index",
+    )
+    bench_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes among which the shards are indexed",
+    )
+    bench_parser.add_argument(
+        "--bitmaps-min-df",
+        type=int,
+        default=None,
+        help="precompute the doc ids bitmaps of the terms that appear in at least this number of documents",
+    )
+    bench_parser.add_argument(
+        "-q",
+        "--queries",
+        type=int,
+        default=20,
+        help="number of queries timed per engine and ponderations",
+    )
+    bench_parser.add_argument(
+        "-k",
+        "--top",
+        type=int,
+        default=None,
+        help="only retrieve the k best documents (all the matching documents by default)",
+    )
+    bench_parser.add_argument(
+        "-f",
+        "--no-filter",
+        help="do not put the stop words list at the top of the vocabulary and filter it",
+        action="store_true",
+    )
+    bench_parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the collection and queries"
+    )
+    bench_parser.add_argument(
+        "-d",
+        "--directory",
+        type=str,
+        default=None,
+        help="where to keep the generated collection and index (a temporary directory by default)",
+    )
+    bench_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="./bench.json",
+        help="path to which save the results as JSON",
+    )
+    bench_parser.add_argument(
+        "-b",
+        "--baseline",
+        type=str,
+        default=None,
+        help="path to the results of a previous run to compare the new ones with",
     )
 
     args = parser.parse_args()
     if args.cmd == "index":
+        # the lemmas of a previous indexing are reused, and saved back with the index
+        set_lemma_cache(
+            load_lemma_cache(args.output + LEMMAS_FILE_NAME, args.lemma_cache_size)
+        )
+
+        if args.incremental:
+            if args.format != IndexFormat.BINARY or args.workers > 1:
+                parser.error(
+                    "the incremental indexing requires the binary format and a single worker"
+                )
+            stop_words = None
+            if not args.no_filter:
+                collection = Collection("cs276", args.dataset)
+                collection.load_stop_words_list("./stop_words.json")
+                stop_words = collection.stop_words
+
+            segment = add_segment(
+                args.dataset,
+                args.output,
+                args.type,
+                default_pipeline(stop_words),
+                args.codec,
+            )
+            if segment is not None:
+                print(
+                    f"{TextStyle.OKGREEN}{segment.documents} documents were indexed in {segment.name}{TextStyle.ENDC}"
+                )
+            if not args.no_merge:
+                merge_segments(args.output, args.merge_factor)
+
+            get_lemma_cache().save(args.output + LEMMAS_FILE_NAME)
+            return
+
         collection = Collection("cs276", args.dataset)
         collection.scan_shards()
         collection.scan_documents()
-        collection.load_documents()
-
         if not args.no_filter:
             collection.load_stop_words_list("./stop_words.json")
-            collection.filter_documents()
+        pipeline = default_pipeline(None if args.no_filter else collection.stop_words)
 
-        collection.lemmatize_documents()
+        remove_shards(args.output)
+        if args.per_shard:
+            if args.memory_budget is not None:
+                parser.error("the per-shard indexes cannot use a memory budget")
+            shard_indexes, stats = collection.index_shards(
+                args.type, pipeline, args.workers, args.codec
+            )
+            names = [s.name for s in collection.shards]
+            for (name, shard_index) in zip(names, shard_indexes):
+                dirpath = shard_path(args.output, name)
+                shard_index.save(
+                    dirpath + INDEX_FILE_NAMES[args.format], args.format, args.codec
+                )
+                if args.bitmaps_min_df is not None:
+                    save_bitmaps(
+                        build_bitmaps(shard_index, args.bitmaps_min_df),
+                        dirpath + BITMAPS_FILE_NAME,
+                    )
+            save_shards_manifest(args.output, names)
+            index = ShardedIndex(shard_indexes, names)
+        elif args.memory_budget is not None:
+            if args.format != IndexFormat.BINARY or args.workers > 1:
+                parser.error(
+                    "the memory budget requires the binary format and a single worker"
+                )
+            index = None
+            stats = collection.index_spimi(
+                args.type,
+                args.output + INDEX_FILE_NAMES[args.format],
+                args.memory_budget * 2 ** 20,
+                pipeline,
+                args.codec,
+            )
+        elif args.workers > 1:
+            index, stats = collection.index_in_parallel(
+                args.type, args.workers, pipeline, args.codec
+            )
+        else:
+            index, stats = collection.index_stream(args.type, pipeline)
 
-        index = collection.index(args.type)
-        index.save(args.output + "index.json")
+        if index is not None and not args.per_shard:
+            index.save(
+                args.output + INDEX_FILE_NAMES[args.format], args.format, args.codec
+            )
+        # a stale index in another format (or incremental, or a whole index instead of
+        # the shards ones) would otherwise shadow the new one
+        remove_segments(args.output)
+        for index_format in IndexFormat:
+            stale_path = args.output + INDEX_FILE_NAMES[index_format]
+            if (args.per_shard or index_format != args.format) and os.path.exists(
+                stale_path
+            ):
+                os.remove(stale_path)
 
-        stats = collection.compute_stats()
-        stats.save(args.output + "stats.json")
+        stats.save(args.output + STATS_FILE_NAME)
+        if os.path.exists(args.output + LEGACY_STATS_FILE_NAME):
+            os.remove(args.output + LEGACY_STATS_FILE_NAME)
+
+        if index is None:
+            index = load_index(args.output + INDEX_FILE_NAMES[args.format])
+        if index.type != InvertedIndexType.DOCUMENTS_INDEX:
+            compute_norms(index, stats, [DEFAULT_PONDERATIONS]).save(
+                args.output + NORMS_FILE_NAME
+            )
+        elif os.path.exists(args.output + NORMS_FILE_NAME):
+            os.remove(args.output + NORMS_FILE_NAME)
+        if os.path.exists(args.output + LEGACY_NORMS_FILE_NAME):
+            os.remove(args.output + LEGACY_NORMS_FILE_NAME)
+
+        # the bitmaps of a sharded index are the ones of its shards
+        if args.bitmaps_min_df is not None and not args.per_shard:
+            save_bitmaps(
+                build_bitmaps(index, args.bitmaps_min_df),
+                args.output + BITMAPS_FILE_NAME,
+            )
+        elif os.path.exists(args.output + BITMAPS_FILE_NAME):
+            os.remove(args.output + BITMAPS_FILE_NAME)
+
+        KGramIndex.build(index.entries).save(args.output + KGRAMS_FILE_NAME)
 
         doc_index = collection.get_doc_index()
-        doc_index.save(args.output + "doc_index.json")
+        doc_index.save(args.output + DOC_INDEX_FILE_NAME)
+        if os.path.exists(args.output + LEGACY_DOC_INDEX_FILE_NAME):
+            os.remove(args.output + LEGACY_DOC_INDEX_FILE_NAME)
+
+        get_lemma_cache().save(args.output + LEMMAS_FILE_NAME)
     elif args.cmd == "search":
-        index = load_index(args.index + "index.json")
-        stats = load_stats(args.index + "stats.json")
-        doc_index = load_doc_index(args.index + "doc_index.json")
+        set_lemma_cache(
+            load_lemma_cache(args.index + LEMMAS_FILE_NAME, args.lemma_cache_size)
+        )
+        index, stats, doc_index, norms, bitmaps = load_search_files(args.index)
+        stop_words = load_query_stop_words()
+        cache = QueryCache(args.cache_entries, args.cache_memory * 2 ** 20)
 
         engine_name = args.engine
-        engine = load_engine(index, stats, engine_name)
+        engine = load_engine(
+            index,
+            stats,
+            norms,
+            bitmaps,
+            engine_name,
+            cache,
+            args.max_edits,
+            stop_words=stop_words,
+        )
 
-        if args.query is not None:
+        if args.batch is not None:
+            queries = read_queries(args.batch)
+            if args.output is not None:
+                with open(args.output, "w") as f:
+                    summary = run_batch(
+                        engine, doc_index, queries, f, args.workers, args.top
+                    )
+            else:
+                summary = run_batch(
+                    engine, doc_index, queries, sys.stdout, args.workers, args.top
+                )
+            print(
+                f"{TextStyle.OKGREEN}{summary.report()}{TextStyle.ENDC}",
+                file=sys.stderr,
+            )
+        elif args.query is not None:
             # Direct query
             try:
-                results = engine.query(args.query)
+                results = engine.search(args.query, args.top)
                 formatted_results = doc_index.format_results(results)
 
                 print(
@@ -153,6 +678,9 @@ def main() -> None:
         else:
             # Interactive console
             formatted_results = None
+            if not args.no_metrics:
+                metrics.enable()
+                register_gauges(lambda: index, lambda: stats, cache)
             print(
                 f"{TextStyle.OKGREEN}{TextStyle.BOLD}Welcome! Type .help to get instructions{TextStyle.ENDC}"
             )
@@ -188,7 +716,16 @@ def main() -> None:
                             )
                             continue
                         engine_name = EngineType(margs[0])
-                        engine = load_engine(index, stats, engine_name)
+                        engine = load_engine(
+                            index,
+                            stats,
+                            norms,
+                            bitmaps,
+                            engine_name,
+                            cache,
+                            args.max_edits,
+                            stop_words=stop_words,
+                        )
                         print(
                             f"{TextStyle.OKGREEN}Engine set to {engine}{TextStyle.ENDC}"
                         )
@@ -284,6 +821,70 @@ def main() -> None:
                         print(
                             f"{TextStyle.OKGREEN}Query term ponderation set to {ponderation_name}{TextStyle.ENDC}"
                         )
+                    elif cmd == "explain":
+                        if engine.type() != EngineType.BINARY_SEARCH:
+                            print(
+                                f"{TextStyle.WARNING}This option is not available for your current engine{TextStyle.ENDC}"
+                            )
+                            continue
+                        if len(margs) == 0:
+                            print(
+                                f"{TextStyle.WARNING}No query specified{TextStyle.ENDC}"
+                            )
+                            continue
+                        try:
+                            print(engine.explain(" ".join(margs)))
+                        except Exception as e:
+                            print(f"{TextStyle.FAIL}{e}{TextStyle.ENDC}")
+                    elif cmd == "cache":
+                        print(cache.report())
+                    elif cmd == "metrics":
+                        if not metrics.enabled:
+                            print(
+                                f"{TextStyle.WARNING}The metrics are disabled{TextStyle.ENDC}"
+                            )
+                        elif len(margs) == 0 or margs[0] == "prometheus":
+                            print(metrics.registry.to_prometheus(), end="")
+                        elif margs[0] == "json":
+                            print(json.dumps(metrics.registry.to_dict(), indent=2))
+                        elif margs[0] == "reset":
+                            metrics.registry.reset()
+                            print(f"{TextStyle.OKGREEN}Metrics reset{TextStyle.ENDC}")
+                        else:
+                            print(
+                                f"{TextStyle.WARNING}Unknown metrics format: {margs[0]} (prometheus or json){TextStyle.ENDC}"
+                            )
+                    elif cmd == "reload":
+                        # the index files may have been rebuilt since they were loaded
+                        if hasattr(index.entries, "close"):
+                            index.entries.close()
+                        (
+                            index,
+                            stats,
+                            doc_index,
+                            norms,
+                            bitmaps,
+                        ) = load_search_files(args.index)
+                        cache.clear()
+                        ponderations = engine.ponderations()
+                        engine = load_engine(
+                            index,
+                            stats,
+                            norms,
+                            bitmaps,
+                            engine_name,
+                            cache,
+                            args.max_edits,
+                            stop_words=stop_words,
+                        )
+                        if engine.type() == EngineType.VECTORIAL_SEARCH:
+                            engine.set_document_ponderation(ponderations[0])
+                            engine.set_term_ponderation(ponderations[1])
+                            engine.set_query_ponderation(ponderations[2])
+                            engine.set_query_term_ponderation(ponderations[3])
+                        print(
+                            f"{TextStyle.OKGREEN}Index reloaded from {args.index}{TextStyle.ENDC}"
+                        )
                     elif cmd == "save":
                         if len(margs) == 0:
                             print(
@@ -311,7 +912,7 @@ def main() -> None:
                         )
                 else:
                     try:
-                        results = engine.query(user_input)
+                        results = engine.search(user_input, args.top)
                         formatted_results = doc_index.format_results(results)
 
                         print(
@@ -329,25 +930,244 @@ def main() -> None:
                     except Exception as e:
                         print(f"{TextStyle.FAIL}{e}{TextStyle.ENDC}")
 
+    elif args.cmd == "serve":
+        set_lemma_cache(
+            load_lemma_cache(args.index + LEMMAS_FILE_NAME, args.lemma_cache_size)
+        )
+        generation = read_generation(args.index)
+        index, stats, doc_index, norms, bitmaps = load_search_files(args.index)
+        stop_words = load_query_stop_words()
+        cache = QueryCache(args.cache_entries, args.cache_memory * 2 ** 20)
+        if not args.no_metrics:
+            metrics.enable()
+            register_gauges(lambda: index, lambda: stats, cache)
+
+        server = Server(
+            lambda engine_name: load_engine(
+                index,
+                stats,
+                norms,
+                bitmaps,
+                engine_name,
+                cache,
+                args.max_edits,
+                stop_words=stop_words,
+            ),
+            doc_index,
+            cache,
+            args.concurrency,
+            args.max_pending,
+        )
+
+        if generation is not None:
+
+            def on_change(
+                new_index: InvertedIndex, new_stats: Stats, new_doc_index: DocIndex
+            ) -> None:
+                nonlocal index, stats
+                index, stats = new_index, new_stats
+                # the engines of a generation share its norms, computed on their first use
+                new_norms = Norms()
+                server.reload_threadsafe(
+                    lambda engine_name: load_engine(
+                        new_index,
+                        new_stats,
+                        new_norms,
+                        {},
+                        engine_name,
+                        cache,
+                        args.max_edits,
+                        stop_words=stop_words,
+                    ),
+                    new_doc_index,
+                )
+
+            SegmentWatcher(
+                args.index,
+                on_change,
+                generation,
+                args.refresh_interval,
+                args.merge_factor if args.merge_factor > 0 else None,
+            ).start()
+
+        try:
+            asyncio.run(server.serve_forever(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    elif args.cmd == "bench":
+        stop_words = None
+        if not args.no_filter:
+            with open("./stop_words.json", "r") as f:
+                stop_words = json.load(f)
+
+        options = dict(
+            scale=args.scale,
+            shards=args.shards,
+            vocabulary_size=args.vocabulary,
+            mean_length=args.mean_length,
+            exponent=args.zipf_exponent,
+            index_type=args.type,
+            index_format=args.format,
+            codec=args.codec,
+            workers=args.workers,
+            bitmaps_min_df=args.bitmaps_min_df,
+            queries_number=args.queries,
+            k=args.top,
+            stop_words=stop_words,
+            seed=args.seed,
+        )
+        if args.directory is not None:
+            results = run_bench(args.directory, **options)
+        else:
+            with tempfile.TemporaryDirectory() as path:
+                results = run_bench(path, **options)
+
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(
+            f"{TextStyle.OKGREEN}The results were saved in {args.output}{TextStyle.ENDC}"
+        )
+
+        if args.baseline is not None:
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+            print("metric\tbaseline\tcurrent\tratio")
+            for comparison in compare_results(baseline, results):
+                print(
+                    f"{comparison['metric']}\t{comparison['baseline']:.6f}\t{comparison['current']:.6f}\t{comparison['ratio']:.2f}"
+                )
+    elif args.cmd == "benchmark-codecs":
+        index = load_index(find_index_file(args.index))
+
+        print("type\tcodec\tbytes/posting\tpostings/s")
+        for result in benchmark_codecs(index):
+            print(
+                f"{result['type']}\t{result['codec']}\t{result['bytes_per_posting']:.2f}\t{result['postings_per_second']:.0f}"
+            )
     else:
         raise parser.error(f"Invalid command {args.cmd}")
 
 
+def load_query_stop_words(path: str = "./stop_words.json") -> Optional[List[str]]:
+    # the stop words the phrases are filtered with, as the documents were
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def load_search_files(
+    path: str,
+) -> Tuple[InvertedIndex, Stats, DocIndex, Norms, Dict[str, Bitmap]]:
+    if has_segments(path):
+        # the norms of an incremental index are computed on their first use
+        index, stats, doc_index, _ = load_segments(path)
+        return index, stats, doc_index, Norms(), {}
+
+    index = (
+        load_sharded_index(path)
+        if has_shards(path)
+        else load_index(find_index_file(path))
+    )
+    stats = load_stats(find_stats_file(path))
+    doc_index = load_doc_index(find_doc_index_file(path))
+    # the norms are only read by the vectorial engines, for their ponderations
+    norms = load_norms(find_norms_file(path))
+    bitmaps = (
+        load_bitmaps(path + BITMAPS_FILE_NAME)
+        if os.path.exists(path + BITMAPS_FILE_NAME)
+        else {}
+    )
+    if os.path.exists(path + KGRAMS_FILE_NAME):
+        kgrams = load_kgrams(path + KGRAMS_FILE_NAME)
+        # a k-gram index of another vocabulary would give wrong terms
+        if kgrams.terms_number == len(index.entries):
+            index.kgrams = kgrams
+
+    return index, stats, doc_index, norms, bitmaps
+
+
+def register_gauges(
+    index: Callable[[], InvertedIndex], stats: Callable[[], Stats], cache: QueryCache
+) -> None:
+    # the index and stats are given as functions since they change when reloaded
+    metrics.registry.gauge(
+        "beagle_index_terms",
+        "terms of the loaded index",
+        function=lambda: len(index().entries),
+    )
+    metrics.registry.gauge(
+        "beagle_index_documents",
+        "documents of the loaded index",
+        function=lambda: stats().documents_number,
+    )
+    metrics.registry.gauge(
+        "beagle_query_cache_entries",
+        "queries results kept in the cache",
+        function=lambda: len(cache.entries),
+    )
+    metrics.registry.gauge(
+        "beagle_query_cache_bytes",
+        "estimated memory used by the queries results cache",
+        function=lambda: cache.bytes_number,
+    )
+    metrics.registry.gauge(
+        "beagle_lemma_cache_lemmas",
+        "lemmas kept in the cache",
+        function=lambda: len(get_lemma_cache().lemmas),
+    )
+
+
 def load_engine(
-    index: InvertedIndex, stats: Stats, engine_name: EngineType
+    index: InvertedIndex,
+    stats: Stats,
+    norms: Norms,
+    bitmaps: Dict[str, Bitmap],
+    engine_name: EngineType,
+    cache: Optional[QueryCache] = None,
+    max_edits: int = 0,
+    vocabulary: Optional[InvertedIndex] = None,
+    stop_words: Optional[List[str]] = None,
 ) -> SearchEngine:
     engine: SearchEngine
-    if engine_name == EngineType.BINARY_SEARCH:
-        engine = BinarySearchEngine(index)
+    if isinstance(index, ShardedIndex):
+        # an engine per shard, sharing the stats and norms of the whole collection
+        engine = ShardedSearchEngine(
+            [
+                load_engine(
+                    shard,
+                    stats,
+                    norms,
+                    shard_bitmaps,
+                    engine_name,
+                    max_edits=max_edits,
+                    vocabulary=index,
+                    stop_words=stop_words,
+                )
+                for (shard, shard_bitmaps) in zip(index.shards, index.bitmaps)
+            ],
+            index.names,
+        )
+    elif engine_name == EngineType.BINARY_SEARCH:
+        engine = BinarySearchEngine(
+            index,
+            bitmaps,
+            max_edits=max_edits,
+            vocabulary=vocabulary,
+            stop_words=stop_words,
+        )
     elif engine_name == EngineType.VECTORIAL_SEARCH:
         if index.type == InvertedIndexType.DOCUMENTS_INDEX:
             raise Exception(
                 f"You cannot use the vectorial engine with a documemts index. Build and save at least a frequency index."
             )
-        engine = VectorialSearchEngine(index, stats)
+        engine = VectorialSearchEngine(
+            index, stats, norms=norms, max_edits=max_edits, vocabulary=vocabulary
+        )
     else:
         raise Exception(f"unknown engine: {engine_name}")
 
+    engine.cache = cache
     return engine
 
 
@@ -362,6 +1182,10 @@ def help() -> None:
             "set-term-ponderation",
             "set-query-ponderation",
             "set-query-term-ponderation",
+            "explain",
+            "cache",
+            "metrics",
+            "reload",
             "save",
         ]
     )
@@ -382,6 +1206,14 @@ def help() -> None:
     print(
         "\t.set-query-term-ponderation <PONDERATION>\tchange the vectorial query term ponderation scoring (none, idf, or normalized)"
     )
+    print(
+        "\t.explain <QUERY>\tdisplay the evaluation plan of a binary query and its estimated cost"
+    )
+    print("\t.cache\t\t\tdisplay the queries results cache statistics")
+    print(
+        "\t.metrics [FORMAT]\tdisplay the metrics as prometheus (default) or json, or reset them"
+    )
+    print("\t.reload\t\t\treload the index files and empty the results cache")
     print("\t.save <PATH>\t\tsave the previous request results to a file")
 
 
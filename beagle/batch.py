@@ -0,0 +1,131 @@
+from beagle.index import DocIndex
+from beagle.search_engines import SearchEngine
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+import json
+import math
+import multiprocessing
+import time
+
+# what the workers need to answer the queries, set in the parent process right before
+# they are forked so that they share its memory (the index included) copy-on-write
+batch_context: Optional[Tuple[SearchEngine, DocIndex, Optional[int]]] = None
+
+
+def answer_query(query: str) -> Tuple[str, float, bool]:
+    # returns the JSON line of the results of a query, with its latency and whether it
+    # succeeded, formatted in the worker to keep the parent off the critical path
+    engine, doc_index, k = batch_context
+
+    start_time = time.perf_counter()
+    try:
+        results = engine.search(query, k)
+    except Exception as e:
+        elapsed = time.perf_counter() - start_time
+        return json.dumps({"query": query, "error": str(e)}), elapsed, False
+    elapsed = time.perf_counter() - start_time
+
+    documents = []
+    for (id, score) in results.items():
+        document = doc_index.get(id)
+        documents.append(
+            {
+                "id": id,
+                "name": document["name"],
+                "path": document["path"],
+                "score": score,
+            }
+        )
+
+    line = json.dumps(
+        {
+            "query": query,
+            "count": len(documents),
+            "elapsed": elapsed,
+            "results": documents,
+        }
+    )
+    return line, elapsed, True
+
+
+def percentile(values: List[float], p: float) -> float:
+    # nearest-rank percentile of sorted values
+    if len(values) == 0:
+        return 0.0
+    return values[max(0, math.ceil(p * len(values)) - 1)]
+
+
+class BatchSummary:
+    def __init__(self) -> None:
+        self.latencies: List[float] = []
+        self.errors: int = 0
+        self.elapsed: float = 0.0
+
+    def add(self, latency: float, succeeded: bool) -> None:
+        self.latencies.append(latency)
+        if not succeeded:
+            self.errors += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "queries": len(latencies),
+            "errors": self.errors,
+            "seconds": self.elapsed,
+            "queries_per_second": len(latencies) / self.elapsed
+            if self.elapsed > 0
+            else 0.0,
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+        }
+
+    def report(self) -> str:
+        summary = self.to_dict()
+        return f"{summary['queries']} queries ({summary['errors']} errors) in {summary['seconds']:4f}s, {summary['queries_per_second']:.1f} queries/s, latency p50 {1000 * summary['p50']:.2f}ms, p95 {1000 * summary['p95']:.2f}ms, p99 {1000 * summary['p99']:.2f}ms"
+
+
+def run_batch(
+    engine: SearchEngine,
+    doc_index: DocIndex,
+    queries: List[str],
+    output: TextIO,
+    workers: int = 1,
+    k: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+) -> BatchSummary:
+    # answers the queries and writes their results to output as JSON lines, in the
+    # order of the queries, as soon as they are available
+    global batch_context
+    batch_context = (engine, doc_index, k)
+
+    if chunk_size is None:
+        # a few chunks per worker balance the load without too many round trips
+        chunk_size = max(1, min(64, len(queries) // (4 * workers)))
+
+    summary = BatchSummary()
+    start_time = time.perf_counter()
+    try:
+        if workers > 1:
+            if "fork" not in multiprocessing.get_all_start_methods():
+                raise Exception("the batch workers require the fork start method")
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                for (line, latency, succeeded) in pool.imap(
+                    answer_query, queries, chunk_size
+                ):
+                    output.write(line + "\n")
+                    summary.add(latency, succeeded)
+        else:
+            for query in queries:
+                line, latency, succeeded = answer_query(query)
+                output.write(line + "\n")
+                summary.add(latency, succeeded)
+    finally:
+        batch_context = None
+    summary.elapsed = time.perf_counter() - start_time
+
+    return summary
+
+
+def read_queries(path: str) -> List[str]:
+    with open(path, "r") as f:
+        return [line.strip() for line in f if len(line.strip()) > 0]
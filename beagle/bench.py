@@ -0,0 +1,426 @@
+from beagle.logging import register_observer, unregister_observer
+from beagle.collection import Collection
+from beagle.pipeline import default_pipeline
+from beagle.index import (
+    InvertedIndex,
+    InvertedIndexType,
+    IndexFormat,
+    INDEX_FILE_NAMES,
+    DOC_INDEX_FILE_NAME,
+    load_index,
+    load_doc_index,
+)
+from beagle.postings import Codec
+from beagle.lemmatizer import LemmaCache, get_lemma_cache, set_lemma_cache
+from beagle.stats import STATS_FILE_NAME, load_stats
+from beagle.norms import NORMS_FILE_NAME, load_norms
+from beagle.bitmap import BITMAPS_FILE_NAME, build_bitmaps, save_bitmaps, load_bitmaps
+from beagle.binary_search_engine import BinarySearchEngine
+from beagle.vectorial_search_engine import (
+    DEFAULT_PONDERATIONS,
+    VectorialSearchEngine,
+    compute_norms,
+)
+from beagle.search_engines import SearchEngine, DocumentPonderation, TermPonderation
+from beagle.batch import BatchSummary
+from typing import Any, Dict, List, Optional
+import itertools
+import math
+import os
+import platform
+import random
+import time
+
+BENCH_FORMAT_VERSION = 1
+
+# shape of the CS276 collection (see the report): its documents, their average number of
+# tokens and its vocabulary before lemmatization
+CS276_DOCUMENTS = 98998
+CS276_SHARDS = 10
+CS276_MEAN_LENGTH = 258
+CS276_VOCABULARY = 346904
+# the vocabulary of a sample grows as the square root of its size (Heaps' law)
+HEAPS_EXPONENT = 0.5
+
+CONSONANTS = "bcdfghjklmnprstvz"
+VOWELS = "aeiou"
+SYLLABLES = [c + v for c in CONSONANTS for v in VOWELS]
+TOKENS_PER_LINE = 16
+
+
+def synthetic_word(rank: int) -> str:
+    # a pronounceable word of at least two syllables, shorter for the frequent ranks
+    syllables = []
+    while True:
+        rank, r = divmod(rank, len(SYLLABLES))
+        syllables.append(SYLLABLES[r])
+        if rank == 0 and len(syllables) >= 2:
+            return "".join(syllables)
+
+
+def synthetic_vocabulary(size: int, stop_words: List[str]) -> List[str]:
+    # the words sorted by decreasing frequency: the stop words come first, as in English
+    excluded = set(stop_words)
+    words = list(stop_words)
+    rank = 0
+    while len(words) < size + len(stop_words):
+        word = synthetic_word(rank)
+        if word not in excluded:
+            words.append(word)
+        rank += 1
+
+    return words
+
+
+def zipf_weights(size: int, exponent: float) -> List[float]:
+    # cumulated weights of the ranks of a Zipf distribution
+    return list(itertools.accumulate(1 / (r ** exponent) for r in range(1, size + 1)))
+
+
+def generate_corpus(
+    path: str,
+    documents: int,
+    shards: int = CS276_SHARDS,
+    vocabulary_size: int = CS276_VOCABULARY,
+    mean_length: int = CS276_MEAN_LENGTH,
+    exponent: float = 1.0,
+    stop_words: Optional[List[str]] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    # writes a collection shaped as CS276 in path: its shards are the subdirectories 0
+    # to shards - 1, and the tokens of its documents follow a Zipf distribution over the
+    # vocabulary while their lengths follow a log-normal distribution
+    shard_size = math.ceil(documents / shards)
+    rng = random.Random(seed)
+    words = synthetic_vocabulary(vocabulary_size, stop_words or [])
+    weights = zipf_weights(len(words), exponent)
+    # the parameters of the log-normal distribution whose mean is mean_length
+    sigma = 1.0
+    mu = math.log(mean_length) - sigma ** 2 / 2
+
+    tokens_number = 0
+    bytes_number = 0
+    seen = set()
+    for i in range(documents):
+        shard_path = os.path.join(path, str(i // shard_size))
+        if i % shard_size == 0:
+            os.makedirs(shard_path, exist_ok=True)
+
+        length = max(1, round(rng.lognormvariate(mu, sigma)))
+        tokens = rng.choices(words, cum_weights=weights, k=length)
+        seen.update(tokens)
+        content = "\n".join(
+            " ".join(tokens[j : j + TOKENS_PER_LINE])
+            for j in range(0, length, TOKENS_PER_LINE)
+        )
+        with open(os.path.join(shard_path, f"doc{i % shard_size}.txt"), "w") as f:
+            f.write(content + "\n")
+
+        tokens_number += length
+        bytes_number += len(content) + 1
+
+    return {
+        "documents": documents,
+        "shards": math.ceil(documents / shard_size),
+        "tokens": tokens_number,
+        "bytes": bytes_number,
+        "vocabulary": len(seen),
+        "words": words,
+    }
+
+
+def scaled_corpus_size(scale: float) -> Dict[str, int]:
+    return {
+        "documents": max(1, round(CS276_DOCUMENTS * scale)),
+        "vocabulary_size": max(1, round(CS276_VOCABULARY * scale ** HEAPS_EXPONENT)),
+    }
+
+
+class StageTimings:
+    # gathers the durations of the timed functions called while it is registered
+    def __init__(self) -> None:
+        self.durations: Dict[str, List[float]] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        self.durations.setdefault(name, []).append(seconds)
+
+    def __enter__(self) -> "StageTimings":
+        register_observer(self.observe)
+        return self
+
+    def __exit__(self, *args) -> None:
+        unregister_observer(self.observe)
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {
+                "calls": len(durations),
+                "total": sum(durations),
+                "min": min(durations),
+                "max": max(durations),
+            }
+            for (name, durations) in sorted(self.durations.items())
+        }
+
+
+def generate_queries(
+    words: List[str],
+    weights: List[float],
+    index: InvertedIndex,
+    number: int,
+    rng: random.Random,
+) -> Dict[str, List[str]]:
+    # draws the terms of the queries with the frequencies of the corpus, among the ones
+    # of the index so that every ponderation can score them
+    indexed = [
+        (word, weight - previous)
+        for (word, weight, previous) in zip(words, weights, [0.0] + weights)
+        if word in index.entries
+    ]
+    if len(indexed) == 0:
+        raise Exception("none of the words of the corpus is in the index")
+    indexed_words = [word for (word, _) in indexed]
+    indexed_weights = list(itertools.accumulate(weight for (_, weight) in indexed))
+
+    def term() -> str:
+        (word,) = rng.choices(indexed_words, cum_weights=indexed_weights)
+        return word
+
+    binary = []
+    vectorial = []
+    for i in range(number):
+        a, b, c = term(), term(), term()
+        shapes = [a, f"{a} AND {b}", f"{a} OR {b}", f"{a} AND {b} AND {c}"]
+        shapes.append(f"{a} AND NOT {b}")
+        if index.type == InvertedIndexType.POSITIONS_INDEX:
+            shapes.extend([f'"{a} {b}"', f"{a} NEAR/5 {b}"])
+        binary.append(shapes[i % len(shapes)])
+        vectorial.append(" ".join(term() for _ in range(1 + i % 4)))
+
+    return {"binary": binary, "vectorial": vectorial}
+
+
+def time_queries(
+    engine: SearchEngine, queries: List[str], k: Optional[int]
+) -> Dict[str, Any]:
+    summary = BatchSummary()
+    start_time = time.perf_counter()
+    # the generated queries are all valid, so a failure is a bug to report rather than a
+    # latency to time
+    for query in queries:
+        query_start_time = time.perf_counter()
+        engine.query(query, k)
+        summary.add(time.perf_counter() - query_start_time, True)
+    summary.elapsed = time.perf_counter() - start_time
+
+    return summary.to_dict()
+
+
+def run_bench(
+    path: str,
+    scale: float = 0.01,
+    shards: int = CS276_SHARDS,
+    vocabulary_size: Optional[int] = None,
+    mean_length: int = CS276_MEAN_LENGTH,
+    exponent: float = 1.0,
+    index_type: InvertedIndexType = InvertedIndexType.POSITIONS_INDEX,
+    index_format: IndexFormat = IndexFormat.BINARY,
+    codec: Codec = Codec.VBYTE,
+    workers: int = 1,
+    bitmaps_min_df: Optional[int] = None,
+    queries_number: int = 20,
+    k: Optional[int] = None,
+    stop_words: Optional[List[str]] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    # generates a corpus in path/dataset, indexes it in path/index, loads the index back
+    # and times queries with both engines and every ponderation
+    size = scaled_corpus_size(scale)
+    if vocabulary_size is None:
+        vocabulary_size = size["vocabulary_size"]
+    dataset = os.path.join(path, "dataset")
+    output = os.path.join(path, "index") + os.sep
+
+    results: Dict[str, Any] = {
+        "version": BENCH_FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "scale": scale,
+            "documents": size["documents"],
+            "shards": shards,
+            "vocabulary_size": vocabulary_size,
+            "mean_length": mean_length,
+            "exponent": exponent,
+            "index_type": index_type.value,
+            "index_format": index_format.value,
+            "codec": codec.value,
+            "workers": workers,
+            "bitmaps_min_df": bitmaps_min_df,
+            "queries": queries_number,
+            "k": k,
+            "seed": seed,
+        },
+    }
+
+    start_time = time.perf_counter()
+    corpus = generate_corpus(
+        dataset,
+        size["documents"],
+        shards,
+        vocabulary_size,
+        mean_length,
+        exponent,
+        stop_words,
+        seed,
+    )
+    words = corpus.pop("words")
+    results["corpus"] = {**corpus, "seconds": time.perf_counter() - start_time}
+
+    # the synthetic words are their own lemmas: seeding the cache with them keeps WordNet
+    # out of the measures, and lets the bench run where its data is not installed
+    previous_lemma_cache = get_lemma_cache()
+    lemma_cache = LemmaCache()
+    lemma_cache.update({word: word for word in words})
+    set_lemma_cache(lemma_cache)
+    try:
+        with StageTimings() as timings:
+            start_time = time.perf_counter()
+            collection = Collection("synthetic", dataset)
+            collection.scan_shards()
+            collection.scan_documents()
+            pipeline = default_pipeline(stop_words)
+            if workers > 1:
+                index, stats = collection.index_in_parallel(
+                    index_type, workers, pipeline, codec
+                )
+            else:
+                index, stats = collection.index_stream(index_type, pipeline)
+            index.save(output + INDEX_FILE_NAMES[index_format], index_format, codec)
+            stats.save(output + STATS_FILE_NAME)
+            if index_type != InvertedIndexType.DOCUMENTS_INDEX:
+                compute_norms(index, stats, [DEFAULT_PONDERATIONS]).save(
+                    output + NORMS_FILE_NAME
+                )
+            if bitmaps_min_df is not None:
+                save_bitmaps(
+                    build_bitmaps(index, bitmaps_min_df), output + BITMAPS_FILE_NAME
+                )
+            collection.get_doc_index().save(output + DOC_INDEX_FILE_NAME)
+            elapsed = time.perf_counter() - start_time
+        results["index"] = {
+            "terms": len(index.entries),
+            "bytes": os.path.getsize(output + INDEX_FILE_NAMES[index_format]),
+            "seconds": elapsed,
+            "stages": timings.to_dict(),
+        }
+
+        with StageTimings() as timings:
+            start_time = time.perf_counter()
+            index = load_index(output + INDEX_FILE_NAMES[index_format])
+            stats = load_stats(output + STATS_FILE_NAME)
+            load_doc_index(output + DOC_INDEX_FILE_NAME)
+            norms = (
+                load_norms(output + NORMS_FILE_NAME)
+                if index_type != InvertedIndexType.DOCUMENTS_INDEX
+                else None
+            )
+            bitmaps = (
+                load_bitmaps(output + BITMAPS_FILE_NAME)
+                if bitmaps_min_df is not None
+                else {}
+            )
+            elapsed = time.perf_counter() - start_time
+        results["load"] = {"seconds": elapsed, "stages": timings.to_dict()}
+
+        rng = random.Random(seed)
+        queries = generate_queries(
+            words[len(stop_words or []) :],
+            zipf_weights(len(words) - len(stop_words or []), exponent),
+            index,
+            queries_number,
+            rng,
+        )
+
+        runs: List[Dict[str, Any]] = []
+        with StageTimings() as timings:
+            runs.append(
+                {
+                    "engine": "binary",
+                    "ponderations": None,
+                    **time_queries(
+                        BinarySearchEngine(index, bitmaps), queries["binary"], k
+                    ),
+                }
+            )
+
+            if index_type != InvertedIndexType.DOCUMENTS_INDEX:
+                engine = VectorialSearchEngine(index, stats, norms=norms)
+                pairs = list(itertools.product(DocumentPonderation, TermPonderation))
+                for ((dp, tp), (qp, qtp)) in itertools.product(pairs, pairs):
+                    engine.set_document_ponderation(dp)
+                    engine.set_term_ponderation(tp)
+                    engine.set_query_ponderation(qp)
+                    engine.set_query_term_ponderation(qtp)
+                    runs.append(
+                        {
+                            "engine": "vectorial",
+                            "ponderations": {
+                                "document": dp.value,
+                                "term": tp.value,
+                                "query": qp.value,
+                                "query_term": qtp.value,
+                            },
+                            **time_queries(engine, queries["vectorial"], k),
+                        }
+                    )
+        results["queries"] = {"runs": runs, "stages": timings.to_dict()}
+    finally:
+        set_lemma_cache(previous_lemma_cache)
+
+    return results
+
+
+def run_key(run: Dict[str, Any]) -> str:
+    if run["ponderations"] is None:
+        return run["engine"]
+    return f"{run['engine']}[{','.join(run['ponderations'].values())}]"
+
+
+def flatten_results(results: Dict[str, Any]) -> Dict[str, float]:
+    # the durations of a bench results, by metric name
+    metrics: Dict[str, float] = {}
+    for phase in ["index", "load"]:
+        metrics[f"{phase}.seconds"] = results[phase]["seconds"]
+        for (name, stage) in results[phase]["stages"].items():
+            metrics[f"{phase}.{name}"] = stage["total"]
+    for run in results["queries"]["runs"]:
+        for percentile in ["p50", "p95", "p99"]:
+            metrics[f"queries.{run_key(run)}.{percentile}"] = run[percentile]
+
+    return metrics
+
+
+def compare_results(
+    baseline: Dict[str, Any], results: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    # the ratio of every duration to the one of the baseline (above 1 for a slowdown)
+    baseline_metrics = flatten_results(baseline)
+    metrics = flatten_results(results)
+
+    return [
+        {
+            "metric": name,
+            "baseline": baseline_metrics[name],
+            "current": value,
+            "ratio": value / baseline_metrics[name]
+            if baseline_metrics[name] > 0
+            else math.inf,
+        }
+        for (name, value) in metrics.items()
+        if name in baseline_metrics
+    ]
@@ -1,4 +1,5 @@
 from beagle.logging import timer
+from beagle import metrics
 from beagle.index import InvertedIndex
 from beagle.search_engines import (
     SearchEngine,
@@ -6,50 +7,196 @@ from beagle.search_engines import (
     DocumentPonderation,
     TermPonderation,
 )
-from nltk.stem import WordNetLemmatizer
-from typing import List, Dict
+from beagle.lemmatizer import lemmatize
+from beagle.bitmap import Bitmap
+from beagle.wildcard import is_wildcard
+from beagle.fuzzy import FUZZY_BUDGET
+from beagle.query_planner import (
+    Plan,
+    TermPlan,
+    OrPlan,
+    ProximityPlan,
+    plan_query,
+    canonical_query,
+)
+from typing import Iterable, List, Dict, Optional, Tuple
+import re
 import tt
 
+PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+PROXIMITY_PATTERN = re.compile(r"([^\s()]+)\s+NEAR/(\d+)\s+([^\s()]+)")
+PROXIMITY_OPERATOR = re.compile(r"NEAR/\d+")
+
 
 class BinarySearchEngine(SearchEngine):
-    def __init__(self, index: InvertedIndex) -> None:
+    def __init__(
+        self,
+        index: InvertedIndex,
+        bitmaps: Optional[Dict[str, Bitmap]] = None,
+        max_edits: int = 0,
+        fuzzy_budget: int = FUZZY_BUDGET,
+        vocabulary: Optional[InvertedIndex] = None,
+        stop_words: Optional[Iterable[str]] = None,
+    ) -> None:
         self.index: InvertedIndex = index
+        # the index the wildcards and misspelled terms are expanded with: the engine's
+        # own one, or the whole collection's for the engine of a single shard
+        self.vocabulary: InvertedIndex = vocabulary if vocabulary is not None else index
+        # bitmaps of the most common terms, precomputed at indexing time
+        self.bitmaps: Dict[str, Bitmap] = bitmaps if bitmaps is not None else {}
+        # a term missing from the index matches the terms at most max_edits away from
+        # it, and fuzzy_budget bounds the number of such terms in a query
+        self.max_edits: int = max_edits
+        self.fuzzy_budget: int = fuzzy_budget
+        # the stop words the documents were filtered with, if any
+        self.stop_words: frozenset = frozenset(
+            stop_words if stop_words is not None else []
+        )
+
+    # returns the expression tree of a query, along with the plans of its phrases and
+    # proximity clauses, that are replaced by placeholder symbols in the tree
+    def process_query(
+        self, query: str
+    ) -> Tuple[tt.ExpressionTreeNode, Dict[str, Plan]]:
+        clauses: Dict[str, Plan] = {}
+
+        def replace_phrase(match: re.Match) -> str:
+            tokens = [token.lower() for token in match.group(1).split()]
+            if len(tokens) == 0:
+                raise Exception("empty phrase")
+            # the stop words go through the same filter as at indexing time, which does
+            # not count them in the positions, so the terms around them stay adjacent
+            terms = [
+                lemmatize(token) for token in tokens if not self.is_filtered(token)
+            ]
+            if len(terms) == 0:
+                raise Exception(f"the phrase {match.group(0)} only has stop words")
+            symbol = f"PHRASE{len(clauses)}"
+            clauses[symbol] = self.proximity_plan(terms, None)
+            return f" {symbol} "
+
+        def replace_proximity(match: re.Match) -> str:
+            if match.group(1) in clauses or match.group(3) in clauses:
+                raise Exception("NEAR only accepts terms as operands")
+            tokens = [match.group(i).lower() for i in [1, 3]]
+            for token in tokens:
+                if self.is_filtered(token):
+                    raise Exception(
+                        f"{token} is a stop word, that NEAR cannot look for"
+                    )
+            terms = [lemmatize(token) for token in tokens]
+            symbol = f"NEAR{len(clauses)}"
+            clauses[symbol] = self.proximity_plan(terms, int(match.group(2)))
+            return f" {symbol} "
 
-    def process_query(self, query: str) -> tt.ExpressionTreeNode:
-        lemmatizer = WordNetLemmatizer()
-        q = query.split()
+        query = PHRASE_PATTERN.sub(replace_phrase, query)
+        query = PROXIMITY_PATTERN.sub(replace_proximity, query)
 
         a = []
-        for token in q:
-            if token not in ["OR", "AND", "NAND"]:
-                a.append(lemmatizer.lemmatize(token.lower()))
-            else:
+        budget = self.fuzzy_budget
+        for token in query.split():
+            if token in ["OR", "AND", "NAND", "NOT"] or token in clauses:
                 a.append(token)
+            elif PROXIMITY_OPERATOR.fullmatch(token):
+                # what is left of a chain such as `a NEAR/2 b NEAR/3 c`, whose distances
+                # would be ambiguous, or of a NEAR missing an operand
+                raise Exception(
+                    f"{token} requires a term on each side and cannot be chained"
+                )
+            elif is_wildcard(token):
+                # the matching terms are or-ed, and are not lemmatized since they come
+                # from the vocabulary
+                symbol = f"WILDCARD{len(clauses)}"
+                clauses[symbol] = self.terms_plan(
+                    token.lower(), self.vocabulary.expand(token.lower())
+                )
+                a.append(symbol)
+            else:
+                term = lemmatize(token.lower())
+                if self.max_edits > 0 and term not in self.vocabulary.entries:
+                    similar = self.vocabulary.similar(term, self.max_edits, budget)
+                    budget -= len(similar)
+                    symbol = f"FUZZY{len(clauses)}"
+                    clauses[symbol] = self.terms_plan(term, similar)
+                    a.append(symbol)
+                else:
+                    a.append(term)
 
-        return tt.BooleanExpression(" ".join(a)).tree
-
-    def compute_query(self, node: tt.ExpressionTreeNode) -> List[int]:
-        if node._symbol_name == "AND":
-            return intersect(
-                self.compute_query(node._l_child), self.compute_query(node._r_child)
-            )
-        elif node._symbol_name == "OR":
-            return merge(
-                self.compute_query(node._l_child), self.compute_query(node._r_child)
-            )
-        elif node._symbol_name == "NAND":
-            return exclude(
-                self.compute_query(node._l_child), self.compute_query(node._r_child)
-            )
-        else:
-            try:
-                return [a[0] for a in self.index.entries[node._symbol_name][1]]
-            except Exception:
-                return []
+        return tt.BooleanExpression(" ".join(a)).tree, clauses
+
+    def is_filtered(self, token: str) -> bool:
+        # a stop word is still looked for in an index built without filter
+        return (
+            token in self.stop_words and lemmatize(token) not in self.vocabulary.entries
+        )
+
+    def proximity_plan(self, terms: List[str], distance: Optional[int]) -> Plan:
+        if distance is None and len(terms) == 1:
+            return TermPlan(terms[0], self.df(terms[0]))
+        return ProximityPlan(
+            terms, [self.df(term) for term in terms], distance, self.index.positions
+        )
+
+    def terms_plan(self, token: str, terms: List[str]) -> Plan:
+        # the terms a wildcard or a misspelled term was replaced by
+        if len(terms) == 0:
+            # matches nothing, and keeps the token in the canonical query
+            return TermPlan(token, 0)
+        return OrPlan([TermPlan(term, self.df(term)) for term in terms])
+
+    def term_bitmap(self, term: str) -> Bitmap:
+        if term in self.bitmaps:
+            return self.bitmaps[term]
+        elif term not in self.index.entries:
+            return Bitmap()
+
+        ids = self.index.doc_ids(term)
+        if metrics.enabled:
+            metrics.postings_scanned.inc(len(ids))
+        return Bitmap.from_ids(ids)
+
+    def df(self, term: str) -> int:
+        return self.index.entries[term][0] if term in self.index.entries else 0
+
+    def plan(
+        self, node: tt.ExpressionTreeNode, clauses: Optional[Dict[str, Plan]] = None
+    ) -> Plan:
+        return plan_query(node, self.df, clauses)
+
+    def compute_query(
+        self, node: tt.ExpressionTreeNode, clauses: Optional[Dict[str, Plan]] = None
+    ) -> Bitmap:
+        return self.plan(node, clauses).evaluate(self.term_bitmap)
+
+    # describes how a query would be evaluated, without evaluating it
+    def explain(self, query: str) -> str:
+        return "\n".join(self.plan(*self.process_query(query)).explain())
+
+    def query(self, query: str, k: Optional[int] = None) -> Dict[int, float]:
+        return self.evaluate(self.process_query(query), k)
 
     @timer
-    def query(self, query: str) -> Dict[int, float]:
-        return {id: 1.0 for id in self.compute_query(self.process_query(query))}
+    def evaluate(
+        self,
+        processed: Tuple[tt.ExpressionTreeNode, Dict[str, Plan]],
+        k: Optional[int] = None,
+    ) -> Dict[int, float]:
+        ids = self.compute_query(*processed).to_list()
+        if metrics.enabled:
+            metrics.documents_scored.inc(len(ids))
+        return {id: 1.0 for id in (ids if k is None else ids[:k])}
+
+    def normalize_query(self, query: str) -> str:
+        return self.normalize_processed_query(self.process_query(query))
+
+    def normalize_processed_query(
+        self, processed: Tuple[tt.ExpressionTreeNode, Dict[str, Plan]]
+    ) -> str:
+        return canonical_query(*processed)
+
+    def ponderations(self) -> Tuple[None, None, None, None]:
+        # the results of a boolean query are not scored
+        return (None, None, None, None)
 
     def __str__(self) -> str:
         return EngineType.BINARY_SEARCH.value
@@ -72,17 +219,22 @@ class BinarySearchEngine(SearchEngine):
 
 def merge(a: List[int], b: List[int]) -> List[int]:
     result = []
+    i, j = 0, 0
 
-    for i in range(min(len(a), len(b))):
-        result.append(a[i])
-        if b[i] != a[i]:
-            result.append(b[i])
-
-    if len(a) > len(b):
-        result.extend(a)
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]:
+            result.append(a[i])
+            i += 1
+            j += 1
+        elif a[i] < b[j]:
+            result.append(a[i])
+            i += 1
+        else:
+            result.append(b[j])
+            j += 1
 
-    if len(b) > len(a):
-        result.extend(b)
+    result.extend(a[i:])
+    result.extend(b[j:])
 
     return result
 
@@ -105,4 +257,5 @@ def intersect(a: List[int], b: List[int]) -> List[int]:
 
 
 def exclude(a: List[int], b: List[int]) -> List[int]:
-    return [i for i in a if i not in b]
+    excluded = set(b)
+    return [i for i in a if i not in excluded]
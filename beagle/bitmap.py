@@ -0,0 +1,293 @@
+from typing import Dict, List, Iterable, Iterator, Optional, Tuple, Union
+from array import array
+from beagle.logging import timer
+from beagle.index import InvertedIndex
+import bisect
+import struct
+import sys
+
+BITMAPS_FILE_NAME = "bitmaps.bin"
+
+# a container holds the low 16 bits of the ids sharing the same high 16 bits, as a
+# sorted array while it is sparse and as a bitset above ARRAY_MAX_SIZE values
+CONTAINER_SIZE = 1 << 16
+ARRAY_MAX_SIZE = 4096
+BITSET_BYTES = CONTAINER_SIZE // 8
+
+# offsets of the set bits of every byte value
+BYTE_BITS = [[i for i in range(8) if b >> i & 1] for b in range(256)]
+
+ARRAY_CONTAINER_CODE = 0
+BITSET_CONTAINER_CODE = 1
+CONTAINER_HEADER = struct.Struct("<HBI")
+BITMAP_HEADER = struct.Struct("<I")
+BITMAPS_MAGIC = b"BGLB"
+BITMAPS_VERSION = 1
+BITMAPS_HEADER = struct.Struct("<4sHI")  # magic, version, terms
+
+
+class ArrayContainer:
+    def __init__(self, values: List[int]) -> None:
+        self.values: List[int] = values
+
+    def to_bitset(self) -> "BitsetContainer":
+        buffer = bytearray(BITSET_BYTES)
+        for v in self.values:
+            buffer[v >> 3] |= 1 << (v & 7)
+        return BitsetContainer(int.from_bytes(buffer, "little"), len(self.values))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.values)
+
+    def __contains__(self, v: int) -> bool:
+        i = bisect.bisect_left(self.values, v)
+        return i < len(self.values) and self.values[i] == v
+
+
+class BitsetContainer:
+    def __init__(self, bits: int, cardinality: Optional[int] = None) -> None:
+        self.bits: int = bits
+        self.cardinality: int = (
+            bin(bits).count("1") if cardinality is None else cardinality
+        )
+
+    def to_bytes(self) -> bytes:
+        return self.bits.to_bytes(BITSET_BYTES, "little")
+
+    def to_array(self) -> ArrayContainer:
+        return ArrayContainer(list(self))
+
+    def __len__(self) -> int:
+        return self.cardinality
+
+    def __iter__(self) -> Iterator[int]:
+        for (i, b) in enumerate(self.to_bytes()):
+            if b:
+                for j in BYTE_BITS[b]:
+                    yield i * 8 + j
+
+    def __contains__(self, v: int) -> bool:
+        return bool(self.bits >> v & 1)
+
+
+Container = Union[ArrayContainer, BitsetContainer]
+
+
+def normalize(container: Container) -> Optional[Container]:
+    # keeps every container in its most compact form, and drops the empty ones
+    if len(container) == 0:
+        return None
+    elif isinstance(container, ArrayContainer) and len(container) > ARRAY_MAX_SIZE:
+        return container.to_bitset()
+    elif isinstance(container, BitsetContainer) and len(container) <= ARRAY_MAX_SIZE:
+        return container.to_array()
+    return container
+
+
+def filter_array(a: ArrayContainer, b: BitsetContainer, keep: bool) -> ArrayContainer:
+    # values of a that are (or are not) set in b
+    data = b.to_bytes()
+    return ArrayContainer(
+        [v for v in a.values if bool(data[v >> 3] >> (v & 7) & 1) == keep]
+    )
+
+
+def container_and(a: Container, b: Container) -> Optional[Container]:
+    if isinstance(a, ArrayContainer) and isinstance(b, ArrayContainer):
+        return normalize(ArrayContainer(sorted(set(a.values).intersection(b.values))))
+    elif isinstance(a, ArrayContainer):
+        return normalize(filter_array(a, b, True))
+    elif isinstance(b, ArrayContainer):
+        return normalize(filter_array(b, a, True))
+    return normalize(BitsetContainer(a.bits & b.bits))
+
+
+def container_or(a: Container, b: Container) -> Optional[Container]:
+    if isinstance(a, ArrayContainer) and isinstance(b, ArrayContainer):
+        return normalize(ArrayContainer(sorted(set(a.values).union(b.values))))
+    a_bits = a.to_bitset() if isinstance(a, ArrayContainer) else a
+    b_bits = b.to_bitset() if isinstance(b, ArrayContainer) else b
+    return normalize(BitsetContainer(a_bits.bits | b_bits.bits))
+
+
+def container_and_not(a: Container, b: Container) -> Optional[Container]:
+    if isinstance(a, ArrayContainer) and isinstance(b, ArrayContainer):
+        excluded = set(b.values)
+        return normalize(ArrayContainer([v for v in a.values if v not in excluded]))
+    elif isinstance(a, ArrayContainer):
+        return normalize(filter_array(a, b, False))
+    b_bits = b.to_bitset() if isinstance(b, ArrayContainer) else b
+    return normalize(BitsetContainer(a.bits & ~b_bits.bits))
+
+
+# roaring-style compressed set of doc ids: the operations work container by container,
+# so their cost depends on the compressed size of the operands and not on their range
+class Bitmap:
+    def __init__(self, containers: Optional[Dict[int, Container]] = None) -> None:
+        self.containers: Dict[int, Container] = (
+            containers if containers is not None else {}
+        )
+
+    @staticmethod
+    def from_ids(ids: Iterable[int]) -> "Bitmap":
+        values: Dict[int, List[int]] = {}
+        for id in ids:
+            values.setdefault(id >> 16, []).append(id & 0xFFFF)
+
+        containers: Dict[int, Container] = {}
+        for (key, low) in values.items():
+            container = normalize(ArrayContainer(sorted(set(low))))
+            if container is not None:
+                containers[key] = container
+
+        return Bitmap(containers)
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        containers: Dict[int, Container] = {}
+        (small, large) = (
+            (self, other)
+            if len(self.containers) <= len(other.containers)
+            else (other, self)
+        )
+        for (key, container) in small.containers.items():
+            if key in large.containers:
+                result = container_and(container, large.containers[key])
+                if result is not None:
+                    containers[key] = result
+
+        return Bitmap(containers)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        containers = dict(self.containers)
+        for (key, container) in other.containers.items():
+            if key in containers:
+                containers[key] = container_or(containers[key], container)
+            else:
+                containers[key] = container
+
+        return Bitmap(containers)
+
+    # the ids of this bitmap that are not in the other one
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        containers: Dict[int, Container] = {}
+        for (key, container) in self.containers.items():
+            if key in other.containers:
+                result = container_and_not(container, other.containers[key])
+                if result is not None:
+                    containers[key] = result
+            else:
+                containers[key] = container
+
+        return Bitmap(containers)
+
+    def __len__(self) -> int:
+        return sum(len(container) for container in self.containers.values())
+
+    def __bool__(self) -> bool:
+        # the empty containers are always dropped
+        return len(self.containers) > 0
+
+    def __iter__(self) -> Iterator[int]:
+        for key in sorted(self.containers):
+            high = key << 16
+            for low in self.containers[key]:
+                yield high | low
+
+    def __contains__(self, id: object) -> bool:
+        if not isinstance(id, int):
+            return False
+        container = self.containers.get(id >> 16)
+        return container is not None and (id & 0xFFFF) in container
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Bitmap) and list(self) == list(other)
+
+    def to_list(self) -> List[int]:
+        return list(self)
+
+    def to_bytes(self) -> bytes:
+        out = bytearray(BITMAP_HEADER.pack(len(self.containers)))
+        for key in sorted(self.containers):
+            container = self.containers[key]
+            if isinstance(container, ArrayContainer):
+                values = array("H", container.values)
+                if sys.byteorder == "big":
+                    values.byteswap()
+                out += CONTAINER_HEADER.pack(key, ARRAY_CONTAINER_CODE, len(values))
+                out += values.tobytes()
+            else:
+                out += CONTAINER_HEADER.pack(
+                    key, BITSET_CONTAINER_CODE, container.cardinality
+                )
+                out += container.to_bytes()
+
+        return bytes(out)
+
+    @staticmethod
+    def from_bytes(data: bytes, pos: int = 0) -> Tuple["Bitmap", int]:
+        (containers_number,) = BITMAP_HEADER.unpack_from(data, pos)
+        pos += BITMAP_HEADER.size
+
+        containers: Dict[int, Container] = {}
+        for _ in range(containers_number):
+            key, code, cardinality = CONTAINER_HEADER.unpack_from(data, pos)
+            pos += CONTAINER_HEADER.size
+            if code == ARRAY_CONTAINER_CODE:
+                values = array("H")
+                values.frombytes(data[pos : pos + 2 * cardinality])
+                if sys.byteorder == "big":
+                    values.byteswap()
+                containers[key] = ArrayContainer(values.tolist())
+                pos += 2 * cardinality
+            else:
+                bits = int.from_bytes(data[pos : pos + BITSET_BYTES], "little")
+                containers[key] = BitsetContainer(bits, cardinality)
+                pos += BITSET_BYTES
+
+        return Bitmap(containers), pos
+
+
+@timer
+def build_bitmaps(index: InvertedIndex, min_df: int) -> Dict[str, Bitmap]:
+    # the bitmaps of the terms that appear in at least min_df documents
+    return {
+        term: Bitmap.from_ids(index.doc_ids(term))
+        for term in index.entries
+        if index.entries[term][0] >= min_df
+    }
+
+
+@timer
+def save_bitmaps(bitmaps: Dict[str, Bitmap], path: str) -> None:
+    with open(path, "wb") as f:
+        f.write(BITMAPS_HEADER.pack(BITMAPS_MAGIC, BITMAPS_VERSION, len(bitmaps)))
+        for (term, bitmap) in bitmaps.items():
+            raw_term = term.encode("utf-8")
+            f.write(BITMAP_HEADER.pack(len(raw_term)))
+            f.write(raw_term)
+            f.write(bitmap.to_bytes())
+
+
+@timer
+def load_bitmaps(path: str) -> Dict[str, Bitmap]:
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if len(data) < BITMAPS_HEADER.size:
+        raise Exception(f"{path} is not a supported bitmaps file")
+    magic, version, terms_number = BITMAPS_HEADER.unpack_from(data, 0)
+    if magic != BITMAPS_MAGIC or version != BITMAPS_VERSION:
+        raise Exception(f"{path} is not a supported bitmaps file")
+
+    bitmaps: Dict[str, Bitmap] = {}
+    pos = BITMAPS_HEADER.size
+    for _ in range(terms_number):
+        (length,) = BITMAP_HEADER.unpack_from(data, pos)
+        pos += BITMAP_HEADER.size
+        term = data[pos : pos + length].decode("utf-8")
+        bitmaps[term], pos = Bitmap.from_bytes(data, pos + length)
+
+    return bitmaps
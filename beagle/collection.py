@@ -2,12 +2,23 @@ import os
 import json
 import typing
 import json
-from beagle.index import InvertedIndex, InvertedIndexType, DocIndex
+import logging
+import multiprocessing
+import tempfile
+from beagle.index import (
+    InvertedIndex,
+    InvertedIndexType,
+    DocIndex,
+    CompressedEntries,
+    SpimiIndexBuilder,
+)
+from beagle.postings import Codec
 from beagle.stats import Stats
-from typing import List, Set, Dict, Any
+from typing import List, Set, Dict, Any, Optional, Tuple
 from collections import Counter
 from beagle.logging import timer
-from nltk.stem import WordNetLemmatizer
+from beagle.lemmatizer import lemmatize, get_lemma_cache
+from beagle.pipeline import Pipeline
 
 
 class Document:
@@ -35,13 +46,26 @@ class Document:
 
     def lemmatize(self) -> None:
         lems: List[str] = []
-        lemmatizer = WordNetLemmatizer()
 
         for t in self.tokens:
-            lems.append(lemmatizer.lemmatize(t))
+            lems.append(lemmatize(t))
 
         self.tokens = lems
 
+    def stream(self, pipeline: Pipeline) -> Dict[str, List[Any]]:
+        # computes the term positions straight from the pipeline, without keeping tokens
+        positions: Dict[str, List[Any]] = {}
+
+        for (i, t) in enumerate(pipeline.tokens(self.path)):
+            entry = positions.get(t)
+            if entry is None:
+                positions[t] = [1, [i]]
+            else:
+                entry[0] += 1
+                entry[1].append(i)
+
+        return positions
+
     def get_vocabulary(self) -> Set[str]:
         return set(self.tokens)
 
@@ -79,6 +103,18 @@ class Document:
         }
 
 
+def positions_stats(positions: Dict[str, List[Any]]) -> Dict[str, int]:
+    # same as Document.stats, from the term positions of a document
+    f = [p[0] for p in positions.values()]
+
+    return {
+        "max_frequency": max(f, default=0),
+        "sum_frequency": sum(f),
+        "unique_terms_number": sum(1 for a in f if a == 1),
+        "tokens_number": sum(f),
+    }
+
+
 class Shard:
     def __init__(self, name: str, path: str) -> None:
         self.name: str = name
@@ -88,12 +124,12 @@ class Shard:
     def __str__(self) -> str:
         return f"shard {self.name} ({self.path}): {len(self.documents)} documents"
 
-    def scan_documents(self) -> None:
-        id = 10 ** 4 * int(self.name)
-        for f in os.scandir(self.path):
-            if f.is_file():
-                self.documents.append(Document(f.name, f.path, id))
-                id += 1
+    def scan_documents(self, first_id: int = 0) -> None:
+        # the documents get consecutive ids in the order of their names, so that the
+        # documents of a directory are neighbours in the postings lists
+        files = sorted((f.name, f.path) for f in os.scandir(self.path) if f.is_file())
+        for (i, (name, path)) in enumerate(files):
+            self.documents.append(Document(name, path, first_id + i))
 
     def load(self) -> None:
         for d in self.documents:
@@ -151,13 +187,27 @@ class Shard:
 
         return index
 
+    def index_stream(
+        self, index_type: InvertedIndexType, pipeline: Pipeline
+    ) -> Tuple[InvertedIndex, Stats]:
+        index = InvertedIndex(index_type)
+        stats = Stats()
+
+        stats.documents_number = len(self.documents)
+        for d in self.documents:
+            positions = d.stream(pipeline)
+            index.add_document(d.id, positions)
+            stats.add(d.id, positions_stats(positions))
+
+        return index, stats
+
     def compute_stats(self) -> Stats:
         stats = Stats()
 
         stats.documents_number = len(self.documents)
 
         for d in self.documents:
-            stats.documents[d.id] = d.stats()
+            stats.add(d.id, d.stats())
 
         return stats
 
@@ -169,6 +219,31 @@ class Shard:
         return c
 
 
+def index_shard(
+    shard: Shard,
+    index_type: InvertedIndexType,
+    pipeline: Pipeline,
+    codec: Codec,
+) -> Tuple[CompressedEntries, Stats, Dict[str, str], Pipeline]:
+    # runs the whole indexing pipeline of a shard, in a worker process. The postings are
+    # sent back encoded since pickling bytes is far cheaper than pickling nested lists,
+    # along with the lemmas the shard added to the cache so that the parent's cache
+    # learns them too, without the ones it already had.
+    cache = get_lemma_cache()
+    cache.learned = {}
+    index, stats = shard.index_stream(index_type, pipeline)
+    index.compress(codec)
+    lemmas, cache.learned = cache.learned, None
+
+    return index.entries, stats, lemmas, pipeline
+
+
+def index_shard_star(
+    args: Tuple[Any, ...]
+) -> Tuple[CompressedEntries, Stats, Dict[str, str], Pipeline]:
+    return index_shard(*args)
+
+
 class Collection:
     def __init__(self, name: str, path: str) -> None:
         self.name: str = name
@@ -185,10 +260,16 @@ class Collection:
             if d.is_dir():
                 self.shards.append(Shard(d.name, d.path))
 
+        # shards are indexed in the order of their ids so that postings lists are sorted
+        self.shards.sort(key=lambda s: int(s.name))
+
     @timer
     def scan_documents(self) -> None:
+        # doc ids are dense: the ids of a shard follow the ones of the previous shard
+        id = 0
         for s in self.shards:
-            s.scan_documents()
+            s.scan_documents(id)
+            id += len(s.documents)
 
     @timer
     def load_documents(self) -> None:
@@ -230,6 +311,116 @@ class Collection:
 
         return index
 
+    @timer
+    def index_stream(
+        self, index_type: InvertedIndexType, pipeline: Pipeline
+    ) -> Tuple[InvertedIndex, Stats]:
+        # fuses the loading, filtering, lemmatization, indexing and stats computation
+        index = InvertedIndex(index_type)
+        stats = Stats()
+
+        for s in self.shards:
+            shard_index, shard_stats = s.index_stream(index_type, pipeline)
+            index.update(shard_index)
+            stats.update(shard_stats)
+
+        log_pipeline(pipeline)
+        return index, stats
+
+    @timer
+    def index_in_parallel(
+        self,
+        index_type: InvertedIndexType,
+        workers: int,
+        pipeline: Pipeline,
+        codec: Codec = Codec.VBYTE,
+    ) -> Tuple[InvertedIndex, Stats]:
+        # streams every shard through the pipeline in its own process. The shards are
+        # sorted by id so their encoded postings only have to be concatenated.
+        index = InvertedIndex(index_type)
+        index.entries = CompressedEntries(index_type, codec)
+        stats = Stats()
+
+        tasks = [(s, index_type, pipeline, codec) for s in self.shards]
+        with multiprocessing.Pool(min(workers, max(len(tasks), 1))) as pool:
+            for (entries, shard_stats, lemmas, shard_pipeline) in pool.imap(
+                index_shard_star, tasks
+            ):
+                index.entries.extend(entries)
+                stats.update(shard_stats)
+                get_lemma_cache().update(lemmas)
+                pipeline.merge(shard_pipeline)
+
+        log_pipeline(pipeline)
+        return index, stats
+
+    @timer
+    def index_shards(
+        self,
+        index_type: InvertedIndexType,
+        pipeline: Pipeline,
+        workers: int = 1,
+        codec: Codec = Codec.VBYTE,
+    ) -> Tuple[List[InvertedIndex], Stats]:
+        # same as index_in_parallel, but the index of every shard is kept on its own
+        # instead of being merged into the index of the whole collection
+        indexes: List[InvertedIndex] = []
+        stats = Stats()
+
+        if workers <= 1:
+            for s in self.shards:
+                shard_index, shard_stats = s.index_stream(index_type, pipeline)
+                indexes.append(shard_index)
+                stats.update(shard_stats)
+        else:
+            tasks = [(s, index_type, pipeline, codec) for s in self.shards]
+            with multiprocessing.Pool(min(workers, max(len(tasks), 1))) as pool:
+                for (entries, shard_stats, lemmas, shard_pipeline) in pool.imap(
+                    index_shard_star, tasks
+                ):
+                    shard_index = InvertedIndex(index_type)
+                    shard_index.entries = entries
+                    indexes.append(shard_index)
+                    stats.update(shard_stats)
+                    get_lemma_cache().update(lemmas)
+                    pipeline.merge(shard_pipeline)
+
+        log_pipeline(pipeline)
+        return indexes, stats
+
+    @timer
+    def index_spimi(
+        self,
+        index_type: InvertedIndexType,
+        path: str,
+        memory_budget: int,
+        pipeline: Pipeline,
+        codec: Codec = Codec.VBYTE,
+    ) -> Stats:
+        # streams the documents one by one into a binary index saved at path, without
+        # ever keeping more than one document's postings outside of the builder
+        dirpath = os.path.dirname(path)
+        if not os.path.exists(dirpath):
+            os.makedirs(dirpath)
+
+        stats = Stats()
+
+        with tempfile.TemporaryDirectory(dir=dirpath) as runs_dirpath:
+            builder = SpimiIndexBuilder(index_type, memory_budget, runs_dirpath, codec)
+
+            for s in self.shards:
+                for d in s.documents:
+                    positions = d.stream(pipeline)
+                    builder.add(d.id, positions)
+                    stats.add(d.id, positions_stats(positions))
+
+                stats.documents_number += len(s.documents)
+
+            builder.merge(path)
+
+        log_pipeline(pipeline)
+        return stats
+
     def term_frequencies(self) -> typing.Counter[str]:
         c = Counter()
         for s in self.shards:
@@ -255,10 +446,15 @@ class Collection:
         return stats
 
     @timer
-    def get_doc_index(self) -> Dict[int, Document]:
+    def get_doc_index(self) -> DocIndex:
         index = DocIndex()
         for s in self.shards:
             for d in s.documents:
-                index.entries[d.id] = {"name": d.name, "path": d.path}
+                index.add(d.id, d.name, d.path)
 
         return index
+
+
+def log_pipeline(pipeline: Pipeline) -> None:
+    for line in pipeline.report():
+        logging.info(line)
@@ -0,0 +1,61 @@
+from typing import Any, List, Optional
+from beagle.wildcard import KGramIndex, term_kgrams
+import heapq
+import numpy as np
+
+# the number of terms the misspelled terms of a query can be replaced by, all together
+FUZZY_BUDGET = 10
+
+
+def edit_distance(a: str, b: str, max_edits: int) -> Optional[int]:
+    # Levenshtein distance between a and b, or None when it is above max_edits: only the
+    # cells of the dynamic programming table at most max_edits away from its diagonal
+    # are computed, and a row whose cells are all above max_edits ends the computation
+    if abs(len(a) - len(b)) > max_edits:
+        return None
+
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [max_edits + 1] * len(b)
+        lo, hi = max(1, i - max_edits), min(len(b), i + max_edits)
+        for j in range(lo, hi + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1]),
+            )
+        if min(current[lo - 1 : hi + 1]) > max_edits:
+            return None
+        previous = current
+
+    return previous[-1] if previous[-1] <= max_edits else None
+
+
+def similar_terms(
+    kgrams: KGramIndex, entries: Any, term: str, max_edits: int, limit: int
+) -> List[str]:
+    # the terms of the entries at most max_edits away from term, the closest and then
+    # the most frequent first. Every edit changes at most k of the k-grams of a term, so
+    # only the terms sharing enough k-grams with it are compared: the ones found in the
+    # term ids arrays of its k-grams, instead of the whole vocabulary.
+    if max_edits <= 0 or limit <= 0:
+        return []
+
+    term_grams = term_kgrams(term, kgrams.k)
+    arrays = [kgrams.kgrams[g] for g in term_grams if g in kgrams.kgrams]
+    if len(arrays) == 0:
+        return []
+
+    ids, counts = np.unique(np.concatenate(arrays), return_counts=True)
+    # a short term may not keep any of its k-grams after max_edits edits, its matches
+    # must still share one with it
+    threshold = max(1, len(term_grams) - kgrams.k * max_edits)
+
+    matches = []
+    for i in ids[counts >= threshold].tolist():
+        candidate = kgrams.term(entries, i)
+        distance = edit_distance(term, candidate, max_edits)
+        if distance is not None:
+            matches.append((distance, -entries[candidate][0], candidate))
+
+    return [candidate for (_, _, candidate) in heapq.nsmallest(limit, matches)]
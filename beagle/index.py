@@ -1,8 +1,43 @@
-from typing import Dict, Any, List
+from typing import (
+    Dict,
+    Any,
+    List,
+    Iterable,
+    Iterator,
+    Tuple,
+    Optional,
+    Mapping,
+    Sequence,
+)
 from beagle.logging import timer
+from beagle import metrics
+from beagle.postings import (
+    Codec,
+    CODEC_CODES,
+    encode_postings,
+    decode_postings,
+    decode_doc_ids,
+    decode_positions,
+    gallop,
+    concatenate_postings,
+    benchmark_codec,
+    vbyte_encode,
+    vbyte_decode,
+)
+from beagle.lexicon import Lexicon, LexiconWriter, SortedTerms
+from beagle.wildcard import KGramIndex
+from beagle.fuzzy import similar_terms
+from collections import OrderedDict
 from enum import Enum
+import array
+import bisect
+import heapq
 import json
+import mmap
 import os
+import struct
+import sys
+import threading
 
 
 class InvertedIndexType(Enum):
@@ -14,12 +49,75 @@ class InvertedIndexType(Enum):
         return self.value
 
 
+class IndexFormat(Enum):
+    JSON = "json"
+    BINARY = "binary"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+INDEX_FILE_NAMES = {IndexFormat.JSON: "index.json", IndexFormat.BINARY: "index.bin"}
+
+# binary index layout: a header, the encoded postings of every term (see the postings
+# module for the codecs), the records of the terms by term id, then the front-coded
+# lexicon of the sorted terms (see the lexicon module) whose positions are the term ids
+BINARY_INDEX_MAGIC = b"BGLI"
+BINARY_INDEX_VERSION = 3
+# the first version only supported raw postings and had a reserved zero byte instead of
+# the codec code, and the first two stored every term whole next to its record, so
+# their files are still readable
+SUPPORTED_BINARY_INDEX_VERSIONS = [1, 2, 3]
+HEADER = struct.Struct(
+    "<4sBBBBIQQ"
+)  # magic, version, type, codec, lexicon block size, terms, records, lexicon
+TERM_RECORD = struct.Struct("<IQQ")  # df, postings offset, postings length
+# records of the first two versions, followed by the terms strings instead of a lexicon
+LEGACY_DICTIONARY_RECORD = struct.Struct(
+    "<QIIQQ"
+)  # term offset, term length, df, postings offset, postings length
+INDEX_TYPE_CODES = {
+    InvertedIndexType.DOCUMENTS_INDEX: 0,
+    InvertedIndexType.FREQUENCIES_INDEX: 1,
+    InvertedIndexType.POSITIONS_INDEX: 2,
+}
+POSTINGS_CACHE_SIZE = 64
+# the records of the terms looked up last, including the ones missing from the index
+RECORDS_CACHE_SIZE = 4096
+
+# estimated memory footprints (in bytes) of the in-memory postings of a SPIMI indexer
+TERM_MEMORY_COST = 120
+POSTING_MEMORY_COST = 80
+POSITION_MEMORY_COST = 36
+
+
+def postings_layout(index_type: InvertedIndexType) -> Tuple[bool, bool]:
+    # whether the postings store frequencies and positions
+    return (
+        index_type != InvertedIndexType.DOCUMENTS_INDEX,
+        index_type == InvertedIndexType.POSITIONS_INDEX,
+    )
+
+
+def sorted_terms(entries: Any) -> Iterable[str]:
+    # the terms of the entries in the order of their ids
+    if hasattr(entries, "term_id"):
+        return iter(entries)
+    return sorted(entries, key=lambda t: t.encode("utf-8"))
+
+
 class InvertedIndex:
     def __init__(self, index_type: InvertedIndexType) -> None:
         self.entries: Dict[str, Any] = {}
         self.type: InvertedIndexType = index_type
+        # k-gram index of the vocabulary, to expand the wildcard terms of the queries
+        self.kgrams: Optional[KGramIndex] = None
+        # ids of the terms of in-memory entries, which cannot give them on their own
+        self.term_ids: Optional[Dict[str, int]] = None
 
     def update(self, index: "InvertedIndex") -> None:
+        self.kgrams = None
+        self.term_ids = None
         for term in index.entries:
             if term in self.entries:
                 self.entries[term][0] += index.entries[term][0]
@@ -27,28 +125,683 @@ class InvertedIndex:
             else:
                 self.entries[term] = index.entries[term]
 
+    def add_document(self, id: int, positions: Dict[str, List[Any]]) -> int:
+        # adds the postings of a document from its term positions, and returns the
+        # number of terms it added to the vocabulary
+        new_terms = 0
+        self.kgrams = None
+        self.term_ids = None
+
+        for (t, (f, p)) in positions.items():
+            if self.type == InvertedIndexType.DOCUMENTS_INDEX:
+                posting: Any = id
+            elif self.type == InvertedIndexType.FREQUENCIES_INDEX:
+                posting = (id, f)
+            else:
+                posting = (id, f, p)
+
+            if t in self.entries:
+                self.entries[t][0] += 1
+                self.entries[t][1].append(posting)
+            else:
+                self.entries[t] = [1, [posting]]
+                new_terms += 1
+
+        return new_terms
+
+    def doc_ids(self, term: str) -> List[int]:
+        # the lazy entries decode the doc ids only, without the frequencies or positions
+        if hasattr(self.entries, "doc_ids"):
+            return self.entries.doc_ids(term)
+
+        postings = self.entries[term][1]
+        if self.type == InvertedIndexType.DOCUMENTS_INDEX:
+            return postings
+        return [p[0] for p in postings]
+
+    def positions(self, term: str, ids: List[int]) -> List[List[int]]:
+        # positions of the term in the given sorted documents, which must all contain it
+        if self.type != InvertedIndexType.POSITIONS_INDEX:
+            raise Exception("phrase and proximity queries require a positions index")
+        if hasattr(self.entries, "positions"):
+            return self.entries.positions(term, ids)
+
+        postings = self.entries[term][1]
+        postings_ids = [p[0] for p in postings]
+        result: List[List[int]] = []
+        j = 0
+        for id in ids:
+            j = gallop(postings_ids, id, j)
+            result.append(postings[j][2])
+
+        return result
+
+    def kgram_index(self) -> KGramIndex:
+        # built on the first use when none was saved along with the index
+        if self.kgrams is None:
+            self.kgrams = KGramIndex.build(self.entries)
+        return self.kgrams
+
+    def term_id(self, term: str) -> Optional[int]:
+        # the rank of the term in the vocabulary sorted by UTF-8 bytes, that is its id in
+        # the lexicon of a binary index
+        if hasattr(self.entries, "term_id"):
+            return self.entries.term_id(term)
+        if self.term_ids is None:
+            self.term_ids = {t: i for (i, t) in enumerate(sorted_terms(self.entries))}
+        return self.term_ids.get(term)
+
+    def expand(self, pattern: str) -> List[str]:
+        # the terms matching a wildcard pattern
+        terms = self.kgram_index().expand(pattern, self.entries)
+        if metrics.enabled:
+            metrics.wildcard_terms.inc(len(terms))
+        return terms
+
+    def similar(self, term: str, max_edits: int, limit: int) -> List[str]:
+        # the terms at most max_edits away from a misspelled one
+        terms = similar_terms(self.kgram_index(), self.entries, term, max_edits, limit)
+        if metrics.enabled:
+            metrics.fuzzy_terms.inc(len(terms))
+        return terms
+
+    def derive(self, index_type: InvertedIndexType) -> "InvertedIndex":
+        # builds a lighter index by dropping the positions and/or the frequencies
+        levels = list(InvertedIndexType)
+        if levels.index(index_type) > levels.index(self.type):
+            raise Exception(
+                f"a {index_type} index cannot be derived from a {self.type} one"
+            )
+
+        index = InvertedIndex(index_type)
+        for term in self.entries:
+            df, postings = self.entries[term]
+            if (
+                index_type == InvertedIndexType.DOCUMENTS_INDEX
+                and self.type != index_type
+            ):
+                postings = [p[0] for p in postings]
+            elif (
+                index_type == InvertedIndexType.FREQUENCIES_INDEX
+                and self.type != index_type
+            ):
+                postings = [(p[0], p[1]) for p in postings]
+            index.entries[term] = [df, postings]
+
+        return index
+
+    def compress(self, codec: Codec = Codec.VBYTE) -> None:
+        entries = CompressedEntries(self.type, codec)
+        for term in self.entries:
+            entries.add(term, self.entries[term][0], self.entries[term][1])
+        self.entries = entries
+
     @timer
-    def save(self, path: str) -> None:
+    def save(
+        self,
+        path: str,
+        index_format: IndexFormat = IndexFormat.JSON,
+        codec: Codec = Codec.VBYTE,
+    ) -> None:
         dirpath = os.path.dirname(path)
         if not os.path.exists(dirpath):
             os.makedirs(dirpath)
 
-        with open(path, "w") as f:
-            json.dump({"type": self.type.value, "entries": self.entries}, f)
+        if index_format == IndexFormat.BINARY:
+            with BinaryIndexWriter(path, self.type, codec) as writer:
+                for term in sorted(self.entries, key=lambda t: t.encode("utf-8")):
+                    if (
+                        isinstance(self.entries, CompressedEntries)
+                        and self.entries.codec == codec
+                    ):
+                        # no need to decode the postings to write them back
+                        df, data = self.entries.data[term]
+                        writer.add_encoded(term, df, data)
+                    else:
+                        writer.add(term, self.entries[term][0], self.entries[term][1])
+        else:
+            entries = self.entries
+            if not isinstance(entries, dict):
+                entries = {term: list(entries[term]) for term in entries}
+
+            with open(path, "w") as f:
+                json.dump({"type": self.type.value, "entries": entries}, f)
+
+
+@timer
+def benchmark_codecs(index: InvertedIndex) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+
+    levels = list(InvertedIndexType)
+    for index_type in levels[: levels.index(index.type) + 1]:
+        derived = index.derive(index_type)
+        postings_lists = [derived.entries[term][1] for term in derived.entries]
+        frequencies, positions = postings_layout(index_type)
+
+        for codec in Codec:
+            result = benchmark_codec(postings_lists, frequencies, positions, codec)
+            result["type"] = index_type.value
+            results.append(result)
+
+    return results
+
+
+# in-memory entries whose postings are kept encoded, and decoded when they are accessed
+class CompressedEntries(Mapping):
+    def __init__(self, index_type: InvertedIndexType, codec: Codec) -> None:
+        self.type: InvertedIndexType = index_type
+        self.codec: Codec = codec
+        self.data: Dict[str, Tuple[int, bytes]] = {}
+
+    def add(self, term: str, df: int, postings: List[Any]) -> None:
+        frequencies, positions = postings_layout(self.type)
+        self.data[term] = (
+            df,
+            encode_postings(postings, frequencies, positions, self.codec),
+        )
+
+    def postings(self, term: str) -> List[Any]:
+        frequencies, positions = postings_layout(self.type)
+        return decode_postings(self.data[term][1], frequencies, positions, self.codec)
+
+    def doc_ids(self, term: str) -> List[int]:
+        frequencies, positions = postings_layout(self.type)
+        return decode_doc_ids(self.data[term][1], frequencies, positions, self.codec)
+
+    def positions(self, term: str, ids: List[int]) -> List[List[int]]:
+        return decode_positions(self.data[term][1], ids, self.codec)
+
+    def extend(self, entries: "CompressedEntries") -> None:
+        # appends the postings of entries whose doc ids all follow the ones of this object
+        frequencies, positions = postings_layout(self.type)
+        for term in entries.data:
+            if term in self.data:
+                df, data = self.data[term]
+                self.data[term] = (
+                    df + entries.data[term][0],
+                    concatenate_postings(
+                        [data, entries.data[term][1]],
+                        frequencies,
+                        positions,
+                        self.codec,
+                    ),
+                )
+            else:
+                self.data[term] = entries.data[term]
+
+    def encoded_size(self) -> int:
+        return sum(len(data) for (_, data) in self.data.values())
+
+    def __getitem__(self, term: str) -> "LazyEntry":
+        return LazyEntry(self, term, self.data[term][0])
+
+    def __contains__(self, term: object) -> bool:
+        return term in self.data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+# streams terms, given in increasing UTF-8 order, to a binary index file
+class BinaryIndexWriter:
+    def __init__(
+        self, path: str, index_type: InvertedIndexType, codec: Codec = Codec.VBYTE
+    ) -> None:
+        self.type: InvertedIndexType = index_type
+        self.codec: Codec = codec
+        self.file = open(path, "wb")
+        self.file.write(b"\0" * HEADER.size)
+        self.records: List[Tuple[int, int, int]] = []
+        self.lexicon = LexiconWriter()
+        self.last_term: Optional[bytes] = None
+
+    def __enter__(self) -> "BinaryIndexWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def add(self, term: str, df: int, postings: List[Any]) -> None:
+        frequencies, positions = postings_layout(self.type)
+        self.add_encoded(
+            term, df, encode_postings(postings, frequencies, positions, self.codec)
+        )
+
+    def add_encoded(self, term: str, df: int, data: bytes) -> None:
+        raw_term = term.encode("utf-8")
+        if self.last_term is not None and raw_term <= self.last_term:
+            raise Exception(f"terms must be added in increasing order: {term}")
+        self.last_term = raw_term
+
+        self.records.append((df, self.file.tell(), len(data)))
+        self.lexicon.add(raw_term)
+        self.file.write(data)
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+
+        records_offset = self.file.tell()
+        for record in self.records:
+            self.file.write(TERM_RECORD.pack(*record))
+
+        lexicon_offset = self.file.tell()
+        self.file.write(self.lexicon.to_bytes())
+
+        self.file.seek(0)
+        self.file.write(
+            HEADER.pack(
+                BINARY_INDEX_MAGIC,
+                BINARY_INDEX_VERSION,
+                INDEX_TYPE_CODES[self.type],
+                CODEC_CODES[self.codec],
+                self.lexicon.block_size,
+                len(self.records),
+                records_offset,
+                lexicon_offset,
+            )
+        )
+        self.file.close()
+
+
+# terms of the first two versions of the binary index, stored whole and referenced by
+# their records
+class LegacyTerms(SortedTerms):
+    def __init__(
+        self, data: Any, records_offset: int, strings_offset: int, terms_number: int
+    ) -> None:
+        self.data: Any = data
+        self.records_offset: int = records_offset
+        self.strings_offset: int = strings_offset
+        self.terms_number = terms_number
+
+    def term(self, i: int) -> bytes:
+        term_offset, term_length, _, _, _ = LEGACY_DICTIONARY_RECORD.unpack_from(
+            self.data, self.records_offset + i * LEGACY_DICTIONARY_RECORD.size
+        )
+        start = self.strings_offset + term_offset
+        return self.data[start : start + term_length]
+
+
+def cache_put(cache: Any, key: str, value: Any, size: int) -> None:
+    # adds an entry to a least recently used cache, dropping the oldest ones beyond size
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > size:
+        cache.popitem(last=False)
+
+
+# read-only view of the entries of a memory-mapped binary index: terms are found in the
+# lexicon, which gives their term ids and so their records, and postings are decoded on
+# access only
+class MappedEntries(Mapping):
+    def __init__(self, path: str) -> None:
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            self.version,
+            type_code,
+            codec_code,
+            block_size,
+            self.terms_number,
+            self.records_offset,
+            lexicon_offset,
+        ) = HEADER.unpack_from(self.data, 0)
+        if (
+            magic != BINARY_INDEX_MAGIC
+            or self.version not in SUPPORTED_BINARY_INDEX_VERSIONS
+        ):
+            raise Exception(f"{path} is not a supported binary index")
+
+        self.type: InvertedIndexType = {
+            code: index_type for index_type, code in INDEX_TYPE_CODES.items()
+        }[type_code]
+        self.codec: Codec = {code: codec for codec, code in CODEC_CODES.items()}[
+            codec_code
+        ]
+        self.terms: SortedTerms
+        if self.version < 3:
+            self.terms = LegacyTerms(
+                self.data, self.records_offset, lexicon_offset, self.terms_number
+            )
+        else:
+            self.terms = Lexicon(
+                self.data, lexicon_offset, self.terms_number, block_size
+            )
+        # least recently used caches, shared by the threads of a server
+        self.records_cache: Dict[str, Optional[Tuple[int, int, int]]] = OrderedDict()
+        self.postings_cache: Dict[str, List[Any]] = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+    def close(self) -> None:
+        self.data.close()
+        self.file.close()
+
+    def record(self, i: int) -> Tuple[int, int, int]:
+        # df, postings offset and postings length of the term of id i
+        if self.version < 3:
+            _, _, df, offset, length = LEGACY_DICTIONARY_RECORD.unpack_from(
+                self.data, self.records_offset + i * LEGACY_DICTIONARY_RECORD.size
+            )
+            return df, offset, length
+        return TERM_RECORD.unpack_from(
+            self.data, self.records_offset + i * TERM_RECORD.size
+        )
+
+    def term(self, i: int) -> bytes:
+        return self.terms.term(i)
+
+    def term_id(self, term: str) -> Optional[int]:
+        i = self.terms.find(term.encode("utf-8"))
+        return i if i >= 0 else None
+
+    def find(self, term: str) -> Optional[Tuple[int, int, int]]:
+        with self.cache_lock:
+            if term in self.records_cache:
+                self.records_cache.move_to_end(term)
+                return self.records_cache[term]
+
+        i = self.term_id(term)
+        record = self.record(i) if i is not None else None
+
+        with self.cache_lock:
+            cache_put(self.records_cache, term, record, RECORDS_CACHE_SIZE)
+        return record
+
+    def with_prefix(self, prefix: str) -> Iterator[str]:
+        start, end = self.terms.prefix_range(prefix.encode("utf-8"))
+        for raw_term in self.terms.iter_terms(start, end):
+            yield raw_term.decode("utf-8")
+
+    def postings(self, term: str) -> List[Any]:
+        with self.cache_lock:
+            if term in self.postings_cache:
+                self.postings_cache.move_to_end(term)
+                return self.postings_cache[term]
+
+        _, postings_offset, postings_length = self.find(term)
+        if metrics.enabled:
+            metrics.index_bytes_read.inc(postings_length)
+        frequencies, positions = postings_layout(self.type)
+        postings = decode_postings(
+            self.data[postings_offset : postings_offset + postings_length],
+            frequencies,
+            positions,
+            self.codec,
+        )
+
+        with self.cache_lock:
+            cache_put(self.postings_cache, term, postings, POSTINGS_CACHE_SIZE)
+
+        return postings
+
+    def doc_ids(self, term: str) -> List[int]:
+        _, postings_offset, postings_length = self.find(term)
+        if metrics.enabled:
+            metrics.index_bytes_read.inc(postings_length)
+        frequencies, positions = postings_layout(self.type)
+        return decode_doc_ids(
+            self.data[postings_offset : postings_offset + postings_length],
+            frequencies,
+            positions,
+            self.codec,
+        )
+
+    def positions(self, term: str, ids: List[int]) -> List[List[int]]:
+        _, postings_offset, postings_length = self.find(term)
+        if metrics.enabled:
+            metrics.index_bytes_read.inc(postings_length)
+        return decode_positions(
+            self.data[postings_offset : postings_offset + postings_length],
+            ids,
+            self.codec,
+        )
+
+    def __getitem__(self, term: str) -> "LazyEntry":
+        record = self.find(term)
+        if record is None:
+            raise KeyError(term)
+        return LazyEntry(self, term, record[0])
+
+    def __contains__(self, term: object) -> bool:
+        return isinstance(term, str) and self.find(term) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for raw_term in self.terms.iter_terms():
+            yield raw_term.decode("utf-8")
+
+    def iter_encoded(self) -> Iterator[Tuple[bytes, int, bytes]]:
+        # sequential scan of the raw terms with their df and still encoded postings
+        for (i, raw_term) in enumerate(self.terms.iter_terms()):
+            df, postings_offset, postings_length = self.record(i)
+            yield (
+                raw_term,
+                df,
+                self.data[postings_offset : postings_offset + postings_length],
+            )
+
+    def __len__(self) -> int:
+        return self.terms_number
+
+
+# behaves like the `[df, postings]` lists of a JSON index
+class LazyEntry:
+    def __init__(self, entries: Any, term: str, df: int) -> None:
+        self.entries: Any = entries
+        self.term: str = term
+        self.df: int = df
+
+    def __getitem__(self, i: int) -> Any:
+        if i == 0:
+            return self.df
+        elif i == 1:
+            return self.entries.postings(self.term)
+        raise IndexError(i)
+
+    def __len__(self) -> int:
+        return 2
+
+    def __iter__(self) -> Iterator[Any]:
+        yield self[0]
+        yield self[1]
+
+
+# single-pass in-memory indexer: documents are added one by one in increasing id order,
+# and the postings are flushed as a sorted binary run whenever their estimated memory
+# footprint exceeds the budget. The runs are then k-way merged into the final index.
+class SpimiIndexBuilder:
+    def __init__(
+        self,
+        index_type: InvertedIndexType,
+        memory_budget: int,
+        runs_dirpath: str,
+        codec: Codec = Codec.VBYTE,
+    ) -> None:
+        self.type: InvertedIndexType = index_type
+        self.memory_budget: int = memory_budget
+        self.runs_dirpath: str = runs_dirpath
+        self.codec: Codec = codec
+        self.index: InvertedIndex = InvertedIndex(index_type)
+        self.memory: int = 0
+        self.runs: List[str] = []
+
+    def add(self, id: int, positions: Dict[str, List[Any]]) -> None:
+        self.memory += TERM_MEMORY_COST * self.index.add_document(id, positions)
+        self.memory += POSTING_MEMORY_COST * len(positions)
+        if self.type == InvertedIndexType.POSITIONS_INDEX:
+            self.memory += POSITION_MEMORY_COST * sum(
+                f for (f, _) in positions.values()
+            )
+
+        if self.memory >= self.memory_budget:
+            self.flush()
+
+    @timer
+    def flush(self) -> None:
+        path = os.path.join(self.runs_dirpath, f"run.{len(self.runs)}.bin")
+
+        self.index.save(path, IndexFormat.BINARY, self.codec)
+        self.runs.append(path)
+
+        self.index = InvertedIndex(self.type)
+        self.memory = 0
+
+    @timer
+    def merge(self, path: str) -> None:
+        if len(self.index.entries) > 0 or len(self.runs) == 0:
+            self.flush()
+
+        runs = [MappedEntries(run_path) for run_path in self.runs]
+        frequencies, positions = postings_layout(self.type)
+
+        # the runs hold increasing doc ids ranges, so merging the postings of a term is
+        # a concatenation of its chunks taken in the runs order
+        with BinaryIndexWriter(path, self.type, self.codec) as writer:
+            streams = [
+                ((term, i, df, data) for (term, df, data) in run.iter_encoded())
+                for (i, run) in enumerate(runs)
+            ]
+
+            current_term: Optional[bytes] = None
+            current_df = 0
+            chunks: List[bytes] = []
+            for (term, _, df, data) in heapq.merge(*streams):
+                if term != current_term:
+                    if current_term is not None:
+                        writer.add_encoded(
+                            current_term.decode("utf-8"),
+                            current_df,
+                            concatenate_postings(
+                                chunks, frequencies, positions, self.codec
+                            ),
+                        )
+                    current_term = term
+                    current_df = 0
+                    chunks = []
+                current_df += df
+                chunks.append(data)
+
+            if current_term is not None:
+                writer.add_encoded(
+                    current_term.decode("utf-8"),
+                    current_df,
+                    concatenate_postings(chunks, frequencies, positions, self.codec),
+                )
+
+        for (run, run_path) in zip(runs, self.runs):
+            run.close()
+            os.remove(run_path)
+        self.runs = []
+
+
+def detect_index_format(path: str) -> IndexFormat:
+    with open(path, "rb") as f:
+        if f.read(len(BINARY_INDEX_MAGIC)) == BINARY_INDEX_MAGIC:
+            return IndexFormat.BINARY
+    return IndexFormat.JSON
+
+
+def find_index_file(dirpath: str) -> str:
+    for index_format in [IndexFormat.BINARY, IndexFormat.JSON]:
+        path = os.path.join(dirpath, INDEX_FILE_NAMES[index_format])
+        if os.path.exists(path):
+            return path
+
+    raise Exception(f"no index was found in {dirpath}")
 
 
 @timer
 def load_index(path: str) -> InvertedIndex:
+    if detect_index_format(path) == IndexFormat.BINARY:
+        entries = MappedEntries(path)
+        index = InvertedIndex(entries.type)
+        index.entries = entries
+        return index
+
     with open(path, "r") as f:
         raw = json.load(f)
-        index = InvertedIndex(raw["type"])
+        index = InvertedIndex(InvertedIndexType(raw["type"]))
         index.entries = raw["entries"]
     return index
 
 
+# binary doc index layout: a header, the sorted doc ids, the offsets of the blocks of
+# rows, then the blocks. The names and paths of the rows of a block are front coded:
+# only the suffix that a row does not share with the previous one is stored, after the
+# lengths of the shared prefix and of the suffix.
+DOC_INDEX_FILE_NAME = "doc_index.bin"
+# the doc index used to be saved as JSON, and these files are still readable
+LEGACY_DOC_INDEX_FILE_NAME = "doc_index.json"
+DOC_INDEX_MAGIC = b"BGLD"
+DOC_INDEX_VERSION = 1
+DOC_INDEX_HEADER = struct.Struct("<4sHHQ")  # magic, version, block size, documents
+DOC_INDEX_BLOCK_SIZE = 16
+
+
 class DocIndex:
     def __init__(self) -> None:
-        self.entries: Dict[str, Any] = {}
+        # rows added in memory, by doc id, that take precedence over the mapped ones
+        self.rows: Dict[int, Tuple[str, str]] = {}
+        self.data: Optional[mmap.mmap] = None
+        self.ids: Sequence[int] = []
+        self.offsets: Sequence[int] = []
+        self.blocks_offset: int = 0
+        self.block_size: int = DOC_INDEX_BLOCK_SIZE
+
+    def add(self, id: int, name: str, path: str) -> None:
+        self.rows[id] = (name, path)
+
+    def update(self, doc_index: "DocIndex", ids: Iterable[int]) -> None:
+        for id in ids:
+            self.rows[id] = doc_index.row(id)
+
+    def find(self, id: int) -> int:
+        # doc ids are dense, so the row of an id is usually at this id
+        if 0 <= id < len(self.ids) and self.ids[id] == id:
+            return id
+        i = bisect.bisect_left(self.ids, id)
+        return i if i < len(self.ids) and self.ids[i] == id else -1
+
+    def decode(self, i: int) -> Tuple[str, str]:
+        # the rows of the block are decoded up to the i-th one
+        block = i // self.block_size
+        pos = self.blocks_offset + self.offsets[block]
+        name, path = b"", b""
+        for _ in range(block * self.block_size, i + 1):
+            (name_prefix, name_suffix), pos = vbyte_decode(self.data, pos, 2)
+            name = name[:name_prefix] + self.data[pos : pos + name_suffix]
+            pos += name_suffix
+            (path_prefix, path_suffix), pos = vbyte_decode(self.data, pos, 2)
+            path = path[:path_prefix] + self.data[pos : pos + path_suffix]
+            pos += path_suffix
+
+        return name.decode("utf-8"), path.decode("utf-8")
+
+    def row(self, id: int) -> Tuple[str, str]:
+        if id in self.rows:
+            return self.rows[id]
+        i = self.find(id)
+        if i < 0:
+            raise KeyError(id)
+        return self.decode(i)
+
+    def get(self, id: int) -> Dict[str, str]:
+        name, path = self.row(id)
+        return {"name": name, "path": path}
+
+    def __contains__(self, id: object) -> bool:
+        return isinstance(id, int) and (id in self.rows or self.find(id) >= 0)
+
+    def all_ids(self) -> List[int]:
+        return sorted(set(self.ids).union(self.rows))
+
+    def __len__(self) -> int:
+        return len(self.ids) + sum(1 for id in self.rows if self.find(id) < 0)
 
     @timer
     def save(self, path: str) -> None:
@@ -56,23 +809,101 @@ class DocIndex:
         if not os.path.exists(dirpath):
             os.makedirs(dirpath)
 
-        with open(path, "w") as f:
-            return json.dump(self.entries, f)
+        ids = self.all_ids()
+        offsets: List[int] = []
+        blocks = bytearray()
+        previous = (b"", b"")
+        for (i, id) in enumerate(ids):
+            if i % DOC_INDEX_BLOCK_SIZE == 0:
+                offsets.append(len(blocks))
+                previous = (b"", b"")
+            row = tuple(value.encode("utf-8") for value in self.row(id))
+            for (value, previous_value) in zip(row, previous):
+                prefix = len(os.path.commonprefix([value, previous_value]))
+                vbyte_encode([prefix, len(value) - prefix], blocks)
+                blocks += value[prefix:]
+            previous = row
+
+        with open(path, "wb") as f:
+            f.write(
+                DOC_INDEX_HEADER.pack(
+                    DOC_INDEX_MAGIC, DOC_INDEX_VERSION, DOC_INDEX_BLOCK_SIZE, len(ids)
+                )
+            )
+            for (code, values) in [("q", ids), ("Q", offsets)]:
+                # the ids and offsets are little-endian, as the rest of the file
+                a = array.array(code, values)
+                if sys.byteorder == "big":
+                    a.byteswap()
+                f.write(a.tobytes())
+            f.write(blocks)
+
+    def format_results(self, results: Dict[int, float]) -> "FormattedResults":
+        return FormattedResults(self, results)
+
 
-    def format_results(self, results: Dict[int, float]) -> List[str]:
-        formatted_results: List[str] = []
+# results lines of a query, only formatted when they are displayed or written
+class FormattedResults(Sequence):
+    def __init__(self, doc_index: DocIndex, results: Dict[int, float]) -> None:
+        self.doc_index: DocIndex = doc_index
+        self.results: List[Tuple[int, float]] = list(results.items())
 
-        for doc_id, score in results.items():
-            doc = self.entries[str(doc_id)]
-            formatted_results.append(f"{doc['name']}: {score} ({doc['path']})")
+    def __len__(self) -> int:
+        return len(self.results)
 
-        return formatted_results
+    def __getitem__(self, i: Any) -> Any:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self.results)))]
+
+        doc_id, score = self.results[i]
+        name, path = self.doc_index.row(doc_id)
+        return f"{name}: {score} ({path})"
+
+
+def find_doc_index_file(dirpath: str) -> str:
+    path = os.path.join(dirpath, DOC_INDEX_FILE_NAME)
+    legacy_path = os.path.join(dirpath, LEGACY_DOC_INDEX_FILE_NAME)
+    return (
+        legacy_path
+        if not os.path.exists(path) and os.path.exists(legacy_path)
+        else path
+    )
 
 
 @timer
 def load_doc_index(path: str) -> DocIndex:
-    with open(path, "r") as f:
-        raw = json.load(f)
-        index = DocIndex()
-        index.entries = raw
+    index = DocIndex()
+    with open(path, "rb") as f:
+        if f.read(len(DOC_INDEX_MAGIC)) != DOC_INDEX_MAGIC:
+            f.seek(0)
+            for (id, document) in json.load(f).items():
+                index.add(int(id), document["name"], document["path"])
+            return index
+
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, block_size, n = DOC_INDEX_HEADER.unpack_from(data, 0)
+    if version != DOC_INDEX_VERSION:
+        raise Exception(f"{path} is not a supported doc index")
+
+    blocks_number = (n + block_size - 1) // block_size
+    ids_offset = DOC_INDEX_HEADER.size
+    offsets_offset = ids_offset + 8 * n
+    index.data = data
+    index.block_size = block_size
+    # the little-endian ids and offsets are read in place from the mapped file, and only
+    # copied to be swapped on a big-endian machine
+    ids = memoryview(data)[ids_offset:offsets_offset]
+    offsets = memoryview(data)[offsets_offset : offsets_offset + 8 * blocks_number]
+    if sys.byteorder == "big":
+        index.ids, index.offsets = array.array("q"), array.array("Q")
+        index.ids.frombytes(ids)
+        index.offsets.frombytes(offsets)
+        index.ids.byteswap()
+        index.offsets.byteswap()
+    else:
+        index.ids = ids.cast("q")
+        index.offsets = offsets.cast("Q")
+    index.blocks_offset = offsets_offset + 8 * blocks_number
+
     return index
@@ -0,0 +1,130 @@
+from typing import Dict, Optional
+from collections import OrderedDict
+from beagle.logging import timer, register_reporter
+from beagle import metrics
+from nltk.stem import WordNetLemmatizer
+import json
+import os
+import threading
+import time
+
+LEMMAS_FILE_NAME = "lemmas.json"
+
+
+# memoizes the lemma of every surface form, optionally as a LRU cache of max_size entries
+class LemmaCache:
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        self.max_size: Optional[int] = max_size
+        self.lemmas: Dict[str, str] = OrderedDict() if max_size is not None else {}
+        self.lemmatizer: Optional[WordNetLemmatizer] = None
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lemmatizing_time: float = 0.0
+        self.reported_hits: int = 0
+        self.reported_misses: int = 0
+        # the lemmas computed since it was set, that a worker process sends back
+        self.learned: Optional[Dict[str, str]] = None
+        self.lock = threading.Lock()
+
+    def lemmatize(self, token: str) -> str:
+        # the cache is shared by the threads of a server and of a sharded engine, and a
+        # bounded one reorders and evicts its lemmas on every lookup
+        with self.lock:
+            lemma = self.lemmas.get(token)
+            if lemma is not None:
+                self.hits += 1
+                if metrics.enabled:
+                    metrics.lemma_cache_hits.inc()
+                if self.max_size is not None:
+                    self.lemmas.move_to_end(token)
+                return lemma
+
+            self.misses += 1
+            if metrics.enabled:
+                metrics.lemma_cache_misses.inc()
+            if self.lemmatizer is None:
+                self.lemmatizer = WordNetLemmatizer()
+
+            start_time = time.perf_counter()
+            lemma = self.lemmatizer.lemmatize(token)
+            self.lemmatizing_time += time.perf_counter() - start_time
+
+            self.lemmas[token] = lemma
+            if self.learned is not None:
+                self.learned[token] = lemma
+            if self.max_size is not None and len(self.lemmas) > self.max_size:
+                self.lemmas.popitem(last=False)
+
+            return lemma
+
+    def update(self, lemmas: Dict[str, str]) -> None:
+        with self.lock:
+            for (token, lemma) in lemmas.items():
+                self.lemmas[token] = lemma
+            if self.max_size is not None:
+                while len(self.lemmas) > self.max_size:
+                    self.lemmas.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def time_saved(self) -> float:
+        # every hit saved the average cost of a real lemmatization
+        if self.misses == 0:
+            return 0.0
+        return self.hits * self.lemmatizing_time / self.misses
+
+    def report(self) -> Optional[str]:
+        if self.hits == self.reported_hits and self.misses == self.reported_misses:
+            return None
+
+        self.reported_hits = self.hits
+        self.reported_misses = self.misses
+        return f"lemma cache: {len(self.lemmas)} lemmas, {self.hits} hits, {self.misses} misses, {100 * self.hit_rate():.1f}% hit rate, {self.time_saved():4f}s saved"
+
+    # the lemmatizer and the lock are not pickled with the cache, so it can be sent to
+    # worker processes
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        state["lemmatizer"] = None
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @timer
+    def save(self, path: str) -> None:
+        with self.lock:
+            lemmas = dict(self.lemmas)
+        with open(path, "w") as f:
+            json.dump(lemmas, f)
+
+
+@timer
+def load_lemma_cache(path: str, max_size: Optional[int] = None) -> LemmaCache:
+    cache = LemmaCache(max_size)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            cache.update(json.load(f))
+    return cache
+
+
+# the cache shared by the documents and the engines of the process
+lemma_cache = LemmaCache()
+register_reporter(lambda: lemma_cache.report())
+
+
+def get_lemma_cache() -> LemmaCache:
+    return lemma_cache
+
+
+def set_lemma_cache(cache: LemmaCache) -> None:
+    global lemma_cache
+    lemma_cache = cache
+
+
+def lemmatize(token: str) -> str:
+    return lemma_cache.lemmatize(token)
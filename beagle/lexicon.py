@@ -0,0 +1,204 @@
+from typing import Any, Iterator, List, Optional, Tuple
+from beagle.postings import vbyte_encode
+import struct
+
+# lexicon layout: the offsets of the blocks of terms, then the blocks. The terms of a
+# block are front coded: only the suffix that a term does not share with the previous
+# one is stored, after the lengths of the shared prefix and of the suffix. The first
+# term of a block is stored whole so that a block can be decoded on its own.
+LEXICON_BLOCK_SIZE = 16
+BLOCK_OFFSET = struct.Struct("<Q")
+
+
+# sorted raw terms, where the position of a term is its term id
+class SortedTerms:
+    terms_number: int = 0
+
+    def term(self, i: int) -> bytes:
+        raise NotImplementedError()
+
+    def lower_bound(self, raw_term: bytes) -> int:
+        # id of the first term that is not lower than raw_term
+        lo, hi = 0, self.terms_number
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term(mid) < raw_term:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, raw_term: bytes) -> int:
+        i = self.lower_bound(raw_term)
+        return i if i < self.terms_number and self.term(i) == raw_term else -1
+
+    def iter_terms(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        for i in range(start, self.terms_number if end is None else end):
+            yield self.term(i)
+
+    def prefix_range(self, prefix: bytes) -> Tuple[int, int]:
+        # ids range of the terms starting with prefix
+        start = self.lower_bound(prefix)
+        successor = prefix_successor(prefix)
+        end = self.terms_number if successor is None else self.lower_bound(successor)
+        return start, end
+
+    def __len__(self) -> int:
+        return self.terms_number
+
+
+def prefix_successor(prefix: bytes) -> Optional[bytes]:
+    # the lowest bytes string greater than all the ones starting with prefix, None if
+    # there is none (the prefix is empty or only made of 0xff bytes)
+    stripped = prefix.rstrip(b"\xff")
+    if len(stripped) == 0:
+        return None
+    return stripped[:-1] + bytes([stripped[-1] + 1])
+
+
+def read_length(data: Any, pos: int) -> Tuple[int, int]:
+    # vbyte decoding of a single integer, that fits in one byte most of the time
+    b = data[pos]
+    if b < 0x80:
+        return b, pos + 1
+
+    v = 0
+    shift = 0
+    while b & 0x80:
+        v |= (b & 0x7F) << shift
+        shift += 7
+        pos += 1
+        b = data[pos]
+    return v | (b << shift), pos + 1
+
+
+class LexiconWriter:
+    def __init__(self, block_size: int = LEXICON_BLOCK_SIZE) -> None:
+        self.block_size: int = block_size
+        self.offsets: List[int] = []
+        self.blocks = bytearray()
+        self.previous: bytes = b""
+        self.terms_number: int = 0
+
+    def add(self, raw_term: bytes) -> None:
+        # the terms must be added in increasing order
+        if self.terms_number % self.block_size == 0:
+            self.offsets.append(len(self.blocks))
+            self.previous = b""
+
+        prefix = 0
+        limit = min(len(raw_term), len(self.previous))
+        while prefix < limit and raw_term[prefix] == self.previous[prefix]:
+            prefix += 1
+        vbyte_encode([prefix, len(raw_term) - prefix], self.blocks)
+        self.blocks += raw_term[prefix:]
+
+        self.previous = raw_term
+        self.terms_number += 1
+
+    def to_bytes(self) -> bytes:
+        return (
+            b"".join(BLOCK_OFFSET.pack(offset) for offset in self.offsets) + self.blocks
+        )
+
+
+# read-only front-coded lexicon in a buffer (a memory-mapped index file): a term is
+# found with a binary search over the first terms of the blocks, then a scan of a
+# single block
+class Lexicon(SortedTerms):
+    def __init__(
+        self,
+        data: Any,
+        offset: int,
+        terms_number: int,
+        block_size: int = LEXICON_BLOCK_SIZE,
+    ) -> None:
+        self.data: Any = data
+        self.offset: int = offset
+        self.terms_number = terms_number
+        self.block_size: int = block_size
+        self.blocks_number: int = (terms_number + block_size - 1) // block_size
+        self.blocks_offset: int = offset + BLOCK_OFFSET.size * self.blocks_number
+
+    def block_terms(self, block: int) -> Iterator[bytes]:
+        (pos,) = BLOCK_OFFSET.unpack_from(
+            self.data, self.offset + BLOCK_OFFSET.size * block
+        )
+        pos += self.blocks_offset
+        term = b""
+        for _ in range(
+            min(self.block_size, self.terms_number - block * self.block_size)
+        ):
+            prefix, pos = read_length(self.data, pos)
+            suffix, pos = read_length(self.data, pos)
+            term = term[:prefix] + self.data[pos : pos + suffix]
+            pos += suffix
+            yield term
+
+    def first_term(self, block: int) -> bytes:
+        # stored whole, after a null prefix length
+        (pos,) = BLOCK_OFFSET.unpack_from(
+            self.data, self.offset + BLOCK_OFFSET.size * block
+        )
+        suffix, pos = read_length(self.data, self.blocks_offset + pos + 1)
+        return self.data[pos : pos + suffix]
+
+    def term(self, i: int) -> bytes:
+        if not 0 <= i < self.terms_number:
+            raise IndexError(i)
+        for (j, term) in enumerate(self.block_terms(i // self.block_size)):
+            if j == i % self.block_size:
+                return term
+        raise IndexError(i)
+
+    def find_block(self, raw_term: bytes) -> int:
+        # last block whose first term is not greater than raw_term, -1 if there is none
+        lo, hi = 0, self.blocks_number
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.first_term(mid) <= raw_term:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def lower_bound(self, raw_term: bytes) -> int:
+        block = self.find_block(raw_term)
+        if block < 0:
+            return 0
+
+        for (j, term) in enumerate(self.block_terms(block)):
+            if term >= raw_term:
+                return block * self.block_size + j
+        return min((block + 1) * self.block_size, self.terms_number)
+
+    def find(self, raw_term: bytes) -> int:
+        block = self.find_block(raw_term)
+        if block < 0:
+            return -1
+
+        for (j, term) in enumerate(self.block_terms(block)):
+            if term >= raw_term:
+                return block * self.block_size + j if term == raw_term else -1
+        return -1
+
+    def iter_terms(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        # sequential decoding, block after block
+        end = self.terms_number if end is None else end
+        i = start - start % self.block_size
+        for block in range(start // self.block_size, self.blocks_number):
+            for term in self.block_terms(block):
+                if i >= end:
+                    return
+                if i >= start:
+                    yield term
+                i += 1
+
+
+def terms_with_prefix(entries: Any, prefix: str) -> Iterator[str]:
+    # the terms of the entries of an index that start with prefix, in increasing order:
+    # the mapped indexes enumerate a range of their lexicon, the others are scanned
+    if hasattr(entries, "with_prefix"):
+        yield from entries.with_prefix(prefix)
+    else:
+        yield from sorted(t for t in entries if t.startswith(prefix))
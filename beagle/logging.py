@@ -1,6 +1,12 @@
 import functools
 import logging
 import time
+from typing import Callable, List, Optional
+
+# functions called after every timed function, whose non-empty messages are logged
+reporters: List[Callable[[], Optional[str]]] = []
+# functions called with the qualified name and the duration of every timed function
+observers: List[Callable[[str, float], None]] = []
 
 
 def init_logger() -> None:
@@ -10,15 +16,32 @@ def init_logger() -> None:
     )
 
 
+def register_reporter(reporter: Callable[[], Optional[str]]) -> None:
+    reporters.append(reporter)
+
+
+def register_observer(observer: Callable[[str, float], None]) -> None:
+    observers.append(observer)
+
+
+def unregister_observer(observer: Callable[[str, float], None]) -> None:
+    observers.remove(observer)
+
+
 def timer(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         logging.info(f"Beginning to {func.__name__!r}...")
         start_time = time.perf_counter()
         value = func(*args, **kwargs)
-        logging.info(
-            f"Finished to {func.__name__!r} in {time.perf_counter() - start_time:4f}s."
-        )
+        elapsed = time.perf_counter() - start_time
+        logging.info(f"Finished to {func.__name__!r} in {elapsed:4f}s.")
+        for observer in observers:
+            observer(func.__qualname__, elapsed)
+        for reporter in reporters:
+            message = reporter()
+            if message is not None:
+                logging.info(f"Finished to {func.__name__!r}: {message}.")
         return value
 
     return wrapper
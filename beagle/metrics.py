@@ -0,0 +1,275 @@
+from beagle.logging import register_observer, unregister_observer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import bisect
+import threading
+
+# upper bounds (in seconds) of the latency histograms buckets
+LATENCY_BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10]
+
+# whether the hot paths record their metrics: when they are disabled, checking this flag
+# is all that the hooks cost
+enabled: bool = False
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self) -> None:
+        self.value: float = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n: float = 1) -> None:
+        with self.lock:
+            self.value += n
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"value": self.value}
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        return [("", (), self.value)]
+
+
+class Gauge:
+    type = "gauge"
+
+    def __init__(self, function: Optional[Callable[[], float]] = None) -> None:
+        self.current: float = 0
+        # a gauge may also be computed from the state of an object when it is collected
+        self.function: Optional[Callable[[], float]] = function
+
+    def set(self, value: float) -> None:
+        self.current = value
+
+    @property
+    def value(self) -> float:
+        return self.function() if self.function is not None else self.current
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"value": self.value}
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        return [("", (), self.value)]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS) -> None:
+        self.bounds: List[float] = buckets
+        # the last bucket counts the values above the greatest bound
+        self.buckets: List[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self.lock:
+            self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def percentile(self, p: float) -> float:
+        # upper bound of the bucket holding the p-th percentile
+        if self.count == 0:
+            return 0.0
+
+        rank = p * self.count
+        seen = 0
+        for (i, n) in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "buckets": {
+                **{str(bound): n for (bound, n) in zip(self.bounds, self.buckets)},
+                "+inf": self.buckets[-1],
+            },
+        }
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        # the Prometheus buckets are cumulative
+        samples: List[Tuple[str, Labels, float]] = []
+        seen = 0
+        for (bound, n) in zip(self.bounds + ["+Inf"], self.buckets):
+            seen += n
+            samples.append(("_bucket", (("le", str(bound)),), seen))
+
+        return samples + [("_sum", (), self.sum), ("_count", (), self.count)]
+
+
+Metric = Any
+
+
+def format_labels(labels: Labels) -> str:
+    if len(labels) == 0:
+        return ""
+    escaped = [
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for (k, v) in labels
+    ]
+    return "{" + ",".join(f'{k}="{v}"' for (k, v) in escaped) + "}"
+
+
+# the metrics of the process, by name and labels. A metric is created the first time it
+# is asked for, and the same object is returned afterwards.
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Dict[Labels, Metric]] = {}
+        self.helps: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def get(
+        self,
+        name: str,
+        help: str,
+        labels: Optional[Dict[str, str]],
+        factory: Callable[[], Metric],
+    ) -> Metric:
+        key = tuple(sorted((labels or {}).items()))
+        family = self.metrics.get(name)
+        if family is not None and key in family:
+            return family[key]
+
+        with self.lock:
+            family = self.metrics.setdefault(name, {})
+            if key not in family:
+                metric = factory()
+                if len(family) > 0 and next(iter(family.values())).type != metric.type:
+                    raise Exception(f"{name} is already registered as another type")
+                family[key] = metric
+                self.helps[name] = help
+            return family[key]
+
+    def counter(
+        self, name: str, help: str, labels: Optional[Dict[str, str]] = None
+    ) -> Counter:
+        return self.get(name, help, labels, Counter)
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        labels: Optional[Dict[str, str]] = None,
+        function: Optional[Callable[[], float]] = None,
+    ) -> Gauge:
+        gauge = self.get(name, help, labels, Gauge)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Optional[Dict[str, str]] = None,
+        buckets: List[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.get(name, help, labels, lambda: Histogram(buckets))
+
+    def reset(self) -> None:
+        # forgets the values of the metrics, but keeps the objects the hooks refer to
+        with self.lock:
+            for family in self.metrics.values():
+                for metric in family.values():
+                    if isinstance(metric, Histogram):
+                        metric.__init__(metric.bounds)
+                    elif isinstance(metric, Gauge):
+                        metric.current = 0
+                    else:
+                        metric.__init__()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "type": next(iter(family.values())).type,
+                "help": self.helps[name],
+                "values": [
+                    {"labels": dict(key), **metric.to_dict()}
+                    for (key, metric) in family.items()
+                ],
+            }
+            for (name, family) in sorted(self.metrics.items())
+            if len(family) > 0
+        }
+
+    def to_prometheus(self) -> str:
+        # the text exposition format of Prometheus
+        lines: List[str] = []
+        for (name, family) in sorted(self.metrics.items()):
+            if len(family) == 0:
+                continue
+            lines.append(f"# HELP {name} {self.helps[name]}")
+            lines.append(f"# TYPE {name} {next(iter(family.values())).type}")
+            for (key, metric) in family.items():
+                for (suffix, labels, value) in metric.samples():
+                    lines.append(
+                        f"{name}{suffix}{format_labels(key + labels)} {float(value)!r}"
+                    )
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# hot paths counters, created once so that the hooks do not look them up
+postings_scanned = registry.counter(
+    "beagle_postings_scanned_total", "postings read to answer the queries"
+)
+documents_scored = registry.counter(
+    "beagle_documents_scored_total", "documents scored or matched by the queries"
+)
+index_bytes_read = registry.counter(
+    "beagle_index_bytes_read_total", "bytes of encoded postings read from the index"
+)
+query_cache_hits = registry.counter(
+    "beagle_query_cache_hits_total", "queries answered from the results cache"
+)
+query_cache_misses = registry.counter(
+    "beagle_query_cache_misses_total", "queries missing from the results cache"
+)
+wildcard_terms = registry.counter(
+    "beagle_wildcard_terms_total", "terms the wildcards of the queries expanded into"
+)
+fuzzy_terms = registry.counter(
+    "beagle_fuzzy_terms_total", "terms the misspelled terms of the queries matched"
+)
+lemma_cache_hits = registry.counter(
+    "beagle_lemma_cache_hits_total", "tokens whose lemma was found in the cache"
+)
+lemma_cache_misses = registry.counter(
+    "beagle_lemma_cache_misses_total", "tokens lemmatized with WordNet"
+)
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    registry.histogram(
+        "beagle_stage_seconds", "duration of the timed stages", {"stage": name}
+    ).observe(seconds)
+
+
+def enable() -> None:
+    global enabled
+    if not enabled:
+        enabled = True
+        register_observer(observe_stage)
+
+
+def disable() -> None:
+    global enabled
+    if enabled:
+        enabled = False
+        unregister_observer(observe_stage)
@@ -0,0 +1,187 @@
+from typing import Any, Dict, Optional, Tuple
+from beagle.logging import timer
+from beagle.search_engines import DocumentPonderation, TermPonderation
+import json
+import mmap
+import os
+import struct
+import threading
+import numpy as np
+
+NORMS_FILE_NAME = "norms.bin"
+# the norms used to be saved as JSON, and these files are still readable
+LEGACY_NORMS_FILE_NAME = "norms.json"
+
+# binary norms layout: a header, the key of every ponderations pair with the position
+# and lengths of its arrays, then the arrays: the norms of the documents, followed by the
+# minimum and maximum bounds of the terms
+NORMS_MAGIC = b"BGLN"
+NORMS_VERSION = 1
+NORMS_HEADER = struct.Struct("<4sHH")  # magic, version, pairs
+NORMS_RECORD = struct.Struct("<QQQ")  # arrays offset, documents, terms
+NORMS_KEY_LENGTH = struct.Struct("<H")
+NORMS_DTYPE = np.dtype("<f8")
+
+
+def ponderations_key(
+    document_ponderation: DocumentPonderation, term_ponderation: TermPonderation
+) -> str:
+    return f"{document_ponderation.value},{term_ponderation.value}"
+
+
+# euclidean norms of the documents vectors (indexed by doc id), for documents
+# ponderations pairs, along with the bounds of the normalized weight (weight / norm) of
+# every term in a document, as a row of minimums and a row of maximums indexed by term id
+class Norms:
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.documents: Dict[str, np.ndarray] = {}
+        self.bounds: Dict[str, np.ndarray] = {}
+        # the file the norms are read from: only the arrays of the pairs that are used are
+        # mapped, on their first use
+        self.path: Optional[str] = path
+        self.records: Optional[Dict[str, Tuple[int, int, int]]] = None
+        self.data: Any = None
+        # the engines sharing the norms (the ones of the shards of a collection, or the
+        # threads of a server) compute the missing ones one at a time
+        self.lock = threading.Lock()
+
+    def get(
+        self,
+        document_ponderation: DocumentPonderation,
+        term_ponderation: TermPonderation,
+    ) -> Optional[np.ndarray]:
+        key = ponderations_key(document_ponderation, term_ponderation)
+        if key not in self.documents:
+            self.read(key)
+        return self.documents.get(key)
+
+    def set(
+        self,
+        document_ponderation: DocumentPonderation,
+        term_ponderation: TermPonderation,
+        norms: np.ndarray,
+    ) -> None:
+        self.documents[ponderations_key(document_ponderation, term_ponderation)] = norms
+
+    def get_bounds(
+        self,
+        document_ponderation: DocumentPonderation,
+        term_ponderation: TermPonderation,
+    ) -> Optional[np.ndarray]:
+        key = ponderations_key(document_ponderation, term_ponderation)
+        if key not in self.bounds:
+            self.read(key)
+        return self.bounds.get(key)
+
+    def set_bounds(
+        self,
+        document_ponderation: DocumentPonderation,
+        term_ponderation: TermPonderation,
+        bounds: np.ndarray,
+    ) -> None:
+        self.bounds[ponderations_key(document_ponderation, term_ponderation)] = bounds
+
+    def read(self, key: str) -> None:
+        if self.path is None or not os.path.exists(self.path):
+            return
+        if self.records is None:
+            self.open(self.path)
+        if key not in self.records:
+            return
+
+        offset, documents, terms = self.records[key]
+        self.documents[key] = np.frombuffer(
+            self.data, dtype=NORMS_DTYPE, count=documents, offset=offset
+        )
+        self.bounds[key] = np.frombuffer(
+            self.data,
+            dtype=NORMS_DTYPE,
+            count=2 * terms,
+            offset=offset + documents * NORMS_DTYPE.itemsize,
+        ).reshape((2, terms))
+
+    def open(self, path: str) -> None:
+        with open(path, "rb") as f:
+            if f.read(len(NORMS_MAGIC)) != NORMS_MAGIC:
+                f.seek(0)
+                self.records = {}
+                self.load_legacy(json.load(f))
+                return
+
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, pairs = NORMS_HEADER.unpack_from(self.data, 0)
+        if version != NORMS_VERSION:
+            raise Exception(f"{path} is not a supported norms file")
+
+        records = {}
+        pos = NORMS_HEADER.size
+        for _ in range(pairs):
+            (length,) = NORMS_KEY_LENGTH.unpack_from(self.data, pos)
+            pos += NORMS_KEY_LENGTH.size
+            key = self.data[pos : pos + length].decode("utf-8")
+            records[key] = NORMS_RECORD.unpack_from(self.data, pos + length)
+            pos += length + NORMS_RECORD.size
+        self.records = records
+
+    def load_legacy(self, raw: Any) -> None:
+        # the first norms files only stored the documents norms
+        documents = raw["documents"] if "bounds" in raw else raw
+        for key in documents:
+            self.documents.setdefault(key, to_array(documents[key]))
+        # the bounds used to be saved by term, and are computed again on their use
+        for (key, bounds) in raw.get("bounds", {}).items():
+            if isinstance(bounds, list):
+                self.bounds.setdefault(key, np.array(bounds))
+
+    @timer
+    def save(self, path: str) -> None:
+        keys = sorted(key for key in self.documents if key in self.bounds)
+        raw_keys = [key.encode("utf-8") for key in keys]
+
+        offset = NORMS_HEADER.size + sum(
+            NORMS_KEY_LENGTH.size + len(raw_key) + NORMS_RECORD.size
+            for raw_key in raw_keys
+        )
+        # the arrays start on an 8 bytes boundary to be mapped as is
+        padding = -offset % NORMS_DTYPE.itemsize
+        offset += padding
+
+        with open(path, "wb") as f:
+            f.write(NORMS_HEADER.pack(NORMS_MAGIC, NORMS_VERSION, len(keys)))
+            for (key, raw_key) in zip(keys, raw_keys):
+                documents, terms = len(self.documents[key]), self.bounds[key].shape[1]
+                f.write(NORMS_KEY_LENGTH.pack(len(raw_key)) + raw_key)
+                f.write(NORMS_RECORD.pack(offset, documents, terms))
+                offset += (documents + 2 * terms) * NORMS_DTYPE.itemsize
+            f.write(b"\0" * padding)
+            for key in keys:
+                f.write(np.asarray(self.documents[key], dtype=NORMS_DTYPE).tobytes())
+                f.write(np.asarray(self.bounds[key], dtype=NORMS_DTYPE).tobytes())
+
+
+def find_norms_file(dirpath: str) -> str:
+    path = os.path.join(dirpath, NORMS_FILE_NAME)
+    legacy_path = os.path.join(dirpath, LEGACY_NORMS_FILE_NAME)
+    return (
+        legacy_path
+        if not os.path.exists(path) and os.path.exists(legacy_path)
+        else path
+    )
+
+
+def load_norms(path: str) -> Norms:
+    # nothing is read until the norms of a pair are needed, and a missing file gives
+    # empty norms, computed on their first use
+    return Norms(path)
+
+
+def to_array(norms: Any) -> np.ndarray:
+    # the norms used to be saved by doc id rather than as a list
+    if isinstance(norms, list):
+        return np.array(norms)
+
+    array = np.zeros(max((int(id) for id in norms), default=-1) + 1)
+    for (id, n) in norms.items():
+        array[int(id)] = n
+    return array
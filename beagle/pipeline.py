@@ -0,0 +1,150 @@
+from typing import List, Optional, Iterator, Iterable
+from beagle.lemmatizer import lemmatize
+import abc
+import time
+
+# stages are timed every SAMPLING_PERIOD tokens only, to keep the profiling cheap
+SAMPLING_PERIOD = 64
+
+
+class Stage(abc.ABC):
+    def __init__(self) -> None:
+        self.tokens_in: int = 0
+        self.tokens_out: int = 0
+        self.sampled_tokens: int = 0
+        self.sampled_time: float = 0.0
+
+    @abc.abstractmethod
+    def name(self) -> str:
+        raise NotImplementedError
+
+    # returns the transformed token, or None to drop it
+    @abc.abstractmethod
+    def process(self, token: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def elapsed(self) -> float:
+        # extrapolated from the sampled tokens
+        if self.sampled_tokens == 0:
+            return 0.0
+        return self.sampled_time * self.tokens_in / self.sampled_tokens
+
+    def merge(self, stage: "Stage") -> None:
+        self.tokens_in += stage.tokens_in
+        self.tokens_out += stage.tokens_out
+        self.sampled_tokens += stage.sampled_tokens
+        self.sampled_time += stage.sampled_time
+
+    def report(self) -> str:
+        elapsed = self.elapsed()
+        throughput = self.tokens_in / elapsed if elapsed > 0 else 0.0
+        return f"stage {self.name()!r}: {self.tokens_in} tokens in, {self.tokens_out} tokens out, {elapsed:4f}s, {throughput:.0f} tokens/s"
+
+
+class StopWordsFilter(Stage):
+    def __init__(self, stop_words: Iterable[str]) -> None:
+        super().__init__()
+        self.stop_words = frozenset(stop_words)
+
+    def name(self) -> str:
+        return "filter"
+
+    def process(self, token: str) -> Optional[str]:
+        return None if token in self.stop_words else token
+
+
+class Normalizer(Stage):
+    def name(self) -> str:
+        return "normalize"
+
+    def process(self, token: str) -> Optional[str]:
+        return token.lower()
+
+
+class Lemmatizer(Stage):
+    def name(self) -> str:
+        return "lemmatize"
+
+    def process(self, token: str) -> Optional[str]:
+        return lemmatize(token)
+
+
+# reads and splits files into tokens that go through every stage in a single pass,
+# without building any intermediate list
+class Pipeline:
+    def __init__(self, stages: List[Stage]) -> None:
+        self.stages: List[Stage] = stages
+        self.files_number: int = 0
+        self.bytes_number: int = 0
+        self.tokens_number: int = 0
+        self.processed_number: int = 0
+        self.reading_time: float = 0.0
+
+    def tokens(self, path: str) -> Iterator[str]:
+        self.files_number += 1
+
+        with open(path, "r") as f:
+            while True:
+                start_time = time.perf_counter()
+                line = f.readline()
+                if len(line) == 0:
+                    self.reading_time += time.perf_counter() - start_time
+                    break
+                tokens = line.split()
+                self.reading_time += time.perf_counter() - start_time
+                self.bytes_number += len(line)
+                self.tokens_number += len(tokens)
+
+                for token in tokens:
+                    processed = self.process(token)
+                    if processed is not None:
+                        yield processed
+
+    def process(self, token: str) -> Optional[str]:
+        self.processed_number += 1
+        sampled = self.processed_number % SAMPLING_PERIOD == 0
+
+        for stage in self.stages:
+            stage.tokens_in += 1
+            if sampled:
+                start_time = time.perf_counter()
+                processed = stage.process(token)
+                stage.sampled_time += time.perf_counter() - start_time
+                stage.sampled_tokens += 1
+            else:
+                processed = stage.process(token)
+
+            if processed is None:
+                return None
+            stage.tokens_out += 1
+            token = processed
+
+        return token
+
+    def merge(self, pipeline: "Pipeline") -> None:
+        # gathers the counters of a copy of this pipeline that ran in another process
+        self.files_number += pipeline.files_number
+        self.bytes_number += pipeline.bytes_number
+        self.tokens_number += pipeline.tokens_number
+        self.reading_time += pipeline.reading_time
+        for (stage, other) in zip(self.stages, pipeline.stages):
+            stage.merge(other)
+
+    def report(self) -> List[str]:
+        throughput = (
+            self.tokens_number / self.reading_time if self.reading_time > 0 else 0.0
+        )
+        return [
+            f"stage 'read': {self.files_number} files, {self.bytes_number} bytes, {self.tokens_number} tokens, {self.reading_time:4f}s, {throughput:.0f} tokens/s"
+        ] + [stage.report() for stage in self.stages]
+
+
+def default_pipeline(stop_words: Optional[Iterable[str]] = None) -> Pipeline:
+    # the tokens are lowercased first, as the query terms are, and so that they match
+    # the lowercase stop words
+    stages: List[Stage] = [Normalizer()]
+    if stop_words is not None:
+        stages.append(StopWordsFilter(stop_words))
+    stages.append(Lemmatizer())
+
+    return Pipeline(stages)
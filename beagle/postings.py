@@ -0,0 +1,391 @@
+from typing import List, Any, Tuple, Iterator, Dict
+from array import array
+from enum import Enum
+import bisect
+import sys
+import time
+
+# number of postings per block of a compressed postings list
+BLOCK_SIZE = 128
+
+
+class Codec(Enum):
+    RAW = "raw"
+    VBYTE = "vbyte"
+    PACKED = "packed"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+CODEC_CODES = {Codec.RAW: 0, Codec.VBYTE: 1, Codec.PACKED: 2}
+
+
+# integer sequences coding functions
+def vbyte_encode(values: List[int], out: bytearray) -> None:
+    for v in values:
+        while v >= 0x80:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+
+
+def vbyte_decode(data: bytes, pos: int, n: int) -> Tuple[List[int], int]:
+    values: List[int] = []
+
+    while len(values) < n:
+        v = 0
+        shift = 0
+        b = data[pos]
+        while b & 0x80:
+            v |= (b & 0x7F) << shift
+            shift += 7
+            pos += 1
+            b = data[pos]
+        values.append(v | (b << shift))
+        pos += 1
+
+    return values, pos
+
+
+def pack_encode(values: List[int], out: bytearray) -> None:
+    # every chunk of BLOCK_SIZE values is packed with the bit width of its largest value
+    for start in range(0, len(values), BLOCK_SIZE):
+        chunk = values[start : start + BLOCK_SIZE]
+        width = max(chunk).bit_length()
+        out.append(width)
+
+        packed = 0
+        for (i, v) in enumerate(chunk):
+            packed |= v << (i * width)
+        out += packed.to_bytes((len(chunk) * width + 7) // 8, "little")
+
+
+def pack_decode(data: bytes, pos: int, n: int) -> Tuple[List[int], int]:
+    values: List[int] = []
+
+    while len(values) < n:
+        count = min(BLOCK_SIZE, n - len(values))
+        width = data[pos]
+        pos += 1
+
+        length = (count * width + 7) // 8
+        packed = int.from_bytes(data[pos : pos + length], "little")
+        mask = (1 << width) - 1
+        for _ in range(count):
+            values.append(packed & mask)
+            packed >>= width
+        pos += length
+
+    return values, pos
+
+
+def raw_encode(values: List[int], out: bytearray) -> None:
+    a = array("I", values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    out += a.tobytes()
+
+
+def raw_decode(data: bytes, pos: int, n: int) -> Tuple[List[int], int]:
+    a = array("I")
+    a.frombytes(data[pos : pos + 4 * n])
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tolist(), pos + 4 * n
+
+
+INTEGERS_ENCODERS = {
+    Codec.RAW: raw_encode,
+    Codec.VBYTE: vbyte_encode,
+    Codec.PACKED: pack_encode,
+}
+INTEGERS_DECODERS = {
+    Codec.RAW: raw_decode,
+    Codec.VBYTE: vbyte_decode,
+    Codec.PACKED: pack_decode,
+}
+
+
+def gallop(values: List[int], target: int, start: int = 0) -> int:
+    # index of the first value not lower than target in values[start:], found with an
+    # exponential search whose cost grows with the distance skipped, not with len(values)
+    if start >= len(values) or values[start] >= target:
+        return start
+
+    step = 1
+    while start + step < len(values) and values[start + step] < target:
+        start += step
+        step *= 2
+
+    return bisect.bisect_left(
+        values, target, start + 1, min(start + step + 1, len(values))
+    )
+
+
+def deltas(values: List[int], previous: int = 0) -> List[int]:
+    gaps: List[int] = []
+
+    for v in values:
+        if v < previous:
+            raise Exception(f"values must be sorted to be delta-encoded: {v}")
+        gaps.append(v - previous)
+        previous = v
+
+    return gaps
+
+
+def prefix_sums(gaps: List[int], previous: int = 0) -> List[int]:
+    values: List[int] = []
+
+    for g in gaps:
+        previous += g
+        values.append(previous)
+
+    return values
+
+
+# postings lists coding functions
+#
+# A raw postings list is a flat sequence of fixed-width integers (ids, frequencies and
+# positions interleaved). The other codecs cut it in blocks of BLOCK_SIZE postings, each
+# one starting with a variable-byte header (postings number, last doc id, payload length)
+# followed by the delta-encoded doc ids, the frequencies and the positions (delta-encoded
+# within each document). The header enables to skip a block without decoding it.
+def encode_postings(
+    postings: List[Any], frequencies: bool, positions: bool, codec: Codec
+) -> bytes:
+    out = bytearray()
+
+    if codec == Codec.RAW:
+        if not frequencies:
+            raw_encode(postings, out)
+        else:
+            values: List[int] = []
+            for p in postings:
+                values.append(p[0])
+                values.append(p[1])
+                if positions:
+                    values.extend(p[2])
+            raw_encode(values, out)
+        return bytes(out)
+
+    last_id = 0
+    for start in range(0, len(postings), BLOCK_SIZE):
+        block = postings[start : start + BLOCK_SIZE]
+        last_id = encode_block(block, last_id, frequencies, positions, codec, out)
+
+    return bytes(out)
+
+
+def encode_block(
+    block: List[Any],
+    previous_id: int,
+    frequencies: bool,
+    positions: bool,
+    codec: Codec,
+    out: bytearray,
+) -> int:
+    encode = INTEGERS_ENCODERS[codec]
+    ids = [p[0] for p in block] if frequencies else block
+
+    payload = bytearray()
+    encode(deltas(ids, previous_id), payload)
+    if frequencies:
+        encode([p[1] for p in block], payload)
+    if positions:
+        gaps: List[int] = []
+        for p in block:
+            gaps.extend(deltas(p[2]))
+        positions_payload = bytearray()
+        encode(gaps, positions_payload)
+        vbyte_encode([len(positions_payload)], payload)
+        payload += positions_payload
+
+    vbyte_encode([len(block), ids[-1], len(payload)], out)
+    out += payload
+
+    return ids[-1]
+
+
+def concatenate_postings(
+    chunks: List[bytes], frequencies: bool, positions: bool, codec: Codec
+) -> bytes:
+    # every chunk must only hold doc ids greater than the ones of the previous chunks
+    if codec == Codec.RAW:
+        return b"".join(chunks)
+
+    out = bytearray()
+    last_id = 0
+    for data in chunks:
+        blocks = iter_blocks(data)
+        first_block = next(blocks, None)
+        if first_block is None:
+            continue
+
+        # only the first block depends on the previous chunk, through its first gap
+        encode_block(
+            decode_block(data, first_block, 0, frequencies, positions, codec),
+            last_id,
+            frequencies,
+            positions,
+            codec,
+            out,
+        )
+        end = first_block.offset + first_block.length
+        out += data[end:]
+
+        last_id = first_block.last_id
+        for block in blocks:
+            last_id = block.last_id
+
+    return bytes(out)
+
+
+class PostingsBlock:
+    def __init__(self, count: int, last_id: int, offset: int, length: int) -> None:
+        self.count: int = count
+        self.last_id: int = last_id
+        # position and length of the block payload in the encoded data
+        self.offset: int = offset
+        self.length: int = length
+
+
+def iter_blocks(data: bytes) -> Iterator[PostingsBlock]:
+    pos = 0
+    while pos < len(data):
+        (count, last_id, length), pos = vbyte_decode(data, pos, 3)
+        yield PostingsBlock(count, last_id, pos, length)
+        pos += length
+
+
+def decode_block(
+    data: bytes,
+    block: PostingsBlock,
+    previous_id: int,
+    frequencies: bool,
+    positions: bool,
+    codec: Codec,
+) -> List[Any]:
+    decode = INTEGERS_DECODERS[codec]
+
+    gaps, pos = decode(data, block.offset, block.count)
+    ids = prefix_sums(gaps, previous_id)
+    if not frequencies:
+        return ids
+
+    freqs, pos = decode(data, pos, block.count)
+    if not positions:
+        return list(zip(ids, freqs))
+
+    _, pos = vbyte_decode(data, pos, 1)
+    gaps, pos = decode(data, pos, sum(freqs))
+
+    postings: List[Any] = []
+    i = 0
+    for (id, f) in zip(ids, freqs):
+        postings.append((id, f, prefix_sums(gaps[i : i + f])))
+        i += f
+
+    return postings
+
+
+def decode_postings(
+    data: bytes, frequencies: bool, positions: bool, codec: Codec
+) -> List[Any]:
+    if codec == Codec.RAW:
+        values, _ = raw_decode(data, 0, len(data) // 4)
+        if not frequencies:
+            return values
+        elif not positions:
+            return list(zip(values[0::2], values[1::2]))
+
+        postings: List[Any] = []
+        i = 0
+        while i < len(values):
+            f = values[i + 1]
+            postings.append((values[i], f, values[i + 2 : i + 2 + f]))
+            i += 2 + f
+        return postings
+
+    postings = []
+    last_id = 0
+    for block in iter_blocks(data):
+        postings.extend(
+            decode_block(data, block, last_id, frequencies, positions, codec)
+        )
+        last_id = block.last_id
+
+    return postings
+
+
+def decode_doc_ids(
+    data: bytes, frequencies: bool, positions: bool, codec: Codec
+) -> List[int]:
+    if codec == Codec.RAW:
+        postings = decode_postings(data, frequencies, positions, codec)
+        return [p[0] for p in postings] if frequencies else postings
+
+    ids: List[int] = []
+    last_id = 0
+    for block in iter_blocks(data):
+        gaps, _ = INTEGERS_DECODERS[codec](data, block.offset, block.count)
+        ids.extend(prefix_sums(gaps, last_id))
+        last_id = block.last_id
+
+    return ids
+
+
+def decode_positions(data: bytes, ids: List[int], codec: Codec) -> List[List[int]]:
+    # positions of a positions postings list in the given sorted documents, which must
+    # all appear in it: only the blocks holding one of them are decoded
+    if codec == Codec.RAW:
+        postings = decode_postings(data, True, True, codec)
+        positions = {p[0]: p[2] for p in postings}
+        return [positions[id] for id in ids]
+
+    result: List[List[int]] = []
+    i = 0
+    last_id = 0
+    for block in iter_blocks(data):
+        if i == len(ids):
+            break
+        if ids[i] > block.last_id:
+            last_id = block.last_id
+            continue
+
+        postings = decode_block(data, block, last_id, True, True, codec)
+        j = 0
+        while i < len(ids) and ids[i] <= block.last_id:
+            while postings[j][0] < ids[i]:
+                j += 1
+            result.append(postings[j][2])
+            i += 1
+        last_id = block.last_id
+
+    return result
+
+
+def benchmark_codec(
+    postings_lists: List[List[Any]], frequencies: bool, positions: bool, codec: Codec
+) -> Dict[str, float]:
+    encoded = [
+        encode_postings(postings, frequencies, positions, codec)
+        for postings in postings_lists
+    ]
+    postings_number = sum(len(postings) for postings in postings_lists)
+    bytes_number = sum(len(data) for data in encoded)
+
+    start_time = time.perf_counter()
+    for data in encoded:
+        decode_postings(data, frequencies, positions, codec)
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "codec": codec.value,
+        "postings": postings_number,
+        "bytes": bytes_number,
+        "bytes_per_posting": bytes_number / max(postings_number, 1),
+        "decode_seconds": elapsed,
+        "postings_per_second": postings_number / elapsed if elapsed > 0 else 0.0,
+    }
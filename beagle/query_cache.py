@@ -0,0 +1,82 @@
+from typing import Dict, Optional, Tuple, Any
+from collections import OrderedDict
+from beagle import metrics
+import sys
+import threading
+
+# estimated memory used by a result (an int key and a float value) in a results dict
+RESULT_MEMORY_COST = 60
+
+
+def results_size(key: Tuple[Any, ...], results: Dict[int, float]) -> int:
+    return (
+        sys.getsizeof(key)
+        + sum(sys.getsizeof(k) for k in key)
+        + sys.getsizeof(results)
+        + RESULT_MEMORY_COST * len(results)
+    )
+
+
+# LRU cache of queries results, bounded by a number of entries and by an estimation of
+# the memory they use
+class QueryCache:
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+        self.entries: Dict[
+            Tuple[Any, ...], Tuple[Dict[int, float], int]
+        ] = OrderedDict()
+        self.bytes_number: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.invalidations: int = 0
+        # the engines of a server may use the cache from several threads
+        self.lock = threading.Lock()
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[Dict[int, float]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                if metrics.enabled:
+                    metrics.query_cache_misses.inc()
+                return None
+
+            self.hits += 1
+            if metrics.enabled:
+                metrics.query_cache_hits.inc()
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Tuple[Any, ...], results: Dict[int, float]) -> None:
+        size = results_size(key, results)
+        # a result bigger than the whole cache would only evict everything else
+        if size > self.max_bytes or self.max_entries == 0:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.bytes_number -= self.entries.pop(key)[1]
+            self.entries[key] = (results, size)
+            self.bytes_number += size
+
+            while (
+                len(self.entries) > self.max_entries
+                or self.bytes_number > self.max_bytes
+            ):
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.bytes_number -= evicted_size
+
+    def clear(self) -> None:
+        with self.lock:
+            if len(self.entries) > 0:
+                self.invalidations += 1
+            self.entries.clear()
+            self.bytes_number = 0
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def report(self) -> str:
+        return f"query cache: {len(self.entries)} entries, {self.bytes_number} bytes, {self.hits} hits, {self.misses} misses, {100 * self.hit_rate():.1f}% hit rate, {self.invalidations} invalidations"
@@ -0,0 +1,312 @@
+from beagle.bitmap import Bitmap
+from beagle.postings import gallop
+from typing import Callable, List, Dict, Optional
+import abc
+import tt
+
+# A plan is the tree of a boolean query rewritten to be evaluated cheaply: nested AND
+# and OR chains are flattened, the operands of an AND are intersected from the rarest
+# term to the most common one, and the excluded operands (NAND, AND NOT) are removed
+# from the intersection in the same pass instead of being evaluated on their own.
+#
+# The cost of a plan is the number of postings it reads, and its estimate the number of
+# documents it may match, both derived from the documents frequencies of its terms.
+class Plan(abc.ABC):
+    def __init__(self, estimate: int, cost: int) -> None:
+        self.estimate: int = estimate
+        self.cost: int = cost
+
+    # the candidates, when given, are a superset of the documents the caller keeps from
+    # the result: a plan may only look for its matches among them
+    @abc.abstractmethod
+    def evaluate(
+        self,
+        term_bitmap: Callable[[str], Bitmap],
+        candidates: Optional[Bitmap] = None,
+    ) -> Bitmap:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def explain(self, depth: int = 0) -> List[str]:
+        raise NotImplementedError
+
+
+class TermPlan(Plan):
+    def __init__(self, term: str, df: int) -> None:
+        super().__init__(df, df)
+        self.term: str = term
+
+    def evaluate(
+        self,
+        term_bitmap: Callable[[str], Bitmap],
+        candidates: Optional[Bitmap] = None,
+    ) -> Bitmap:
+        # an unknown term does not even need to be looked up
+        if self.estimate == 0:
+            return Bitmap()
+        return term_bitmap(self.term)
+
+    def explain(self, depth: int = 0) -> List[str]:
+        return [f"{'  ' * depth}{self.term} (df: {self.estimate})"]
+
+
+class AndPlan(Plan):
+    def __init__(self, operands: List[Plan], excluded: List[Plan]) -> None:
+        self.operands: List[Plan] = sorted(operands, key=lambda p: p.estimate)
+        self.excluded: List[Plan] = sorted(excluded, key=lambda p: p.estimate)
+
+        # the documents matching none of the operands of a negation cannot be listed
+        estimate = self.operands[0].estimate if len(self.operands) > 0 else 0
+        if estimate == 0:
+            cost = self.operands[0].cost if len(self.operands) > 0 else 0
+        else:
+            cost = sum(p.cost for p in self.operands + self.excluded)
+        super().__init__(estimate, cost)
+
+    def evaluate(
+        self,
+        term_bitmap: Callable[[str], Bitmap],
+        candidates: Optional[Bitmap] = None,
+    ) -> Bitmap:
+        if len(self.operands) == 0:
+            return Bitmap()
+
+        result = self.operands[0].evaluate(term_bitmap, candidates)
+        # the evaluation stops as soon as the intersection is empty
+        for p in self.operands[1:]:
+            if not result:
+                return result
+            result = result & p.evaluate(term_bitmap, result)
+        for p in self.excluded:
+            if not result:
+                return result
+            result = result - p.evaluate(term_bitmap, result)
+
+        return result
+
+    def explain(self, depth: int = 0) -> List[str]:
+        lines = [
+            f"{'  ' * depth}AND (estimated documents: {self.estimate}, cost: {self.cost})"
+        ]
+        for p in self.operands:
+            lines.extend(p.explain(depth + 1))
+        for p in self.excluded:
+            lines.append(f"{'  ' * (depth + 1)}NOT")
+            lines.extend(p.explain(depth + 2))
+
+        return lines
+
+
+class OrPlan(Plan):
+    def __init__(self, operands: List[Plan]) -> None:
+        self.operands: List[Plan] = sorted(operands, key=lambda p: p.estimate)
+        super().__init__(
+            sum(p.estimate for p in self.operands), sum(p.cost for p in self.operands)
+        )
+
+    def evaluate(
+        self,
+        term_bitmap: Callable[[str], Bitmap],
+        candidates: Optional[Bitmap] = None,
+    ) -> Bitmap:
+        result = Bitmap()
+        for p in self.operands:
+            if p.estimate > 0:
+                result = result | p.evaluate(term_bitmap, candidates)
+
+        return result
+
+    def explain(self, depth: int = 0) -> List[str]:
+        lines = [
+            f"{'  ' * depth}OR (estimated documents: {self.estimate}, cost: {self.cost})"
+        ]
+        for p in self.operands:
+            lines.extend(p.explain(depth + 1))
+
+        return lines
+
+
+# a phrase ("a b c": consecutive terms, in this order) or a proximity clause (a NEAR/k
+# b: terms at most k positions apart, in any order). The doc ids of the terms are
+# intersected first, so only the documents that contain all of them have their
+# positions decoded and scanned.
+class ProximityPlan(Plan):
+    def __init__(
+        self,
+        terms: List[str],
+        dfs: List[int],
+        distance: Optional[int],
+        positions: Callable[[str, List[int]], List[List[int]]],
+    ) -> None:
+        self.terms: List[str] = terms
+        self.dfs: List[int] = dfs
+        # a None distance stands for a phrase
+        self.distance: Optional[int] = distance
+        self.positions: Callable[[str, List[int]], List[List[int]]] = positions
+        super().__init__(min(dfs), sum(dfs) if min(dfs) > 0 else 0)
+
+    def evaluate(
+        self,
+        term_bitmap: Callable[[str], Bitmap],
+        candidates: Optional[Bitmap] = None,
+    ) -> Bitmap:
+        if self.estimate == 0:
+            return Bitmap()
+
+        ordered = sorted(set(self.terms), key=lambda t: self.dfs[self.terms.index(t)])
+        result = term_bitmap(ordered[0])
+        if candidates is not None:
+            result = result & candidates
+        for term in ordered[1:]:
+            if not result:
+                return result
+            result = result & term_bitmap(term)
+        if not result:
+            return result
+
+        ids = result.to_list()
+        positions: Dict[str, List[List[int]]] = {
+            term: self.positions(term, ids) for term in ordered
+        }
+        matched: List[int] = []
+        for (i, id) in enumerate(ids):
+            lists = [positions[term][i] for term in self.terms]
+            if self.distance is None:
+                found = match_phrase(lists)
+            else:
+                found = match_near(lists[0], lists[1], self.distance)
+            if found:
+                matched.append(id)
+
+        return Bitmap.from_ids(matched)
+
+    def explain(self, depth: int = 0) -> List[str]:
+        if self.distance is None:
+            operator = "PHRASE"
+        else:
+            operator = f"NEAR/{self.distance}"
+        lines = [
+            f"{'  ' * depth}{operator} (estimated documents: {self.estimate}, cost: {self.cost})"
+        ]
+        for (term, df) in zip(self.terms, self.dfs):
+            lines.append(f"{'  ' * (depth + 1)}{term} (df: {df})")
+
+        return lines
+
+
+def match_phrase(positions: List[List[int]]) -> bool:
+    # looks for a start x such that x + i is a position of the i-th term, trying the
+    # starts given by the rarest term and galloping through the other lists
+    cursors = [0] * len(positions)
+    r = min(range(len(positions)), key=lambda i: len(positions[i]))
+
+    for p in positions[r]:
+        start = p - r
+        if start < 0:
+            continue
+
+        found = True
+        for (i, values) in enumerate(positions):
+            if i == r:
+                continue
+            cursors[i] = gallop(values, start + i, cursors[i])
+            if cursors[i] == len(values):
+                return False
+            if values[cursors[i]] != start + i:
+                found = False
+                break
+        if found:
+            return True
+
+    return False
+
+
+def match_near(a: List[int], b: List[int], distance: int) -> bool:
+    if len(a) > len(b):
+        a, b = b, a
+
+    j = 0
+    for x in a:
+        j = gallop(b, x - distance, j)
+        if j == len(b):
+            return False
+        if b[j] <= x + distance:
+            return True
+
+    return False
+
+
+def flatten(node: tt.ExpressionTreeNode, operator: str) -> List[tt.ExpressionTreeNode]:
+    # the operands of a chain of the same operator, such as ((a AND b) AND c)
+    if node._symbol_name != operator:
+        return [node]
+    return flatten(node._l_child, operator) + flatten(node._r_child, operator)
+
+
+def plan_query(
+    node: tt.ExpressionTreeNode,
+    df: Callable[[str], int],
+    clauses: Optional[Dict[str, Plan]] = None,
+) -> Plan:
+    # the clauses are the plans of the operands that tt cannot parse (the phrases and
+    # the proximity clauses), replaced by placeholder symbols in the expression
+    clauses = clauses if clauses is not None else {}
+
+    if node._symbol_name == "AND":
+        operands: List[Plan] = []
+        excluded: List[Plan] = []
+        for child in flatten(node, "AND"):
+            if child._symbol_name == "NOT":
+                excluded.append(plan_query(child._l_child, df, clauses))
+            else:
+                operands.append(plan_query(child, df, clauses))
+        return AndPlan(operands, excluded)
+    elif node._symbol_name == "NAND":
+        # `a NAND b` keeps the documents of a that do not match b
+        left = plan_query(node._l_child, df, clauses)
+        right = plan_query(node._r_child, df, clauses)
+        if isinstance(left, AndPlan):
+            return AndPlan(left.operands, left.excluded + [right])
+        return AndPlan([left], [right])
+    elif node._symbol_name == "OR":
+        return OrPlan([plan_query(child, df, clauses) for child in flatten(node, "OR")])
+    elif node._symbol_name == "NOT":
+        return AndPlan([], [plan_query(node._l_child, df, clauses)])
+    elif node._symbol_name in clauses:
+        return clauses[node._symbol_name]
+
+    return TermPlan(node._symbol_name, df(node._symbol_name))
+
+
+def canonical_query(
+    node: tt.ExpressionTreeNode, clauses: Optional[Dict[str, Plan]] = None
+) -> str:
+    # a string shared by the expressions that only differ by the order or the nesting
+    # of the operands of their AND and OR chains
+    clauses = clauses if clauses is not None else {}
+
+    if node._symbol_name in ["AND", "OR"]:
+        operands = sorted(
+            canonical_query(child, clauses)
+            for child in flatten(node, node._symbol_name)
+        )
+        return "(" + f" {node._symbol_name} ".join(operands) + ")"
+    elif node._symbol_name == "NAND":
+        left = canonical_query(node._l_child, clauses)
+        right = canonical_query(node._r_child, clauses)
+        return f"({left} NAND {right})"
+    elif node._symbol_name == "NOT":
+        return f"(NOT {canonical_query(node._l_child, clauses)})"
+    elif node._symbol_name in clauses:
+        clause = clauses[node._symbol_name]
+        if isinstance(clause, TermPlan):
+            return clause.term
+        elif isinstance(clause, OrPlan):
+            # the terms a wildcard was expanded into
+            return "(" + " OR ".join(sorted(p.term for p in clause.operands)) + ")"
+        elif clause.distance is None:
+            return '"' + " ".join(clause.terms) + '"'
+        # a proximity clause does not depend on the order of its terms
+        return f" NEAR/{clause.distance} ".join(sorted(clause.terms))
+
+    return node._symbol_name
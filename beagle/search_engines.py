@@ -1,6 +1,7 @@
 from enum import Enum
 import abc
-from typing import Dict
+from beagle.query_cache import QueryCache
+from typing import Dict, Optional, Tuple, Any
 
 
 class EngineType(Enum):
@@ -32,8 +33,69 @@ class TermPonderation(Enum):
 
 
 class SearchEngine(abc.ABC):
+    # results cache, that can be shared by several engines
+    cache: Optional[QueryCache] = None
+
+    # returns the (k best, if k is given) matching documents ids, ordered by scores
+    @abc.abstractmethod
+    def query(self, query: str, k: Optional[int] = None) -> Dict[int, float]:
+        raise NotImplementedError
+
+    # same as query, through the results cache if the engine has one
+    def search(self, query: str, k: Optional[int] = None) -> Dict[int, float]:
+        if self.cache is None:
+            return self.query(query, k)
+
+        # the query is processed once, for both its cache key and its evaluation
+        processed = self.process_query(query)
+        key = self.cache_key(processed, k)
+        results = self.cache.get(key)
+        if results is None:
+            results = self.evaluate(processed, k)
+            self.cache.put(key, results)
+
+        # the cached results are shared by all the searches of the query
+        return dict(results)
+
+    def cache_key(self, processed: Any, k: Optional[int]) -> Tuple[Any, ...]:
+        return (
+            self.type().value,
+            *[str(ponderation) for ponderation in self.ponderations()],
+            self.normalize_processed_query(processed),
+            k,
+        )
+
+    # the form of a query the engine evaluates, the query itself by default
+    def process_query(self, query: str) -> Any:
+        return query
+
+    # same as query, for a processed query
+    def evaluate(self, processed: Any, k: Optional[int] = None) -> Dict[int, float]:
+        return self.query(processed, k)
+
+    # same as normalize_query, for a processed query
+    def normalize_processed_query(self, processed: Any) -> str:
+        return self.normalize_query(processed)
+
+    def invalidate_cache(self) -> None:
+        if self.cache is not None:
+            self.cache.clear()
+
+    # a canonical form of the query, that equivalent queries share
+    @abc.abstractmethod
+    def normalize_query(self, query: str) -> str:
+        raise NotImplementedError
+
+    # the document, term, query and query term ponderations of the engine
     @abc.abstractmethod
-    def query(self, query: str) -> Dict[int, float]:
+    def ponderations(
+        self,
+    ) -> Tuple[
+        Optional[DocumentPonderation],
+        Optional[TermPonderation],
+        Optional[DocumentPonderation],
+        Optional[TermPonderation],
+    ]:
         raise NotImplementedError
 
     @abc.abstractmethod
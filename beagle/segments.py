@@ -0,0 +1,677 @@
+from beagle.logging import timer
+from beagle.collection import Collection, Shard, Document
+from beagle.pipeline import Pipeline
+from beagle.index import (
+    InvertedIndex,
+    InvertedIndexType,
+    IndexFormat,
+    INDEX_FILE_NAMES,
+    MappedEntries,
+    LazyEntry,
+    BinaryIndexWriter,
+    DocIndex,
+    DOC_INDEX_FILE_NAME,
+    postings_layout,
+    load_doc_index,
+)
+from beagle.postings import Codec, decode_postings
+from beagle.stats import Stats, STATS_FILE_NAME, load_stats
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+import contextlib
+import fcntl
+import heapq
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+
+# An incremental index is a list of immutable segments, each one a small binary index
+# with its own stats and doc index. The documents of a segment that were changed or
+# removed since it was written are tombstoned in the manifest instead of being rewritten,
+# and the segments are merged together by size tiers in the background.
+#
+# segments.json (the manifest) is the commit point: it is replaced atomically once the
+# files it refers to are written, so a reader always sees a consistent set of segments.
+SEGMENTS_FILE_NAME = "segments.json"
+# the id, fingerprint and segment of every indexed file, only read by the writers
+DOCUMENTS_FILE_NAME = "documents.json"
+SEGMENTS_DIR_NAME = "segments"
+LOCK_FILE_NAME = "segments.lock"
+MANIFEST_VERSION = 1
+
+DEFAULT_MERGE_FACTOR = 10
+# a segment is rewritten on its own once most of its documents are deleted
+MAX_DELETED_RATIO = 0.5
+
+
+class Segment:
+    def __init__(
+        self, name: str, documents: int, deleted: Optional[Set[int]] = None
+    ) -> None:
+        self.name: str = name
+        self.documents: int = documents
+        self.deleted: Set[int] = deleted if deleted is not None else set()
+
+    def live(self) -> int:
+        return self.documents - len(self.deleted)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "documents": self.documents,
+            "deleted": sorted(self.deleted),
+        }
+
+    @staticmethod
+    def from_dict(raw: Dict[str, Any]) -> "Segment":
+        return Segment(raw["name"], raw["documents"], set(raw["deleted"]))
+
+
+class Manifest:
+    def __init__(self, index_type: InvertedIndexType, codec: Codec) -> None:
+        self.type: InvertedIndexType = index_type
+        self.codec: Codec = codec
+        # incremented on every change, so that the readers know when to reload
+        self.generation: int = 0
+        self.next_segment: int = 0
+        self.segments: List[Segment] = []
+        # shard name -> file name -> [id, fingerprint, segment name]
+        self.documents: Dict[str, Dict[str, List[Any]]] = {}
+
+    def segment(self, name: str) -> Segment:
+        for s in self.segments:
+            if s.name == name:
+                return s
+        raise Exception(f"unknown segment: {name}")
+
+    def new_segment_name(self) -> str:
+        name = f"segment-{self.next_segment:06d}"
+        self.next_segment += 1
+        return name
+
+    def save(self, path: str) -> None:
+        # the documents are written first, since the manifest is the commit point
+        write_atomically(os.path.join(path, DOCUMENTS_FILE_NAME), self.documents)
+        write_atomically(
+            os.path.join(path, SEGMENTS_FILE_NAME),
+            {
+                "version": MANIFEST_VERSION,
+                "type": self.type.value,
+                "codec": self.codec.value,
+                "generation": self.generation,
+                "next_segment": self.next_segment,
+                "segments": [s.to_dict() for s in self.segments],
+            },
+        )
+
+
+def write_atomically(path: str, content: Any) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(content, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_manifest(path: str, documents: bool = True) -> Optional[Manifest]:
+    # the readers do not need the documents of the manifest, only its segments
+    manifest_path = os.path.join(path, SEGMENTS_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path, "r") as f:
+        raw = json.load(f)
+    if raw["version"] != MANIFEST_VERSION:
+        raise Exception(f"{manifest_path} is not a supported segments manifest")
+
+    manifest = Manifest(InvertedIndexType(raw["type"]), Codec(raw["codec"]))
+    manifest.generation = raw["generation"]
+    manifest.next_segment = raw["next_segment"]
+    manifest.segments = [Segment.from_dict(s) for s in raw["segments"]]
+    if documents:
+        with open(os.path.join(path, DOCUMENTS_FILE_NAME), "r") as f:
+            manifest.documents = json.load(f)
+
+    return manifest
+
+
+def has_segments(path: str) -> bool:
+    return os.path.exists(os.path.join(path, SEGMENTS_FILE_NAME))
+
+
+def remove_segments(path: str) -> None:
+    for name in [SEGMENTS_FILE_NAME, DOCUMENTS_FILE_NAME, LOCK_FILE_NAME]:
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
+    shutil.rmtree(os.path.join(path, SEGMENTS_DIR_NAME), ignore_errors=True)
+
+
+def segment_path(path: str, name: str) -> str:
+    return os.path.join(path, SEGMENTS_DIR_NAME, name)
+
+
+@contextlib.contextmanager
+def writer_lock(path: str) -> Iterator[None]:
+    # a single process at a time may add or merge segments
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE_NAME), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def file_fingerprint(path: str) -> str:
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def scan_dataset(dataset: str) -> Dict[str, Dict[str, str]]:
+    # the fingerprint of every file, by shard
+    files: Dict[str, Dict[str, str]] = {}
+    for d in os.scandir(dataset):
+        if d.is_dir():
+            files[d.name] = {
+                f.name: file_fingerprint(f.path)
+                for f in os.scandir(d.path)
+                if f.is_file()
+            }
+
+    return files
+
+
+def free_ids(used: Set[int]) -> Iterator[int]:
+    # the ids that no live document holds, the lowest first, so that ids stay dense
+    id = 0
+    while True:
+        if id not in used:
+            yield id
+        id += 1
+
+
+def drop_empty_segments(manifest: Manifest) -> List[str]:
+    empty = [s.name for s in manifest.segments if s.live() == 0]
+    manifest.segments = [s for s in manifest.segments if s.live() > 0]
+    return empty
+
+
+@timer
+def add_segment(
+    dataset: str,
+    path: str,
+    index_type: InvertedIndexType,
+    pipeline: Pipeline,
+    codec: Codec = Codec.VBYTE,
+) -> Optional[Segment]:
+    # indexes the files of the dataset that are new or changed since the last call in a
+    # new segment, and tombstones the previous versions of the changed or removed files
+    with writer_lock(path):
+        manifest = load_manifest(path)
+        if manifest is None:
+            manifest = Manifest(index_type, codec)
+        elif manifest.type != index_type or manifest.codec != codec:
+            raise Exception(
+                f"the segments of {path} are a {manifest.type} index with the {manifest.codec} codec"
+            )
+
+        files = scan_dataset(dataset)
+        shard_names = sorted(set(files) | set(manifest.documents), key=int)
+        deletions = 0
+        for shard_name in shard_names:
+            current = files.get(shard_name, {})
+            records = manifest.documents.setdefault(shard_name, {})
+            for name in list(records):
+                id, fingerprint, segment_name = records[name]
+                if current.get(name) != fingerprint:
+                    manifest.segment(segment_name).deleted.add(id)
+                    deletions += 1
+                    if name not in current:
+                        del records[name]
+
+        # the ids of the removed files are reused by the new ones
+        ids = free_ids(
+            {
+                record[0]
+                for records in manifest.documents.values()
+                for record in records.values()
+            }
+        )
+        documents: List[Tuple[str, Document]] = []
+        for shard_name in shard_names:
+            current = files.get(shard_name, {})
+            records = manifest.documents[shard_name]
+            added = 0
+            for name in sorted(current):
+                record = records.get(name)
+                if record is not None and record[1] == current[name]:
+                    continue
+                # a changed file keeps its id, which stays tombstoned in its old segment
+                id = record[0] if record is not None else next(ids)
+                documents.append(
+                    (
+                        shard_name,
+                        Document(name, os.path.join(dataset, shard_name, name), id),
+                    )
+                )
+                added += 1
+
+            if len(records) == 0 and added == 0:
+                del manifest.documents[shard_name]
+
+        segment: Optional[Segment] = None
+        if len(documents) > 0:
+            # the reused ids of a shard may be lower than the ones of the previous
+            # shards, so the documents are indexed as a single shard in the ids order
+            documents.sort(key=lambda item: item[1].id)
+            shard = Shard("segment", dataset)
+            shard.documents = [d for (_, d) in documents]
+            collection = Collection("segment", dataset)
+            collection.shards = [shard]
+            index, stats = collection.index_stream(index_type, pipeline)
+
+            segment = Segment(manifest.new_segment_name(), stats.documents_number)
+            dirpath = segment_path(path, segment.name)
+            index.save(
+                os.path.join(dirpath, INDEX_FILE_NAMES[IndexFormat.BINARY]),
+                IndexFormat.BINARY,
+                codec,
+            )
+            stats.save(os.path.join(dirpath, STATS_FILE_NAME))
+            collection.get_doc_index().save(os.path.join(dirpath, DOC_INDEX_FILE_NAME))
+
+            manifest.segments.append(segment)
+            for (shard_name, d) in documents:
+                manifest.documents[shard_name][d.name] = [
+                    d.id,
+                    files[shard_name][d.name],
+                    segment.name,
+                ]
+
+        if segment is None and deletions == 0:
+            return None
+
+        removed = drop_empty_segments(manifest)
+        manifest.generation += 1
+        manifest.save(path)
+        for name in removed:
+            shutil.rmtree(segment_path(path, name), ignore_errors=True)
+
+        return segment
+
+
+def merge_tier(documents: int, merge_factor: int) -> int:
+    return int(math.log(max(documents, 1), merge_factor))
+
+
+def plan_merges(segments: List[Segment], merge_factor: int) -> List[List[Segment]]:
+    # tiered merge policy: the segments whose live documents numbers have the same order
+    # of magnitude (in base merge_factor) are merged once there are merge_factor of them,
+    # the oldest first, so that a document is only rewritten a logarithmic number of times
+    plans: List[List[Segment]] = []
+    tiers: Dict[int, List[Segment]] = {}
+    for s in segments:
+        if len(s.deleted) > MAX_DELETED_RATIO * s.documents:
+            plans.append([s])
+        else:
+            tiers.setdefault(merge_tier(s.live(), merge_factor), []).append(s)
+
+    for tier in sorted(tiers):
+        members = tiers[tier]
+        while len(members) >= merge_factor:
+            plans.append(members[:merge_factor])
+            members = members[merge_factor:]
+
+    return plans
+
+
+def live_postings(
+    postings: List[Any], deleted: Set[int], index_type: InvertedIndexType
+) -> List[Any]:
+    if len(deleted) == 0:
+        return postings
+    if index_type == InvertedIndexType.DOCUMENTS_INDEX:
+        return [p for p in postings if p not in deleted]
+    return [p for p in postings if p[0] not in deleted]
+
+
+def posting_id(index_type: InvertedIndexType) -> Callable[[Any], int]:
+    if index_type == InvertedIndexType.DOCUMENTS_INDEX:
+        return lambda p: p
+    return lambda p: p[0]
+
+
+@timer
+def write_merged_segment(
+    path: str, manifest: Manifest, segments: List[Segment], name: str
+) -> Segment:
+    frequencies, positions = postings_layout(manifest.type)
+    key = posting_id(manifest.type)
+    dirpath = segment_path(path, name)
+    os.makedirs(dirpath, exist_ok=True)
+
+    entries = [
+        MappedEntries(
+            os.path.join(
+                segment_path(path, s.name), INDEX_FILE_NAMES[IndexFormat.BINARY]
+            )
+        )
+        for s in segments
+    ]
+    try:
+        with BinaryIndexWriter(
+            os.path.join(dirpath, INDEX_FILE_NAMES[IndexFormat.BINARY]),
+            manifest.type,
+            manifest.codec,
+        ) as writer:
+            streams = [
+                ((term, i, data) for (term, _, data) in e.iter_encoded())
+                for (i, e) in enumerate(entries)
+            ]
+            for (term, group) in grouped_by_term(heapq.merge(*streams)):
+                # the live documents of a shard are all in the same segment, but the
+                # shards of the segments interleave: the postings are merged by id
+                postings = list(
+                    heapq.merge(
+                        *[
+                            live_postings(
+                                decode_postings(
+                                    data, frequencies, positions, manifest.codec
+                                ),
+                                segments[i].deleted,
+                                manifest.type,
+                            )
+                            for (i, data) in group
+                        ],
+                        key=key,
+                    )
+                )
+                if len(postings) > 0:
+                    writer.add(term.decode("utf-8"), len(postings), postings)
+    finally:
+        for e in entries:
+            e.close()
+
+    stats = Stats()
+    doc_index = DocIndex()
+    for s in segments:
+        segment_stats = load_stats(
+            os.path.join(segment_path(path, s.name), STATS_FILE_NAME)
+        )
+        segment_doc_index = load_doc_index(
+            os.path.join(segment_path(path, s.name), DOC_INDEX_FILE_NAME)
+        )
+        live = [id for id in segment_stats.ids().tolist() if id not in s.deleted]
+        stats.update(segment_stats, live)
+        doc_index.update(segment_doc_index, live)
+    stats.save(os.path.join(dirpath, STATS_FILE_NAME))
+    doc_index.save(os.path.join(dirpath, DOC_INDEX_FILE_NAME))
+
+    return Segment(name, stats.documents_number)
+
+
+def grouped_by_term(
+    stream: Iterator[Tuple[bytes, int, bytes]]
+) -> Iterator[Tuple[bytes, List[Tuple[int, bytes]]]]:
+    current: Optional[bytes] = None
+    group: List[Tuple[int, bytes]] = []
+    for (term, i, data) in stream:
+        if term != current:
+            if current is not None:
+                yield current, group
+            current = term
+            group = []
+        group.append((i, data))
+
+    if current is not None:
+        yield current, group
+
+
+@timer
+def merge_segments(path: str, merge_factor: int = DEFAULT_MERGE_FACTOR) -> int:
+    # applies the merge policy until it has nothing left to merge, and returns the
+    # number of merges. Every merge is committed on its own, so the readers never wait
+    # for more than one.
+    merges = 0
+    with writer_lock(path):
+        while True:
+            manifest = load_manifest(path, documents=False)
+            if manifest is None:
+                return merges
+            plans = plan_merges(manifest.segments, merge_factor)
+            if len(plans) == 0:
+                return merges
+
+            manifest = load_manifest(path)
+            plan = plans[0]
+            merged = write_merged_segment(
+                path, manifest, plan, manifest.new_segment_name()
+            )
+
+            names = set(s.name for s in plan)
+            position = min(
+                i for (i, s) in enumerate(manifest.segments) if s.name in names
+            )
+            manifest.segments = [s for s in manifest.segments if s.name not in names]
+            if merged.documents > 0:
+                manifest.segments.insert(position, merged)
+            for records in manifest.documents.values():
+                for record in records.values():
+                    if record[2] in names:
+                        record[2] = merged.name
+            manifest.generation += 1
+            manifest.save(path)
+
+            for name in names:
+                shutil.rmtree(segment_path(path, name), ignore_errors=True)
+            if merged.documents == 0:
+                shutil.rmtree(segment_path(path, merged.name), ignore_errors=True)
+            merges += 1
+            logging.info(f"Merged {len(plan)} segments into {merged.name}.")
+
+
+# read-only view of the entries of all the segments, without their deleted documents.
+# The postings of a term are merged from the segments by increasing doc ids.
+class SegmentedEntries(Mapping):
+    def __init__(
+        self,
+        index_type: InvertedIndexType,
+        segments: List[Tuple[MappedEntries, Set[int]]],
+        owners: Dict[int, int],
+    ) -> None:
+        self.type: InvertedIndexType = index_type
+        self.segments: List[Tuple[MappedEntries, Set[int]]] = segments
+        # the segment holding the live version of every document
+        self.owners: Dict[int, int] = owners
+        self.dfs: Dict[str, int] = {}
+        self.terms_number: Optional[int] = None
+
+    def close(self) -> None:
+        for (entries, _) in self.segments:
+            entries.close()
+
+    def df(self, term: str) -> int:
+        if term not in self.dfs:
+            df = 0
+            for (entries, deleted) in self.segments:
+                record = entries.find(term)
+                if record is None:
+                    continue
+                elif len(deleted) == 0:
+                    df += record[0]
+                else:
+                    df += sum(1 for id in entries.doc_ids(term) if id not in deleted)
+            self.dfs[term] = df
+
+        return self.dfs[term]
+
+    def postings(self, term: str) -> List[Any]:
+        return list(
+            heapq.merge(
+                *[
+                    live_postings(entries.postings(term), deleted, self.type)
+                    for (entries, deleted) in self.segments
+                    if term in entries
+                ],
+                key=posting_id(self.type),
+            )
+        )
+
+    def doc_ids(self, term: str) -> List[int]:
+        return list(
+            heapq.merge(
+                *[
+                    [id for id in entries.doc_ids(term) if id not in deleted]
+                    for (entries, deleted) in self.segments
+                    if term in entries
+                ]
+            )
+        )
+
+    def positions(self, term: str, ids: List[int]) -> List[List[int]]:
+        # the ids are split among the segments that hold them, and the positions put
+        # back in the order of the ids
+        by_segment: Dict[int, List[int]] = {}
+        for id in ids:
+            by_segment.setdefault(self.owners[id], []).append(id)
+
+        positions: Dict[int, List[int]] = {}
+        for (i, segment_ids) in by_segment.items():
+            entries = self.segments[i][0]
+            positions.update(zip(segment_ids, entries.positions(term, segment_ids)))
+
+        return [positions[id] for id in ids]
+
+    def __getitem__(self, term: str) -> LazyEntry:
+        df = self.df(term)
+        if df == 0:
+            raise KeyError(term)
+        return LazyEntry(self, term, df)
+
+    def __contains__(self, term: object) -> bool:
+        return isinstance(term, str) and self.df(term) > 0
+
+    def live_terms(self, streams: List[Iterator[str]]) -> Iterator[str]:
+        # merges the sorted terms of the segments, without the ones that only deleted
+        # documents hold
+        previous: Optional[str] = None
+        for term in heapq.merge(*streams):
+            if term != previous:
+                previous = term
+                if self.df(term) > 0:
+                    yield term
+
+    def __iter__(self) -> Iterator[str]:
+        return self.live_terms([iter(entries) for (entries, _) in self.segments])
+
+    def with_prefix(self, prefix: str) -> Iterator[str]:
+        return self.live_terms(
+            [entries.with_prefix(prefix) for (entries, _) in self.segments]
+        )
+
+    def __len__(self) -> int:
+        if self.terms_number is None:
+            self.terms_number = sum(1 for _ in self)
+        return self.terms_number
+
+
+@timer
+def load_segments(path: str) -> Tuple[InvertedIndex, Stats, DocIndex, int]:
+    # returns the index, stats and doc index of the live documents of all the segments,
+    # with the generation they were loaded at
+    for attempt in range(2):
+        manifest = load_manifest(path, documents=False)
+        if manifest is None:
+            raise Exception(f"no segments were found in {path}")
+        try:
+            return read_segments(path, manifest)
+        except FileNotFoundError:
+            # a merge removed a segment between the reading of the manifest and the one
+            # of its files: the new manifest refers to the merged segment
+            if attempt == 1:
+                raise
+
+    raise Exception("unreachable")
+
+
+def read_segments(
+    path: str, manifest: Manifest
+) -> Tuple[InvertedIndex, Stats, DocIndex, int]:
+    segments: List[Tuple[MappedEntries, Set[int]]] = []
+    owners: Dict[int, int] = {}
+    stats = Stats()
+    doc_index = DocIndex()
+
+    try:
+        for (i, s) in enumerate(manifest.segments):
+            dirpath = segment_path(path, s.name)
+            segments.append(
+                (
+                    MappedEntries(
+                        os.path.join(dirpath, INDEX_FILE_NAMES[IndexFormat.BINARY])
+                    ),
+                    s.deleted,
+                )
+            )
+            segment_stats = load_stats(os.path.join(dirpath, STATS_FILE_NAME))
+            segment_doc_index = load_doc_index(
+                os.path.join(dirpath, DOC_INDEX_FILE_NAME)
+            )
+            live = [id for id in segment_stats.ids().tolist() if id not in s.deleted]
+            stats.update(segment_stats, live)
+            doc_index.update(segment_doc_index, live)
+            for id in live:
+                owners[id] = i
+    except FileNotFoundError:
+        for (entries, _) in segments:
+            entries.close()
+        raise
+
+    index = InvertedIndex(manifest.type)
+    index.entries = SegmentedEntries(manifest.type, segments, owners)
+
+    return index, stats, doc_index, manifest.generation
+
+
+def read_generation(path: str) -> Optional[int]:
+    manifest = load_manifest(path, documents=False)
+    return manifest.generation if manifest is not None else None
+
+
+# background thread that merges the segments of an index and calls on_change with the
+# reloaded index whenever its segments changed, so that a long-running process serves
+# the documents added by another one within an interval
+class SegmentWatcher(threading.Thread):
+    def __init__(
+        self,
+        path: str,
+        on_change: Callable[[InvertedIndex, Stats, DocIndex], None],
+        generation: Optional[int] = None,
+        interval: float = 1.0,
+        merge_factor: Optional[int] = DEFAULT_MERGE_FACTOR,
+    ) -> None:
+        super().__init__(daemon=True)
+        self.path: str = path
+        self.on_change: Callable[[InvertedIndex, Stats, DocIndex], None] = on_change
+        self.generation: Optional[int] = generation
+        self.interval: float = interval
+        self.merge_factor: Optional[int] = merge_factor
+        self.stopped = threading.Event()
+
+    def check(self) -> None:
+        if self.merge_factor is not None:
+            merge_segments(self.path, self.merge_factor)
+        if read_generation(self.path) != self.generation:
+            index, stats, doc_index, self.generation = load_segments(self.path)
+            self.on_change(index, stats, doc_index)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logging.exception("the segments could not be refreshed")
+
+    def stop(self) -> None:
+        self.stopped.set()
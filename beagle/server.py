@@ -0,0 +1,321 @@
+from beagle import metrics
+from beagle.index import DocIndex
+from beagle.metrics import Histogram
+from beagle.query_cache import QueryCache
+from beagle.search_engines import (
+    SearchEngine,
+    EngineType,
+    DocumentPonderation,
+    TermPonderation,
+)
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit, parse_qsl
+import asyncio
+import json
+import logging
+import time
+
+MAX_BODY_SIZE = 2 ** 20
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+PONDERATIONS_PARAMETERS = [
+    ("document_ponderation", DocumentPonderation),
+    ("term_ponderation", TermPonderation),
+    ("query_ponderation", DocumentPonderation),
+    ("query_term_ponderation", TermPonderation),
+]
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status: int = status
+
+
+# HTTP/JSON server answering the queries with engines that share the index loaded once.
+# At most `concurrency` queries run at the same time, and up to `max_pending` more may
+# wait for their turn: the requests beyond are answered right away with a 503 status.
+class Server:
+    def __init__(
+        self,
+        load_engine: Callable[[EngineType], SearchEngine],
+        doc_index: DocIndex,
+        cache: Optional[QueryCache] = None,
+        concurrency: int = 4,
+        max_pending: int = 64,
+    ) -> None:
+        self.load_engine: Callable[[EngineType], SearchEngine] = load_engine
+        self.doc_index: DocIndex = doc_index
+        self.cache: Optional[QueryCache] = cache
+        self.concurrency: int = concurrency
+        self.max_pending: int = max_pending
+        # an engine per engine type and ponderations, since the ponderations are a state
+        # of the engines and the requests may run concurrently
+        self.engines: Dict[Tuple[Any, ...], SearchEngine] = {}
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.running: int = 0
+        self.pending: int = 0
+        self.requests: int = 0
+        self.rejected: int = 0
+        self.errors: int = 0
+        self.started_at: float = time.time()
+        self.latencies: Dict[str, Histogram] = {}
+        metrics.registry.gauge(
+            "beagle_server_running_queries",
+            "queries being evaluated",
+            function=lambda: self.running,
+        )
+        metrics.registry.gauge(
+            "beagle_server_pending_queries",
+            "queries waiting for their evaluation",
+            function=lambda: self.pending,
+        )
+
+    def engine(self, parameters: Dict[str, Any]) -> SearchEngine:
+        try:
+            engine_type = EngineType(parameters.get("engine", EngineType.BINARY_SEARCH))
+            ponderations = {
+                name: ponderation(parameters[name])
+                for (name, ponderation) in PONDERATIONS_PARAMETERS
+                if name in parameters
+            }
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+        # the binary engine ignores the ponderations
+        if engine_type == EngineType.BINARY_SEARCH:
+            ponderations = {}
+
+        key = (engine_type, *sorted((k, str(v)) for (k, v) in ponderations.items()))
+        if key not in self.engines:
+            try:
+                engine = self.load_engine(engine_type)
+            except Exception as e:
+                raise HTTPError(400, str(e))
+            # the setters of a new engine would clear the results that the engines of the
+            # other ponderations share, so it only gets the cache once they are set
+            cache, engine.cache = engine.cache, None
+            for (name, ponderation) in ponderations.items():
+                getattr(engine, f"set_{name}")(ponderation)
+            engine.cache = cache
+            self.engines[key] = engine
+
+        return self.engines[key]
+
+    def reload(
+        self, load_engine: Callable[[EngineType], SearchEngine], doc_index: DocIndex
+    ) -> None:
+        # the engines of the previous index are dropped, the queries they are running
+        # still complete on it
+        self.load_engine = load_engine
+        self.doc_index = doc_index
+        self.engines = {}
+        if self.cache is not None:
+            self.cache.clear()
+
+    def reload_threadsafe(
+        self, load_engine: Callable[[EngineType], SearchEngine], doc_index: DocIndex
+    ) -> None:
+        # reloads the index from another thread than the one of the event loop
+        self.loop.call_soon_threadsafe(self.reload, load_engine, doc_index)
+
+    async def search(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        query = parameters.get("query", parameters.get("q"))
+        if not isinstance(query, str) or len(query.strip()) == 0:
+            raise HTTPError(400, "no query specified")
+        try:
+            k = int(parameters["k"]) if parameters.get("k") is not None else None
+        except ValueError:
+            raise HTTPError(400, f"invalid k: {parameters['k']}")
+        engine = self.engine(parameters)
+        # the documents of the index the engine searches, even if it is reloaded meanwhile
+        doc_index = self.doc_index
+
+        if self.running >= self.concurrency and self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPError(503, "too many pending queries")
+
+        self.pending += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.pending -= 1
+
+        self.running += 1
+        try:
+            start_time = time.perf_counter()
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, engine.search, query, k
+            )
+            elapsed = time.perf_counter() - start_time
+        except Exception as e:
+            raise HTTPError(400, str(e))
+        finally:
+            self.running -= 1
+            self.semaphore.release()
+
+        self.latencies.setdefault("search", Histogram()).observe(elapsed)
+        self.latencies.setdefault(engine.type().value, Histogram()).observe(elapsed)
+        if metrics.enabled:
+            metrics.registry.histogram(
+                "beagle_search_seconds",
+                "latency of the queries answered by the server",
+                {"engine": engine.type().value},
+            ).observe(elapsed)
+
+        documents = []
+        for (id, score) in results.items():
+            document = doc_index.get(id)
+            documents.append(
+                {
+                    "id": id,
+                    "name": document["name"],
+                    "path": document["path"],
+                    "score": score,
+                }
+            )
+
+        return {
+            "query": query,
+            "engine": str(engine),
+            "count": len(documents),
+            "elapsed": elapsed,
+            "results": documents,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "uptime": time.time() - self.started_at,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "running": self.running,
+            "pending": self.pending,
+            "concurrency": self.concurrency,
+            "max_pending": self.max_pending,
+            "latencies": {
+                name: histogram.to_dict()
+                for (name, histogram) in self.latencies.items()
+            },
+        }
+        if self.cache is not None:
+            stats["cache"] = {
+                "entries": len(self.cache.entries),
+                "bytes": self.cache.bytes_number,
+                "hits": self.cache.hits,
+                "misses": self.cache.misses,
+                "hit_rate": self.cache.hit_rate(),
+            }
+
+        return stats
+
+    # a dict is answered as JSON, and a string as plain text
+    async def route(
+        self, method: str, target: str, body: bytes
+    ) -> Union[Dict[str, Any], str]:
+        url = urlsplit(target)
+        parameters: Dict[str, Any] = dict(parse_qsl(url.query))
+
+        if url.path == "/search":
+            if method == "POST":
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError:
+                    raise HTTPError(400, "the body is not valid JSON")
+                if not isinstance(payload, dict):
+                    raise HTTPError(400, "the body must be a JSON object")
+                parameters.update(payload)
+            elif method != "GET":
+                raise HTTPError(405, f"{method} is not allowed on {url.path}")
+            return await self.search(parameters)
+        elif url.path == "/stats":
+            if method != "GET":
+                raise HTTPError(405, f"{method} is not allowed on {url.path}")
+            return self.stats()
+        elif url.path == "/metrics":
+            if method != "GET":
+                raise HTTPError(405, f"{method} is not allowed on {url.path}")
+            if parameters.get("format") == "json":
+                return metrics.registry.to_dict()
+            return metrics.registry.to_prometheus()
+
+        raise HTTPError(404, f"unknown endpoint: {url.path}")
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.requests += 1
+        try:
+            try:
+                method, target, _ = (
+                    (await reader.readline()).decode("latin-1").split(" ", 2)
+                )
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in [b"\r\n", b"\n", b""]:
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    raise HTTPError(413, "the body is too large")
+                body = await reader.readexactly(length) if length > 0 else b""
+            except (ValueError, asyncio.IncompleteReadError):
+                raise HTTPError(400, "malformed request")
+
+            status, payload = 200, await self.route(method, target, body)
+        except HTTPError as e:
+            status, payload = e.status, {"error": str(e)}
+        except Exception as e:
+            logging.exception("the request could not be handled")
+            status, payload = 500, {"error": str(e)}
+
+        if status >= 400 and status != 503:
+            self.errors += 1
+
+        if isinstance(payload, str):
+            data = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            data = json.dumps(payload).encode("utf-8")
+            content_type = "application/json"
+        writer.write(
+            (
+                f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                + ("Retry-After: 1\r\n" if status == 503 else "")
+                + "Connection: close\r\n\r\n"
+            ).encode("latin-1")
+            + data
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.loop = asyncio.get_running_loop()
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def serve_forever(self, host: str, port: int) -> None:
+        server = await self.start(host, port)
+        for socket in server.sockets:
+            logging.info(f"Listening on http://{socket.getsockname()[0]}:{port}")
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,283 @@
+from beagle.logging import timer
+from beagle.bitmap import Bitmap, BITMAPS_FILE_NAME, load_bitmaps
+from beagle.index import (
+    InvertedIndex,
+    LazyEntry,
+    find_index_file,
+    load_index,
+)
+from beagle.search_engines import (
+    SearchEngine,
+    EngineType,
+    DocumentPonderation,
+    TermPonderation,
+)
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import heapq
+import json
+import os
+import shutil
+import threading
+
+# A sharded index keeps the index of every shard of the collection on its own, in the
+# shards directory, and a query runs on all of them at the same time. The stats, doc
+# index, norms and k-grams are the whole collection's ones, saved next to the shards
+# manifest, so that the documents are scored exactly as with a single index.
+SHARDS_FILE_NAME = "shards.json"
+SHARDS_DIR_NAME = "shards"
+SHARDS_MANIFEST_VERSION = 1
+
+
+def shard_path(path: str, name: str) -> str:
+    return os.path.join(path, SHARDS_DIR_NAME, name) + "/"
+
+
+def has_shards(path: str) -> bool:
+    return os.path.exists(os.path.join(path, SHARDS_FILE_NAME))
+
+
+def save_shards_manifest(path: str, names: List[str]) -> None:
+    # the shards are listed in the order of their doc ids
+    with open(os.path.join(path, SHARDS_FILE_NAME), "w") as f:
+        json.dump({"version": SHARDS_MANIFEST_VERSION, "shards": names}, f)
+
+
+def remove_shards(path: str) -> None:
+    if os.path.exists(os.path.join(path, SHARDS_FILE_NAME)):
+        os.remove(os.path.join(path, SHARDS_FILE_NAME))
+    shutil.rmtree(os.path.join(path, SHARDS_DIR_NAME), ignore_errors=True)
+
+
+# read-only view of the entries of all the shards as the ones of a single index: the df
+# of a term is the sum of its shards' ones, and its postings the concatenation of theirs,
+# since the shards hold increasing ranges of doc ids
+class ShardedEntries(Mapping):
+    def __init__(self, shards: List[InvertedIndex]) -> None:
+        self.shards: List[InvertedIndex] = shards
+        self.terms_number: Optional[int] = None
+        # the ids of the terms of the collection, built once for all the shards engines
+        self.term_ids: Optional[Dict[str, int]] = None
+        self.lock = threading.Lock()
+
+    def holders(self, term: str) -> List[InvertedIndex]:
+        return [s for s in self.shards if term in s.entries]
+
+    def postings(self, term: str) -> List[Any]:
+        postings: List[Any] = []
+        for s in self.holders(term):
+            postings.extend(s.entries[term][1])
+        return postings
+
+    def doc_ids(self, term: str) -> List[int]:
+        ids: List[int] = []
+        for s in self.holders(term):
+            ids.extend(s.doc_ids(term))
+        return ids
+
+    def positions(self, term: str, ids: List[int]) -> List[List[int]]:
+        # the sorted ids are split between the shards holding them
+        result: List[List[int]] = []
+        i = 0
+        for s in self.holders(term):
+            last = s.doc_ids(term)[-1]
+            j = i
+            while j < len(ids) and ids[j] <= last:
+                j += 1
+            if j > i:
+                result.extend(s.positions(term, ids[i:j]))
+            i = j
+        return result
+
+    def term_id(self, term: str) -> Optional[int]:
+        with self.lock:
+            if self.term_ids is None:
+                self.term_ids = {t: i for (i, t) in enumerate(self)}
+        return self.term_ids.get(term)
+
+    def __getitem__(self, term: str) -> LazyEntry:
+        df = sum(s.entries[term][0] for s in self.holders(term))
+        if df == 0:
+            raise KeyError(term)
+        return LazyEntry(self, term, df)
+
+    def __contains__(self, term: object) -> bool:
+        return any(term in s.entries for s in self.shards)
+
+    def __iter__(self) -> Iterator[str]:
+        # the sorted terms of all the shards, without duplicates
+        previous = None
+        for term in heapq.merge(
+            *[sorted(s.entries, key=lambda t: t.encode("utf-8")) for s in self.shards],
+            key=lambda t: t.encode("utf-8"),
+        ):
+            if term != previous:
+                yield term
+                previous = term
+
+    def __len__(self) -> int:
+        if self.terms_number is None:
+            self.terms_number = sum(1 for _ in self)
+        return self.terms_number
+
+    def close(self) -> None:
+        for s in self.shards:
+            if hasattr(s.entries, "close"):
+                s.entries.close()
+
+
+# the indexes of the shards of a collection, along with their names and the bitmaps of
+# their most common terms. It can be used as the index of the whole collection, though
+# the queries are answered faster by one engine per shard.
+class ShardedIndex(InvertedIndex):
+    def __init__(
+        self,
+        shards: List[InvertedIndex],
+        names: List[str],
+        bitmaps: Optional[List[Dict[str, Bitmap]]] = None,
+    ) -> None:
+        if len(shards) == 0:
+            raise Exception("a sharded index requires at least one shard")
+
+        super().__init__(shards[0].type)
+        self.shards: List[InvertedIndex] = shards
+        self.names: List[str] = names
+        self.bitmaps: List[Dict[str, Bitmap]] = (
+            bitmaps if bitmaps is not None else [{} for _ in shards]
+        )
+        self.entries = ShardedEntries(shards)
+
+
+@timer
+def load_sharded_index(path: str) -> ShardedIndex:
+    with open(os.path.join(path, SHARDS_FILE_NAME), "r") as f:
+        raw = json.load(f)
+    if raw["version"] != SHARDS_MANIFEST_VERSION:
+        raise Exception(f"{path} does not hold a supported sharded index")
+
+    shards: List[InvertedIndex] = []
+    bitmaps: List[Dict[str, Bitmap]] = []
+    for name in raw["shards"]:
+        dirpath = shard_path(path, name)
+        shards.append(load_index(find_index_file(dirpath)))
+        bitmaps.append(
+            load_bitmaps(dirpath + BITMAPS_FILE_NAME)
+            if os.path.exists(dirpath + BITMAPS_FILE_NAME)
+            else {}
+        )
+
+    return ShardedIndex(shards, raw["shards"], bitmaps)
+
+
+# scatter-gather engine: a query is answered by the engine of every shard, and their
+# results are merged. The engines of the shards process the queries and weight the
+# terms with the vocabulary and stats of the whole collection, so the results are the
+# ones of a single engine over the whole collection.
+class ShardedSearchEngine(SearchEngine):
+    def __init__(
+        self,
+        engines: List[SearchEngine],
+        names: List[str],
+        workers: int = 1,
+    ) -> None:
+        self.engines: List[SearchEngine] = engines
+        self.names: List[str] = names
+        # the engines run pure Python code that holds the GIL, so a pool of threads gives
+        # no speedup over a loop on the shards: it is only used when workers are asked for
+        self.workers: int = workers
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.pid: Optional[int] = None
+
+    def pool(self) -> ThreadPoolExecutor:
+        # the threads of a pool do not survive a fork (of the batch workers), so every
+        # process starts its own
+        if self.executor is None or self.pid != os.getpid():
+            self.executor = ThreadPoolExecutor(max_workers=max(self.workers, 1))
+            self.pid = os.getpid()
+        return self.executor
+
+    def scatter(self, function: Callable[..., Any], *iterables: Iterable) -> List[Any]:
+        if self.workers <= 1:
+            return list(map(function, *iterables))
+        return list(self.pool().map(function, *iterables))
+
+    def query(self, query: str, k: Optional[int] = None) -> Dict[int, float]:
+        return self.evaluate(self.process_query(query), k)
+
+    def process_query(self, query: str) -> List[Any]:
+        # the query processed by the engine of every shard: the vectorial ones process it
+        # the same way, with the vocabulary of the collection, while the plans of a
+        # boolean query depend on the postings of each shard
+        if self.type() == EngineType.VECTORIAL_SEARCH:
+            return [self.engines[0].process_query(query)] * len(self.engines)
+        return self.scatter(lambda e: e.process_query(query), self.engines)
+
+    @timer
+    def evaluate(
+        self, processed: List[Any], k: Optional[int] = None
+    ) -> Dict[int, float]:
+        results = self.scatter(
+            lambda engine, p: engine.evaluate(p, k), self.engines, processed
+        )
+
+        if self.type() == EngineType.BINARY_SEARCH:
+            ids = sorted(id for shard_results in results for id in shard_results)
+            return {id: 1.0 for id in (ids if k is None else ids[:k])}
+
+        # the k best documents of the collection are among the k best ones of their
+        # shards, and ties are broken by doc id as in a single engine
+        scores: List[Tuple[int, float]] = sorted(
+            (item for shard_results in results for item in shard_results.items()),
+            key=lambda item: (-item[1], item[0]),
+        )
+        return dict(scores if k is None else scores[:k])
+
+    # the evaluation plan of a binary query in every shard
+    def explain(self, query: str) -> str:
+        return "\n".join(
+            f"shard {name}:\n{engine.explain(query)}"
+            for (name, engine) in zip(self.names, self.engines)
+        )
+
+    def normalize_query(self, query: str) -> str:
+        return self.engines[0].normalize_query(query)
+
+    def normalize_processed_query(self, processed: List[Any]) -> str:
+        return self.engines[0].normalize_processed_query(processed[0])
+
+    def ponderations(
+        self,
+    ) -> Tuple[
+        Optional[DocumentPonderation],
+        Optional[TermPonderation],
+        Optional[DocumentPonderation],
+        Optional[TermPonderation],
+    ]:
+        return self.engines[0].ponderations()
+
+    def __str__(self) -> str:
+        return f"{self.engines[0]} over {len(self.engines)} shards"
+
+    def set_document_ponderation(self, ponderation: DocumentPonderation):
+        for engine in self.engines:
+            engine.set_document_ponderation(ponderation)
+        self.invalidate_cache()
+
+    def set_term_ponderation(self, ponderation: TermPonderation):
+        for engine in self.engines:
+            engine.set_term_ponderation(ponderation)
+        self.invalidate_cache()
+
+    def set_query_ponderation(self, ponderation: DocumentPonderation):
+        for engine in self.engines:
+            engine.set_query_ponderation(ponderation)
+        self.invalidate_cache()
+
+    def set_query_term_ponderation(self, ponderation: TermPonderation):
+        for engine in self.engines:
+            engine.set_query_term_ponderation(ponderation)
+        self.invalidate_cache()
+
+    def type(self) -> str:
+        return self.engines[0].type()
@@ -1,36 +1,180 @@
-from typing import Dict
+from typing import Dict, Iterable, Optional
 import json
+import mmap
+import os
+import struct
+import numpy as np
 from beagle.logging import timer
 
+# documents statistics, in the order of the rows of Stats.columns
+STATS_COLUMNS = [
+    "tokens_number",
+    "max_frequency",
+    "sum_frequency",
+    "unique_terms_number",
+]
 
+STATS_FILE_NAME = "stats.bin"
+# the stats used to be saved as JSON, and these files are still readable
+LEGACY_STATS_FILE_NAME = "stats.json"
+
+# binary stats layout: a header, the columns one after the other, then one byte per
+# doc id telling whether a document has this id
+STATS_MAGIC = b"BGLS"
+STATS_VERSION = 1
+STATS_HEADER = struct.Struct("<4sHHQQ")  # magic, version, columns, size, documents
+STATS_DTYPE = np.dtype("<u4")
+
+
+# the statistics of the documents, as one typed column per statistic indexed by doc id.
+# The ids of a collection are dense, and the few ids that no document holds (the ones
+# of removed documents in an incremental index) only cost a zero row.
 class Stats:
     def __init__(self) -> None:
-        self.documents: Dict[int, Dict[str, int]] = {}
+        self.columns: np.ndarray = np.zeros((len(STATS_COLUMNS), 0), dtype=STATS_DTYPE)
+        self.present: np.ndarray = np.zeros(0, dtype=bool)
+        # ids are below size, and the columns may be larger to grow in amortized time
+        self.size: int = 0
         self.documents_number: int = 0
 
-    def update(self, stats: "Stats") -> None:
-        self.documents_number += stats.documents_number
-        self.documents.update(stats.documents)
+    @property
+    def tokens_number(self) -> np.ndarray:
+        return self.columns[0]
+
+    @property
+    def max_frequency(self) -> np.ndarray:
+        return self.columns[1]
+
+    @property
+    def sum_frequency(self) -> np.ndarray:
+        return self.columns[2]
+
+    @property
+    def unique_terms_number(self) -> np.ndarray:
+        return self.columns[3]
+
+    def reserve(self, size: int) -> None:
+        # the columns of loaded stats are read-only views of the file, and are copied
+        # before being changed
+        capacity = self.columns.shape[1]
+        if size <= capacity and self.columns.flags.writeable:
+            return
+
+        capacity = max(size, 2 * capacity) if size > capacity else capacity
+        columns = np.zeros((len(STATS_COLUMNS), capacity), dtype=STATS_DTYPE)
+        columns[:, : self.size] = self.columns[:, : self.size]
+        present = np.zeros(capacity, dtype=bool)
+        present[: self.size] = self.present[: self.size]
+        self.columns = columns
+        self.present = present
+
+    def add(self, id: int, document: Dict[str, int]) -> None:
+        self.reserve(id + 1)
+        self.size = max(self.size, id + 1)
+        self.columns[:, id] = [document[column] for column in STATS_COLUMNS]
+        self.present[id] = True
+
+    def update(self, stats: "Stats", ids: Optional[Iterable[int]] = None) -> None:
+        # copies the rows of all the documents of stats, or of the given ids only
+        if ids is None:
+            selected = stats.ids()
+            self.documents_number += stats.documents_number
+        else:
+            selected = np.fromiter(ids, dtype=np.int64)
+            self.documents_number += len(selected)
+        if len(selected) == 0:
+            return
+
+        self.reserve(stats.size)
+        self.size = max(self.size, stats.size)
+        self.columns[:, selected] = stats.columns[:, selected]
+        self.present[selected] = True
+
+    def ids(self) -> np.ndarray:
+        return np.flatnonzero(self.present[: self.size])
+
+    def __contains__(self, id: object) -> bool:
+        return isinstance(id, int) and 0 <= id < self.size and bool(self.present[id])
+
+    def __len__(self) -> int:
+        return len(self.ids())
+
+    def get(self, id: int) -> Dict[str, int]:
+        if id not in self:
+            raise KeyError(id)
+        return {
+            column: int(self.columns[i, id]) for (i, column) in enumerate(STATS_COLUMNS)
+        }
+
+    def to_dict(self) -> Dict[int, Dict[str, int]]:
+        return {id: self.get(id) for id in self.ids().tolist()}
 
     @timer
     def save(self, path: str) -> None:
-        with open(path, "w") as f:
-            json.dump(
-                {
-                    "documents_number": self.documents_number,
-                    "documents": self.documents,
-                },
-                f,
+        with open(path, "wb") as f:
+            f.write(
+                STATS_HEADER.pack(
+                    STATS_MAGIC,
+                    STATS_VERSION,
+                    len(STATS_COLUMNS),
+                    self.size,
+                    self.documents_number,
+                )
+            )
+            f.write(
+                np.ascontiguousarray(
+                    self.columns[:, : self.size], dtype=STATS_DTYPE
+                ).tobytes()
             )
+            f.write(self.present[: self.size].tobytes())
+
+
+def find_stats_file(dirpath: str) -> str:
+    path = os.path.join(dirpath, STATS_FILE_NAME)
+    legacy_path = os.path.join(dirpath, LEGACY_STATS_FILE_NAME)
+    return (
+        legacy_path
+        if not os.path.exists(path) and os.path.exists(legacy_path)
+        else path
+    )
 
 
 @timer
 def load_stats(path: str) -> Stats:
-    with open(path, "r") as f:
-        stats = Stats()
+    # the columns are memory-mapped: only the rows of the scored documents are read
+    with open(path, "rb") as f:
+        if f.read(len(STATS_MAGIC)) != STATS_MAGIC:
+            f.seek(0)
+            return load_legacy_stats(json.load(f))
+
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, columns_number, size, documents_number = STATS_HEADER.unpack_from(
+        data, 0
+    )
+    if version != STATS_VERSION or columns_number != len(STATS_COLUMNS):
+        raise Exception(f"{path} is not a supported stats file")
+
+    stats = Stats()
+    stats.columns = np.frombuffer(
+        data, dtype=STATS_DTYPE, count=columns_number * size, offset=STATS_HEADER.size
+    ).reshape((columns_number, size))
+    stats.present = np.frombuffer(
+        data,
+        dtype=bool,
+        count=size,
+        offset=STATS_HEADER.size + stats.columns.nbytes,
+    )
+    stats.size = size
+    stats.documents_number = documents_number
+
+    return stats
+
 
-        raw = json.load(f)
-        stats.documents_number = raw["documents_number"]
-        stats.documents = {int(k): raw["documents"][k] for k in raw["documents"]}
+def load_legacy_stats(raw: Dict) -> Stats:
+    stats = Stats()
+    for (id, document) in raw["documents"].items():
+        stats.add(int(id), document)
+    stats.documents_number = raw["documents_number"]
 
-        return stats
+    return stats
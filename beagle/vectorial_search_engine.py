@@ -1,16 +1,31 @@
 from beagle.logging import timer
-from beagle.index import InvertedIndex
+from beagle import metrics
+from beagle.index import InvertedIndex, sorted_terms
 from beagle.search_engines import (
     SearchEngine,
     EngineType,
     DocumentPonderation,
     TermPonderation,
 )
-from nltk.stem import WordNetLemmatizer
+from beagle.lemmatizer import lemmatize
+from beagle.wildcard import is_wildcard
+from beagle.fuzzy import FUZZY_BUDGET
 from enum import Enum
 from beagle.stats import Stats
-from typing import List, Dict
+from beagle.norms import Norms
+from typing import List, Dict, Optional, Tuple, Any
+import bisect
+import heapq
+import itertools
 import math
+import numpy as np
+
+# margin under which a score bound is considered too close to the top-k threshold to
+# prune a document, so that floating point errors never drop a result
+PRUNING_TOLERANCE = 1e-9
+# the documents ponderations of an engine unless set otherwise, the only ones whose norms
+# are computed when indexing: the norms of the other ones are computed on their first use
+DEFAULT_PONDERATIONS = (DocumentPonderation.TF, TermPonderation.IDF)
 
 
 def norm2(vector: Dict[str, float]) -> float:
@@ -22,6 +37,14 @@ def norm2(vector: Dict[str, float]) -> float:
     return math.sqrt(n)
 
 
+def postings_arrays(postings: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    ids = np.fromiter((p[0] for p in postings), dtype=np.int64, count=len(postings))
+    frequencies = np.fromiter(
+        (p[1] for p in postings), dtype=np.float64, count=len(postings)
+    )
+    return ids, frequencies
+
+
 class VectorialSearchEngine(SearchEngine):
     def __init__(
         self,
@@ -31,51 +54,76 @@ class VectorialSearchEngine(SearchEngine):
         term_ponderation: TermPonderation = TermPonderation.IDF,
         query_ponderation: DocumentPonderation = DocumentPonderation.TF,
         query_term_ponderation: TermPonderation = TermPonderation.NONE,
+        norms: Optional[Norms] = None,
+        vectorized: bool = True,
+        max_edits: int = 0,
+        fuzzy_budget: int = FUZZY_BUDGET,
+        vocabulary: Optional[InvertedIndex] = None,
     ) -> None:
         self.index: InvertedIndex = index
+        # the index the query terms and their documents frequencies come from: the
+        # engine's own one, or the whole collection's for the engine of a single shard
+        self.vocabulary: InvertedIndex = vocabulary if vocabulary is not None else index
         self.stats: Stats = stats
+        self.norms: Norms = norms if norms is not None else Norms()
         self.document_ponderation = document_ponderation
         self.term_ponderation = term_ponderation
         self.query_ponderation = query_ponderation
         self.query_term_ponderation = query_term_ponderation
+        # whether the postings are scored with numpy arrays or one by one
+        self.vectorized: bool = vectorized
+        # a term missing from the index is replaced by the terms at most max_edits away
+        # from it, and fuzzy_budget bounds the number of such terms in a query
+        self.max_edits: int = max_edits
+        self.fuzzy_budget: int = fuzzy_budget
 
     # ponderation functions that depends on a document and a term
     def tf(self, f: int, id: int) -> int:
-        return f / self.stats.documents[id]["tokens_number"]
+        return f / self.stats.tokens_number[id]
 
     def frequency_normalized_tf(self, f: int, id: int) -> float:
         return 0.5 + 0.5 * self.tf(f, id) / (
-            self.stats.documents[id]["max_frequency"]
-            / self.stats.documents[id]["tokens_number"]
+            self.stats.max_frequency[id] / self.stats.tokens_number[id]
         )
 
     def log_tf(self, f: int, id: int) -> float:
         return 1 + math.log(self.tf(f, id))
 
     def log_frequency_normalized_tf(self, f: int, id: int) -> float:
-        avg = (
-            self.stats.documents[id]["sum_frequency"]
-            / self.stats.documents[id]["tokens_number"]
-        ) / (
-            self.stats.documents[id]["unique_terms_number"] + 1
+        avg = (self.stats.sum_frequency[id] / self.stats.tokens_number[id]) / (
+            self.stats.unique_terms_number[id] + 1
         )  # we add 1 to avoid zero division errors
         return (1 + self.log_tf(f, id)) / (1 + math.log(avg))
 
     # ponderation functions that depend only on a term
     def idf(self, term: str) -> float:
-        return math.log(self.stats.documents_number / self.index.entries[term][0])
+        return math.log(self.stats.documents_number / self.vocabulary.entries[term][0])
 
     def normalized(self, term: str) -> float:
         return max(
             0,
-            (self.stats.documents_number - self.index.entries[term][0])
+            (self.stats.documents_number - self.vocabulary.entries[term][0])
             / self.stats.documents_number,
         )
 
     # helping functions to get a vector of weights from a querystring
     def process_query(self, query: str) -> List[str]:
-        lemmatizer = WordNetLemmatizer()
-        return [lemmatizer.lemmatize(token.lower()) for token in query.split()]
+        # a wildcard token is replaced by all the vocabulary terms it matches
+        terms: List[str] = []
+        budget = self.fuzzy_budget
+        for token in query.split():
+            if is_wildcard(token):
+                terms.extend(self.vocabulary.expand(token.lower()))
+                continue
+
+            term = lemmatize(token.lower())
+            if self.max_edits > 0 and term not in self.vocabulary.entries:
+                similar = self.vocabulary.similar(term, self.max_edits, budget)
+                budget -= len(similar)
+                terms.extend(similar)
+            else:
+                terms.append(term)
+        return terms
 
     def build_query_vector(self, query: List[str]) -> (Dict[str, float], float):
         vector: Dict[str, float] = {}
@@ -119,33 +167,100 @@ class VectorialSearchEngine(SearchEngine):
 
         return vector, norm2(vector)
 
-    def get_document_weight(self, f: int, term: str, id: int) -> float:
-        w = 0
-
-        # document ponderation
-        if self.document_ponderation == DocumentPonderation.BINARY:
-            w = 1
-        elif self.document_ponderation == DocumentPonderation.TF:
-            w = self.tf(f, id)
-        elif self.document_ponderation == DocumentPonderation.FREQUENCY_NORMALIZED:
-            w = self.frequency_normalized_tf(f, id)
-        elif self.document_ponderation == DocumentPonderation.LOG:
-            w = self.log_tf(f, id)
-        elif self.document_ponderation == DocumentPonderation.LOG_NORMALIZED:
-            w = self.log_frequency_normalized_tf(f, id)
+    def document_weight(
+        self, f: int, id: int, ponderation: DocumentPonderation
+    ) -> float:
+        if ponderation == DocumentPonderation.BINARY:
+            return 1
+        elif ponderation == DocumentPonderation.TF:
+            return self.tf(f, id)
+        elif ponderation == DocumentPonderation.FREQUENCY_NORMALIZED:
+            return self.frequency_normalized_tf(f, id)
+        elif ponderation == DocumentPonderation.LOG:
+            return self.log_tf(f, id)
+        elif ponderation == DocumentPonderation.LOG_NORMALIZED:
+            return self.log_frequency_normalized_tf(f, id)
+
+        return 0
+
+    # same as document_weight, for arrays of doc ids and frequencies
+    def document_weights(
+        self, ids: np.ndarray, frequencies: np.ndarray, ponderation: DocumentPonderation
+    ) -> np.ndarray:
+        if ponderation == DocumentPonderation.BINARY:
+            return np.ones(len(ids))
+
+        tokens_number = self.stats.tokens_number[ids]
+        tf = frequencies / tokens_number
+        if ponderation == DocumentPonderation.TF:
+            return tf
+        elif ponderation == DocumentPonderation.FREQUENCY_NORMALIZED:
+            return 0.5 + 0.5 * tf / (self.stats.max_frequency[ids] / tokens_number)
+        elif ponderation == DocumentPonderation.LOG:
+            return 1 + np.log(tf)
+        elif ponderation == DocumentPonderation.LOG_NORMALIZED:
+            avg = (self.stats.sum_frequency[ids] / tokens_number) / (
+                self.stats.unique_terms_number[ids] + 1
+            )
+            return (1 + (1 + np.log(tf))) / (1 + np.log(avg))
 
-        # term ponderation
-        if self.term_ponderation == TermPonderation.IDF:
-            w *= self.idf(term)
-        elif self.term_ponderation == TermPonderation.NORMALIZED:
-            w *= self.normalized(term)
+        return np.zeros(len(ids))
+
+    def term_weight(self, term: str, ponderation: TermPonderation) -> float:
+        if ponderation == TermPonderation.IDF:
+            return self.idf(term)
+        elif ponderation == TermPonderation.NORMALIZED:
+            return self.normalized(term)
 
-        return w
+        return 1
 
-    # function to compute the score of every document
+    def get_document_weight(self, f: int, term: str, id: int) -> float:
+        return self.document_weight(
+            f, id, self.document_ponderation
+        ) * self.term_weight(term, self.term_ponderation)
+
+    def document_norms(self) -> np.ndarray:
+        # the norms of the current ponderations are computed on their first use if they
+        # were not precomputed at indexing time
+        norms = self.norms.get(self.document_ponderation, self.term_ponderation)
+        if norms is None:
+            self.compute_norms()
+            norms = self.norms.get(self.document_ponderation, self.term_ponderation)
+
+        return norms
+
+    def term_bounds(self) -> np.ndarray:
+        bounds = self.norms.get_bounds(self.document_ponderation, self.term_ponderation)
+        if bounds is None:
+            self.compute_norms()
+            bounds = self.norms.get_bounds(
+                self.document_ponderation, self.term_ponderation
+            )
+
+        return bounds
+
+    def compute_norms(self) -> None:
+        pair = (self.document_ponderation, self.term_ponderation)
+        # the first engine missing the norms of a pair computes them while the other ones
+        # sharing them wait, instead of computing them all at the same time
+        with self.norms.lock:
+            if (
+                self.norms.get(*pair) is not None
+                and self.norms.get_bounds(*pair) is not None
+            ):
+                return
+            # the norms of the documents of every shard of a collection at once
+            computed = compute_norms(self.vocabulary, self.stats, [pair])
+            self.norms.set(*pair, computed.get(*pair))
+            self.norms.set_bounds(*pair, computed.get_bounds(*pair))
+
+    # function to compute the cosine similarity of every document with the query
     def compute_query(self, query: List[str]) -> Dict[int, float]:
+        if self.vectorized:
+            return self.compute_query_vectorized(query)
+
         scores: Dict[int, float] = {}
-        norms: Dict[int, float] = {}
+        norms = self.document_norms()
 
         q, q_norm = self.build_query_vector(query)
 
@@ -157,6 +272,9 @@ class VectorialSearchEngine(SearchEngine):
             except Exception:
                 docs = []
 
+            if metrics.enabled:
+                metrics.postings_scanned.inc(len(docs))
+
             # for every one of them we update their dot product saved un scores
             for doc in docs:
                 id = doc[0]
@@ -164,47 +282,260 @@ class VectorialSearchEngine(SearchEngine):
                 w = self.get_document_weight(f, term, id)
                 if id in scores:
                     scores[id] += q[term] * w
-                    norms[id] += w ** 2
                 else:
                     scores[id] = q[term] * w
-                    norms[id] = w ** 2
+
         for id in scores:
-            scores[id] /= q_norm
-            scores[id] /= math.sqrt(norms[id])
+            # a null norm means that every weight of the document is null
+            if norms[id] > 0:
+                scores[id] /= q_norm * norms[id]
+
+        if metrics.enabled:
+            metrics.documents_scored.inc(len(scores))
 
         return scores
 
+    # same as compute_query, with the weights of every term computed at once on arrays
+    # and accumulated in a dense scores array
+    def compute_query_vectorized(self, query: List[str]) -> Dict[int, float]:
+        norms = self.document_norms()
+        q, q_norm = self.build_query_vector(query)
+
+        ids_arrays: List[np.ndarray] = []
+        weights_arrays: List[np.ndarray] = []
+        for term in q:
+            if term not in self.index.entries:
+                continue
+            ids, frequencies = postings_arrays(self.index.entries[term][1])
+            w = self.document_weights(
+                ids, frequencies, self.document_ponderation
+            ) * self.term_weight(term, self.term_ponderation)
+            ids_arrays.append(ids)
+            weights_arrays.append(q[term] * w)
+
+        if len(ids_arrays) == 0:
+            return {}
+
+        ids = np.concatenate(ids_arrays)
+        scores = np.bincount(ids, weights=np.concatenate(weights_arrays))
+        if metrics.enabled:
+            metrics.postings_scanned.inc(len(ids))
+
+        # the documents are kept in the order of their first match, as the scalar path
+        # does, so that ties are ranked the same way
+        matched, first = np.unique(ids, return_index=True)
+        matched = matched[np.argsort(first, kind="stable")]
+        scores = scores[matched]
+        n = norms[matched]
+        # a null norm means that every weight of the document is null
+        nonzero = n > 0
+        scores[nonzero] /= q_norm * n[nonzero]
+        if metrics.enabled:
+            metrics.documents_scored.inc(len(matched))
+
+        return dict(zip(matched.tolist(), scores.tolist()))
+
+    # document-at-a-time evaluation of the k best documents with MaxScore pruning: the
+    # query terms are sorted by the upper bound of their score contribution, and the
+    # documents that only contain terms whose bounds sum below the k-th best score so
+    # far (the non-essential terms) are never scored
+    def compute_top_k(self, query: List[str], k: int) -> List[Tuple[int, float]]:
+        norms = self.document_norms()
+        bounds = self.term_bounds()
+        q, q_norm = self.build_query_vector(query)
+
+        terms: List[Tuple[float, str, List[Any]]] = []
+        for term in q:
+            if term not in self.index.entries:
+                continue
+            low, high = bounds[:, self.vocabulary.term_id(term)]
+            upper_bound = max(q[term] * low, q[term] * high, 0) / q_norm
+            terms.append((upper_bound, term, self.index.entries[term][1]))
+        terms.sort(key=lambda t: t[0])
+
+        # prefix_bounds[i] bounds the score of a document only matching terms[: i + 1]
+        prefix_bounds = list(itertools.accumulate(t[0] for t in terms))
+        ids = [[doc[0] for doc in postings] for (_, _, postings) in terms]
+        cursors = [0] * len(terms)
+
+        def contribution(i: int) -> float:
+            _, term, postings = terms[i]
+            id, f = postings[cursors[i]][0], postings[cursors[i]][1]
+            if norms[id] == 0:
+                return 0
+            return (
+                q[term] * self.get_document_weight(f, term, id) / (q_norm * norms[id])
+            )
+
+        heap: List[Tuple[float, int]] = []
+        threshold = -math.inf
+        first_essential = 0
+        scored = 0
+
+        while True:
+            while (
+                first_essential < len(terms)
+                and prefix_bounds[first_essential] + PRUNING_TOLERANCE <= threshold
+            ):
+                first_essential += 1
+
+            candidates = [
+                ids[i][cursors[i]]
+                for i in range(first_essential, len(terms))
+                if cursors[i] < len(ids[i])
+            ]
+            if len(candidates) == 0:
+                break
+            id = min(candidates)
+
+            scored += 1
+            score = 0.0
+            for i in range(first_essential, len(terms)):
+                if cursors[i] < len(ids[i]) and ids[i][cursors[i]] == id:
+                    score += contribution(i)
+                    cursors[i] += 1
+
+            # the non-essential terms are checked by decreasing bounds, until the
+            # document cannot reach the threshold anymore
+            for i in range(first_essential - 1, -1, -1):
+                if score + prefix_bounds[i] + PRUNING_TOLERANCE <= threshold:
+                    break
+                cursors[i] = bisect.bisect_left(ids[i], id, cursors[i])
+                if cursors[i] < len(ids[i]) and ids[i][cursors[i]] == id:
+                    score += contribution(i)
+                    cursors[i] += 1
+
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -id))
+                if len(heap) == k:
+                    threshold = heap[0][0]
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, -id))
+                threshold = heap[0][0]
+
+        if metrics.enabled:
+            # the postings skipped by the pruning are not counted
+            metrics.postings_scanned.inc(sum(cursors))
+            metrics.documents_scored.inc(scored)
+
+        return [(-id, score) for (score, id) in sorted(heap, reverse=True)]
+
     # return the ordered list of results
+    def query(self, query: str, k: Optional[int] = None) -> Dict[int, float]:
+        return self.evaluate(self.process_query(query), k)
+
     @timer
-    def query(self, query: str) -> Dict[int, float]:
-        return {
-            d[0]: d[1]
-            for d in list(
-                {
-                    k: v
-                    for k, v in sorted(
-                        self.compute_query(self.process_query(query)).items(),
-                        key=lambda x: x[1],
-                        reverse=True,
-                    )
-                }.items()
+    def evaluate(self, terms: List[str], k: Optional[int] = None) -> Dict[int, float]:
+        if k is not None:
+            return {id: score for (id, score) in self.compute_top_k(terms, k)}
+
+        # ties are broken by doc id, as in the top-k evaluation
+        return dict(
+            sorted(
+                self.compute_query(terms).items(), key=lambda item: (-item[1], item[0])
             )
-        }
+        )
+
+    def normalize_query(self, query: str) -> str:
+        return self.normalize_processed_query(self.process_query(query))
+
+    def normalize_processed_query(self, terms: List[str]) -> str:
+        # the documents scores do not depend on the order of the query terms
+        return " ".join(sorted(terms))
+
+    def ponderations(
+        self,
+    ) -> Tuple[
+        DocumentPonderation, TermPonderation, DocumentPonderation, TermPonderation
+    ]:
+        return (
+            self.document_ponderation,
+            self.term_ponderation,
+            self.query_ponderation,
+            self.query_term_ponderation,
+        )
 
     def __str__(self) -> str:
         return f"{EngineType.VECTORIAL_SEARCH.value} (documents ponderations: {self.document_ponderation}, {self.term_ponderation} ; query ponderations: {self.query_ponderation}, {self.query_term_ponderation})"
 
     def set_document_ponderation(self, ponderation: DocumentPonderation):
         self.document_ponderation = ponderation
+        self.invalidate_cache()
 
     def set_term_ponderation(self, ponderation: TermPonderation):
         self.term_ponderation = ponderation
+        self.invalidate_cache()
 
     def set_query_ponderation(self, ponderation: DocumentPonderation):
         self.query_ponderation = ponderation
+        self.invalidate_cache()
 
     def set_query_term_ponderation(self, ponderation: TermPonderation):
         self.query_term_ponderation = ponderation
+        self.invalidate_cache()
 
     def type(self) -> str:
         return EngineType.VECTORIAL_SEARCH
+
+
+@timer
+def compute_norms(
+    index: InvertedIndex,
+    stats: Stats,
+    ponderations: Optional[List[Tuple[DocumentPonderation, TermPonderation]]] = None,
+) -> Norms:
+    # computes the norms of the documents for the given ponderations pairs (all of them
+    # by default) in a single pass over the postings
+    if ponderations is None:
+        ponderations = list(itertools.product(DocumentPonderation, TermPonderation))
+
+    engine = VectorialSearchEngine(index, stats)
+    document_ponderations = list(set(dp for (dp, _) in ponderations))
+    term_ponderations = list(set(tp for (_, tp) in ponderations))
+    size = stats.size
+    squares: Dict[Tuple[DocumentPonderation, TermPonderation], np.ndarray] = {
+        pair: np.zeros(size) for pair in ponderations
+    }
+
+    for term in index.entries:
+        ids, frequencies = postings_arrays(index.entries[term][1])
+        term_weights = {tp: engine.term_weight(term, tp) for tp in term_ponderations}
+
+        for dp in document_ponderations:
+            w = engine.document_weights(ids, frequencies, dp)
+            for tp in term_ponderations:
+                if (dp, tp) in squares:
+                    # the ids of a postings list are unique
+                    squares[(dp, tp)][ids] += (w * term_weights[tp]) ** 2
+
+    norms = Norms()
+    arrays: Dict[Tuple[DocumentPonderation, TermPonderation], np.ndarray] = {}
+    for (pair, s) in squares.items():
+        arrays[pair] = np.sqrt(s)
+        norms.set(*pair, arrays[pair])
+
+    # second pass for the bounds of the terms normalized weights, that top-k queries use,
+    # indexed by term id
+    bounds: Dict[Tuple[DocumentPonderation, TermPonderation], np.ndarray] = {
+        pair: np.zeros((2, len(index.entries))) for pair in ponderations
+    }
+    for (i, term) in enumerate(sorted_terms(index.entries)):
+        ids, frequencies = postings_arrays(index.entries[term][1])
+        if len(ids) == 0:
+            continue
+        term_weights = {tp: engine.term_weight(term, tp) for tp in term_ponderations}
+
+        for dp in document_ponderations:
+            w = engine.document_weights(ids, frequencies, dp)
+            for tp in term_ponderations:
+                if (dp, tp) not in bounds:
+                    continue
+                n = arrays[(dp, tp)][ids]
+                v = np.zeros(len(ids))
+                np.divide(w * term_weights[tp], n, out=v, where=n > 0)
+                bounds[(dp, tp)][:, i] = (v.min(), v.max())
+
+    for ((dp, tp), b) in bounds.items():
+        norms.set_bounds(dp, tp, b)
+
+    return norms
@@ -0,0 +1,195 @@
+from typing import Any, Dict, Iterable, List, Optional
+from beagle.lexicon import terms_with_prefix
+from beagle.logging import timer
+import heapq
+import mmap
+import re
+import struct
+import numpy as np
+
+KGRAMS_FILE_NAME = "kgrams.bin"
+
+# a wildcard stands for any sequence of characters, possibly empty
+WILDCARD = "*"
+# the terms are padded with a boundary marker, so that the k-grams of `oncolog*` tell
+# that a term starts with "onc" and the ones of `*carcinoma` that it ends with "oma"
+BOUNDARY = "$"
+K = 3
+# the number of terms a wildcard can be expanded into: the most frequent matches are
+# kept when there are more
+MAX_EXPANSIONS = 100
+
+# binary k-grams layout: a header, the sorted k-grams with the position and length of
+# their term ids, then the term ids arrays
+KGRAMS_MAGIC = b"BGLK"
+KGRAMS_VERSION = 1
+KGRAMS_HEADER = struct.Struct("<4sHHQQ")  # magic, version, k, k-grams, terms
+KGRAM_RECORD = struct.Struct("<QQ")  # term ids offset, term ids number
+KGRAM_LENGTH = struct.Struct("<H")
+
+
+def is_wildcard(token: str) -> bool:
+    return WILDCARD in token
+
+
+def term_kgrams(term: str, k: int = K) -> Iterable[str]:
+    padded = BOUNDARY + term + BOUNDARY
+    return {padded[i : i + k] for i in range(max(len(padded) - k + 1, 1))}
+
+
+def pattern_kgrams(pattern: str, k: int = K) -> List[str]:
+    # the k-grams that all the terms matching the pattern contain: the ones of its
+    # fixed parts, which are too short to give any k-gram when shorter than k
+    kgrams = set()
+    for part in (BOUNDARY + pattern + BOUNDARY).split(WILDCARD):
+        for i in range(len(part) - k + 1):
+            kgrams.add(part[i : i + k])
+    return sorted(kgrams)
+
+
+def pattern_regex(pattern: str) -> "re.Pattern":
+    return re.compile(
+        ".*".join(re.escape(part) for part in pattern.split(WILDCARD)) + r"\Z",
+        re.DOTALL,
+    )
+
+
+# k-gram index of the vocabulary of an index: maps every k-gram to the sorted ids of
+# the terms that contain it, a term id being the rank of the term in the vocabulary
+# sorted by UTF-8 bytes (its id in the lexicon of a binary index). The terms matching a
+# wildcard pattern are among the ones containing all its k-grams, and a post-filter
+# drops the false matches of this intersection (`re*d` has the k-grams of "red" and
+# "rated" but also of "dread").
+class KGramIndex:
+    def __init__(self, k: int = K) -> None:
+        self.k: int = k
+        self.kgrams: Dict[str, np.ndarray] = {}
+        self.terms_number: int = 0
+        # the sorted vocabulary, for the entries that cannot give a term from its id
+        self.terms: Optional[List[str]] = None
+
+    @staticmethod
+    @timer
+    def build(entries: Any, k: int = K) -> "KGramIndex":
+        kgrams_index = KGramIndex(k)
+        if hasattr(entries, "term"):
+            terms: Iterable[str] = iter(entries)
+        else:
+            kgrams_index.terms = sorted(entries, key=lambda t: t.encode("utf-8"))
+            terms = kgrams_index.terms
+
+        ids: Dict[str, List[int]] = {}
+        for (i, term) in enumerate(terms):
+            for kgram in term_kgrams(term, k):
+                if kgram in ids:
+                    ids[kgram].append(i)
+                else:
+                    ids[kgram] = [i]
+            kgrams_index.terms_number += 1
+
+        kgrams_index.kgrams = {
+            kgram: np.array(term_ids, dtype=np.uint32)
+            for (kgram, term_ids) in ids.items()
+        }
+        return kgrams_index
+
+    def term(self, entries: Any, i: int) -> str:
+        if hasattr(entries, "term"):
+            return entries.term(i).decode("utf-8")
+        if self.terms is None:
+            self.terms = sorted(entries, key=lambda t: t.encode("utf-8"))
+        return self.terms[i]
+
+    def candidates(self, pattern: str, entries: Any) -> Iterable[str]:
+        # the terms containing all the k-grams of the pattern, from the rarest k-gram,
+        # or the whole vocabulary when the pattern has none (such as `*a*`)
+        kgrams = pattern_kgrams(pattern, self.k)
+        if len(kgrams) == 0:
+            return iter(entries)
+
+        arrays = []
+        for kgram in kgrams:
+            if kgram not in self.kgrams:
+                return []
+            arrays.append(self.kgrams[kgram])
+        arrays.sort(key=len)
+
+        ids = arrays[0]
+        for array in arrays[1:]:
+            ids = np.intersect1d(ids, array, assume_unique=True)
+            if len(ids) == 0:
+                return []
+        return (self.term(entries, i) for i in ids.tolist())
+
+    def expand(
+        self, pattern: str, entries: Any, max_expansions: int = MAX_EXPANSIONS
+    ) -> List[str]:
+        # the sorted terms of the entries matching the pattern
+        if not is_wildcard(pattern):
+            return [pattern] if pattern in entries else []
+
+        prefix = pattern[:-1]
+        if pattern.endswith(WILDCARD) and not is_wildcard(prefix):
+            # a range of the sorted vocabulary, without any false match
+            matches = list(terms_with_prefix(entries, prefix))
+        else:
+            regex = pattern_regex(pattern)
+            matches = [t for t in self.candidates(pattern, entries) if regex.match(t)]
+
+        if len(matches) > max_expansions:
+            matches = heapq.nlargest(
+                max_expansions, matches, key=lambda t: entries[t][0]
+            )
+        return sorted(matches)
+
+    @timer
+    def save(self, path: str) -> None:
+        kgrams = sorted(self.kgrams)
+        with open(path, "wb") as f:
+            f.write(
+                KGRAMS_HEADER.pack(
+                    KGRAMS_MAGIC, KGRAMS_VERSION, self.k, len(kgrams), self.terms_number
+                )
+            )
+            offset = 0
+            for kgram in kgrams:
+                raw_kgram = kgram.encode("utf-8")
+                f.write(KGRAM_LENGTH.pack(len(raw_kgram)) + raw_kgram)
+                f.write(KGRAM_RECORD.pack(offset, len(self.kgrams[kgram])))
+                offset += self.kgrams[kgram].nbytes
+            # the term ids arrays start on a 4 bytes boundary to be mapped as is
+            f.write(b"\0" * (-f.tell() % 4))
+            for kgram in kgrams:
+                f.write(self.kgrams[kgram].tobytes())
+
+
+@timer
+def load_kgrams(path: str) -> KGramIndex:
+    # the term ids arrays are memory-mapped, and only the ones of the k-grams of the
+    # queried patterns are read
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, k, kgrams_number, terms_number = KGRAMS_HEADER.unpack_from(data, 0)
+    if magic != KGRAMS_MAGIC or version != KGRAMS_VERSION:
+        raise Exception(f"{path} is not a supported k-grams file")
+
+    records = []
+    pos = KGRAMS_HEADER.size
+    for _ in range(kgrams_number):
+        (length,) = KGRAM_LENGTH.unpack_from(data, pos)
+        pos += KGRAM_LENGTH.size
+        kgram = data[pos : pos + length].decode("utf-8")
+        offset, count = KGRAM_RECORD.unpack_from(data, pos + length)
+        pos += length + KGRAM_RECORD.size
+        records.append((kgram, offset, count))
+    pos += -pos % 4
+
+    kgrams_index = KGramIndex(k)
+    kgrams_index.terms_number = terms_number
+    for (kgram, offset, count) in records:
+        kgrams_index.kgrams[kgram] = np.frombuffer(
+            data, dtype=np.uint32, count=count, offset=pos + offset
+        )
+
+    return kgrams_index
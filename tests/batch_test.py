@@ -0,0 +1,59 @@
+import pytest
+import io
+import json
+from beagle.batch import run_batch, read_queries, percentile
+from beagle.binary_search_engine import BinarySearchEngine
+from beagle.collection import Shard, Document
+from beagle.index import InvertedIndexType, DocIndex
+
+
+@pytest.fixture()
+def engine(monkeypatch):
+    monkeypatch.setattr("beagle.binary_search_engine.lemmatize", lambda token: token)
+
+    s = Shard("", "")
+    doc_index = DocIndex()
+    for i in range(50):
+        d = Document(f"d{i}", f"/d{i}", i)
+        d.tokens = [f"t{i % j}" for j in range(1, 8)]
+        s.documents.append(d)
+        doc_index.add(i, d.name, d.path)
+
+    return BinarySearchEngine(s.index(InvertedIndexType.DOCUMENTS_INDEX)), doc_index
+
+
+QUERIES = [f"t{i % 7} AND t{i % 5}" for i in range(40)] + ["t1 AND AND"]
+
+
+class TestBatch:
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_results_in_input_order(self, engine, workers):
+        output = io.StringIO()
+        summary = run_batch(*engine, QUERIES, output, workers, chunk_size=4)
+
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert [line["query"] for line in lines] == QUERIES
+        for (query, line) in zip(QUERIES[:-1], lines):
+            assert [r["id"] for r in line["results"]] == list(
+                engine[0].query(query).keys()
+            )
+        assert "error" in lines[-1]
+
+        assert summary.to_dict()["queries"] == len(QUERIES)
+        assert summary.errors == 1
+
+    def test_top_k(self, engine):
+        output = io.StringIO()
+        run_batch(*engine, ["t1"], output, k=2)
+        assert json.loads(output.getvalue())["count"] == 2
+
+    def test_read_queries(self, tmp_path):
+        path = tmp_path / "queries.txt"
+        path.write_text("cat\n\n  dog AND bird \n")
+        assert read_queries(str(path)) == ["cat", "dog AND bird"]
+
+    def test_percentile(self):
+        values = [float(i) for i in range(1, 101)]
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile([], 0.5) == 0
@@ -0,0 +1,123 @@
+import pytest
+import os
+import random
+from collections import Counter
+from beagle.bench import (
+    generate_corpus,
+    generate_queries,
+    time_queries,
+    synthetic_vocabulary,
+    zipf_weights,
+    StageTimings,
+    run_bench,
+    compare_results,
+)
+from beagle.index import InvertedIndex, InvertedIndexType
+from beagle.logging import timer, observers
+
+
+class TestCorpus:
+    def test_shards_layout(self, tmp_path):
+        corpus = generate_corpus(str(tmp_path), 25, 4, 100, 20)
+
+        assert sorted(os.listdir(tmp_path)) == ["0", "1", "2", "3"]
+        assert [len(os.listdir(tmp_path / s)) for s in ["0", "1", "2", "3"]] == [
+            7,
+            7,
+            7,
+            4,
+        ]
+        assert corpus["documents"] == 25
+        assert corpus["shards"] == 4
+
+    def test_deterministic(self, tmp_path):
+        generate_corpus(str(tmp_path / "a"), 10, 2, 100, 20, seed=1)
+        generate_corpus(str(tmp_path / "b"), 10, 2, 100, 20, seed=1)
+
+        for name in os.listdir(tmp_path / "a" / "0"):
+            assert (tmp_path / "a" / "0" / name).read_text() == (
+                tmp_path / "b" / "0" / name
+            ).read_text()
+
+    def test_zipf_frequencies(self, tmp_path):
+        corpus = generate_corpus(str(tmp_path), 50, 1, 1000, 200, stop_words=["the"])
+
+        tokens = Counter()
+        for name in os.listdir(tmp_path / "0"):
+            tokens.update((tmp_path / "0" / name).read_text().split())
+        words = corpus["words"]
+        assert words[0] == "the"
+        # the most frequent word is about twice as frequent as the second one
+        assert tokens[words[0]] > 1.5 * tokens[words[1]]
+        assert sum(tokens.values()) == corpus["tokens"]
+
+    def test_vocabulary_excludes_stop_words(self):
+        words = synthetic_vocabulary(1000, ["bebe", "the"])
+        assert words[:2] == ["bebe", "the"]
+        assert len(words) == len(set(words)) == 1002
+
+
+class TestBench:
+    def test_stage_timings(self):
+        @timer
+        def stage():
+            pass
+
+        with StageTimings() as timings:
+            stage()
+            stage()
+        stage()
+
+        assert observers == []
+        (name,) = timings.to_dict().keys()
+        assert name.endswith("stage")
+        assert timings.to_dict()[name]["calls"] == 2
+
+    def test_queries_terms_are_indexed(self):
+        index = InvertedIndex(InvertedIndexType.FREQUENCIES_INDEX)
+        index.entries = {"b": None, "d": None}
+        queries = generate_queries(
+            ["a", "b", "c", "d"], zipf_weights(4, 1.0), index, 8, random.Random(0)
+        )
+
+        terms = {t for q in queries["vectorial"] for t in q.split()}
+        assert terms <= {"b", "d"}
+
+    def test_queries_without_indexed_words(self):
+        index = InvertedIndex(InvertedIndexType.FREQUENCIES_INDEX)
+        index.entries = {"e": None}
+        with pytest.raises(Exception, match="none of the words"):
+            generate_queries(
+                ["a", "b"], zipf_weights(2, 1.0), index, 1, random.Random(0)
+            )
+
+    def test_failing_queries_are_raised(self):
+        class FailingEngine:
+            def query(self, query, k):
+                raise Exception(f"cannot answer {query}")
+
+        with pytest.raises(Exception, match="cannot answer b"):
+            time_queries(FailingEngine(), ["b"], None)
+
+    def test_run(self, tmp_path):
+        results = run_bench(
+            str(tmp_path),
+            scale=0.0002,
+            vocabulary_size=300,
+            mean_length=30,
+            index_type=InvertedIndexType.FREQUENCIES_INDEX,
+            queries_number=3,
+            stop_words=["the", "of"],
+        )
+
+        assert results["corpus"]["documents"] == 20
+        assert "Collection.index_stream" in results["index"]["stages"]
+        assert "load_index" in results["load"]["stages"]
+        runs = results["queries"]["runs"]
+        # the binary engine, then every pair of documents and queries ponderations
+        assert len(runs) == 1 + 15 * 15
+        assert all(run["queries"] == 3 and run["errors"] == 0 for run in runs)
+
+        comparisons = compare_results(results, results)
+        assert len(comparisons) > 0
+        assert all(c["ratio"] == 1 for c in comparisons if c["baseline"] > 0)
@@ -0,0 +1,79 @@
+import pytest
+import random
+from beagle.bitmap import (
+    Bitmap,
+    ArrayContainer,
+    BitsetContainer,
+    ARRAY_MAX_SIZE,
+    BITMAP_HEADER,
+    BITMAPS_HEADER,
+    save_bitmaps,
+    load_bitmaps,
+)
+
+
+def random_ids(rng, n, high):
+    return rng.sample(range(high), n)
+
+
+@pytest.fixture()
+def sets():
+    rng = random.Random(3)
+    # sparse and dense containers, spread over several high keys
+    return [
+        set(random_ids(rng, 50, 200000)),
+        set(random_ids(rng, 3000, 70000)) | set(range(10000, 20000)),
+        set(range(0, 140000, 3)),
+        set(),
+    ]
+
+
+class TestBitmap:
+    def test_from_ids(self, sets):
+        for s in sets:
+            b = Bitmap.from_ids(list(s))
+            assert list(b) == sorted(s)
+            assert len(b) == len(s)
+
+    def test_containers_kinds(self):
+        sparse = Bitmap.from_ids(range(ARRAY_MAX_SIZE))
+        dense = Bitmap.from_ids(range(ARRAY_MAX_SIZE + 1))
+        assert isinstance(sparse.containers[0], ArrayContainer)
+        assert isinstance(dense.containers[0], BitsetContainer)
+
+    def test_operations(self, sets):
+        for a in sets:
+            for b in sets:
+                x, y = Bitmap.from_ids(a), Bitmap.from_ids(b)
+                assert list(x & y) == sorted(a & b)
+                assert list(x | y) == sorted(a | b)
+                assert list(x - y) == sorted(a - b)
+                assert len(x & y) == len(a & b)
+
+    def test_contains(self, sets):
+        b = Bitmap.from_ids(sets[1])
+        for id in [0, 10000, 15000, 19999, 20000, 69999, 1 << 20]:
+            assert (id in b) == (id in sets[1])
+
+    def test_serialization(self, sets, tmp_path):
+        bitmaps = {f"t{i}": Bitmap.from_ids(s) for (i, s) in enumerate(sets)}
+        save_bitmaps(bitmaps, str(tmp_path / "bitmaps.bin"))
+        assert load_bitmaps(str(tmp_path / "bitmaps.bin")) == bitmaps
+
+    def test_header(self, tmp_path):
+        path = str(tmp_path / "bitmaps.bin")
+        save_bitmaps({"t": Bitmap.from_ids([1])}, path)
+        with open(path, "rb") as f:
+            data = f.read()
+        assert BITMAPS_HEADER.unpack_from(data, 0) == (b"BGLB", 1, 1)
+
+        # a newer version, and files written before the header
+        for raw in [
+            data[:4] + b"\x02\x00" + data[6:],
+            BITMAP_HEADER.pack(0),
+            data[BITMAPS_HEADER.size - BITMAP_HEADER.size :],
+        ]:
+            with open(path, "wb") as f:
+                f.write(raw)
+            with pytest.raises(Exception, match="not a supported bitmaps file"):
+                load_bitmaps(path)
@@ -1,5 +1,8 @@
 import pytest
-from beagle.binary_search_engine import merge, exclude, intersect
+from beagle.binary_search_engine import BinarySearchEngine, merge, exclude, intersect
+from beagle.bitmap import build_bitmaps
+from beagle.collection import Shard, Document
+from beagle.index import InvertedIndexType
 
 
 class TestMerge:
@@ -12,6 +15,9 @@ class TestMerge:
     def test_full_lists(self):
         assert sorted(merge([1, 6, 3], [2, 4, 5])) == [1, 2, 3, 4, 5, 6]
 
+    def test_overlapping_lists(self):
+        assert merge([1, 2, 5], [2, 3, 5, 8]) == [1, 2, 3, 5, 8]
+
 
 class TestIntersect:
     def test_one_empty_list(self):
@@ -33,3 +39,51 @@ class TestExclude:
 
     def test_full_lists(self):
         assert exclude([2, 3, 4, 5], [1, 2, 3]) == [4, 5]
+
+
+@pytest.fixture()
+def shard():
+    s = Shard("", "")
+    for (i, tokens) in enumerate(
+        [["cat", "dog"], ["cat"], ["dog", "bird"], ["cow", "cat", "bird"]]
+    ):
+        d = Document("", "", i)
+        d.tokens = tokens
+        s.documents.append(d)
+
+    return s
+
+
+@pytest.fixture(autouse=True)
+def no_lemmatization(monkeypatch):
+    monkeypatch.setattr("beagle.binary_search_engine.lemmatize", lambda token: token)
+
+
+class TestBinarySearchEngine:
+    @pytest.mark.parametrize("index_type", list(InvertedIndexType))
+    @pytest.mark.parametrize(
+        "query,expected",
+        [
+            ("cat", [0, 1, 3]),
+            ("cat AND dog", [0]),
+            ("cat OR bird", [0, 1, 2, 3]),
+            ("cat NAND bird", [0, 1]),
+            ("(dog OR cow) AND cat", [0, 3]),
+            ("unknown OR cow", [3]),
+        ],
+    )
+    def test_queries(self, shard, index_type, query, expected):
+        index = shard.index(index_type)
+        engine = BinarySearchEngine(index)
+        assert list(engine.query(query).keys()) == expected
+
+        index.compress()
+        assert list(BinarySearchEngine(index).query(query).keys()) == expected
+
+    def test_precomputed_bitmaps(self, shard):
+        index = shard.index(InvertedIndexType.DOCUMENTS_INDEX)
+        bitmaps = build_bitmaps(index, 2)
+        assert sorted(bitmaps.keys()) == ["bird", "cat", "dog"]
+
+        engine = BinarySearchEngine(index, bitmaps)
+        assert list(engine.query("cat NAND dog").keys()) == [1, 3]
@@ -1,5 +1,5 @@
 import pytest
-from beagle.collection import Document
+from beagle.collection import Collection, Document
 
 
 class TestDocumentFiltering:
@@ -55,3 +55,21 @@ def test_document_term_positions():
         "3": [1, [1]],
         "4": [1, [4]],
     }
+
+
+def test_dense_ids(tmp_path):
+    for (shard, names) in [("1", ["b", "a"]), ("0", ["c"]), ("10", ["d"])]:
+        (tmp_path / shard).mkdir()
+        for name in names:
+            (tmp_path / shard / name).write_text(name)
+
+    collection = Collection("", str(tmp_path))
+    collection.scan_shards()
+    collection.scan_documents()
+
+    assert [(d.name, d.id) for s in collection.shards for d in s.documents] == [
+        ("c", 0),
+        ("a", 1),
+        ("b", 2),
+        ("d", 3),
+    ]
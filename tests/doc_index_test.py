@@ -0,0 +1,70 @@
+import pytest
+import json
+import struct
+import sys
+from beagle.index import DOC_INDEX_HEADER, DocIndex, load_doc_index
+
+
+@pytest.fixture()
+def doc_index():
+    index = DocIndex()
+    for i in range(40):
+        index.add(10 ** 4 + i, f"doc{i}", f"/dataset/1/doc{i}")
+    index.add(3, "été", "/dataset/0/été")
+
+    return index
+
+
+class TestDocIndex:
+    def test_save_and_load(self, doc_index, tmp_path):
+        doc_index.save(str(tmp_path / "doc_index.bin"))
+        loaded = load_doc_index(str(tmp_path / "doc_index.bin"))
+
+        assert len(loaded) == 41
+        assert loaded.get(3) == {"name": "été", "path": "/dataset/0/été"}
+        # rows in the middle of a block are decoded from its first one
+        assert loaded.get(10017) == {"name": "doc17", "path": "/dataset/1/doc17"}
+        assert loaded.all_ids() == doc_index.all_ids()
+        assert 4 not in loaded
+        with pytest.raises(KeyError):
+            loaded.get(4)
+
+    def test_little_endian(self, doc_index, tmp_path, monkeypatch):
+        doc_index.save(str(tmp_path / "doc_index.bin"))
+        data = (tmp_path / "doc_index.bin").read_bytes()
+        assert data[DOC_INDEX_HEADER.size :].startswith(struct.pack("<qq", 3, 10 ** 4))
+
+        # a big-endian machine swaps the ids and offsets both ways
+        monkeypatch.setattr(sys, "byteorder", "big")
+        doc_index.save(str(tmp_path / "swapped.bin"))
+        loaded = load_doc_index(str(tmp_path / "swapped.bin"))
+        assert loaded.all_ids() == doc_index.all_ids()
+        assert loaded.get(10017) == {"name": "doc17", "path": "/dataset/1/doc17"}
+
+    def test_added_rows(self, doc_index, tmp_path):
+        doc_index.save(str(tmp_path / "doc_index.bin"))
+        loaded = load_doc_index(str(tmp_path / "doc_index.bin"))
+        loaded.add(3, "b", "/dataset/0/b")
+        loaded.add(4, "c", "/dataset/0/c")
+
+        assert len(loaded) == 42
+        assert loaded.get(3)["name"] == "b"
+
+    def test_legacy_json(self, tmp_path):
+        with open(tmp_path / "doc_index.json", "w") as f:
+            json.dump({"7": {"name": "a", "path": "/a"}}, f)
+
+        assert load_doc_index(str(tmp_path / "doc_index.json")).get(7) == {
+            "name": "a",
+            "path": "/a",
+        }
+
+    def test_lazy_format(self, doc_index):
+        formatted = doc_index.format_results({10001: 0.5, 4: 0.25})
+
+        assert len(formatted) == 2
+        assert formatted[0] == "doc1: 0.5 (/dataset/1/doc1)"
+        assert formatted[:1] == ["doc1: 0.5 (/dataset/1/doc1)"]
+        # the rows are only looked up when a line is built
+        with pytest.raises(KeyError):
+            formatted[1]
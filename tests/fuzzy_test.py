@@ -0,0 +1,105 @@
+import pytest
+import itertools
+from beagle.binary_search_engine import BinarySearchEngine
+from beagle.collection import Shard, Document
+from beagle.fuzzy import edit_distance
+from beagle.index import InvertedIndex, InvertedIndexType
+from beagle.vectorial_search_engine import VectorialSearchEngine
+
+
+def levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i]
+        for j in range(1, len(b) + 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (a[i - 1] != b[j - 1]),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+class TestEditDistance:
+    def test_same_as_unbounded(self):
+        words = ["", "a", "ab", "ba", "cat", "cart", "act", "tac", "kitten", "sitting"]
+        for (a, b) in itertools.product(words, repeat=2):
+            distance = levenshtein(a, b)
+            for max_edits in range(4):
+                expected = distance if distance <= max_edits else None
+                assert edit_distance(a, b, max_edits) == expected
+
+
+@pytest.fixture()
+def index():
+    index = InvertedIndex(InvertedIndexType.DOCUMENTS_INDEX)
+    for (df, term) in enumerate(
+        ["oncology", "oncologist", "carcinoma", "cancer", "dancer", "answer"]
+    ):
+        index.entries[term] = [df + 1, list(range(df + 1))]
+    return index
+
+
+class TestSimilarTerms:
+    def test_similar(self, index):
+        assert index.similar("onkology", 1, 10) == ["oncology"]
+        assert index.similar("carcinomma", 2, 10) == ["carcinoma"]
+        assert index.similar("oncologyst", 2, 10) == ["oncologist", "oncology"]
+        assert index.similar("zzz", 2, 10) == []
+        assert index.similar("onkology", 0, 10) == []
+
+    def test_order_and_limit(self, index):
+        # the closest terms first, then the most frequent ones
+        assert index.similar("canser", 2, 10) == ["cancer", "answer", "dancer"]
+        assert index.similar("canser", 2, 2) == ["cancer", "answer"]
+
+
+@pytest.fixture()
+def shard():
+    s = Shard("", "")
+    for (i, tokens) in enumerate(
+        [["oncology", "cat"], ["cancer"], ["carcinoma", "cat"], ["dancer"]]
+    ):
+        d = Document("", "", i)
+        d.tokens = tokens
+        s.documents.append(d)
+
+    return s
+
+
+@pytest.fixture(autouse=True)
+def no_lemmatization(monkeypatch):
+    monkeypatch.setattr("beagle.binary_search_engine.lemmatize", lambda token: token)
+    monkeypatch.setattr("beagle.vectorial_search_engine.lemmatize", lambda token: token)
+
+
+class TestFuzzyQueries:
+    def test_binary(self, shard):
+        index = shard.index(InvertedIndexType.DOCUMENTS_INDEX)
+
+        assert list(BinarySearchEngine(index).query("onkology")) == []
+        engine = BinarySearchEngine(index, max_edits=1)
+        assert list(engine.query("onkology")) == [0]
+        assert list(engine.query("cat AND NOT carcinomma")) == [0]
+        assert list(engine.query("ancer")) == [1, 3]
+        assert engine.normalize_query("zzzz AND cat") == "(cat AND zzzz)"
+
+    def test_budget(self, shard):
+        index = shard.index(InvertedIndexType.DOCUMENTS_INDEX)
+        engine = BinarySearchEngine(index, max_edits=1, fuzzy_budget=2)
+
+        # the first misspelled term uses the whole budget
+        assert list(engine.query("ancer OR onkology")) == [1, 3]
+
+    def test_vectorial(self, shard):
+        engine = VectorialSearchEngine(
+            shard.index(InvertedIndexType.FREQUENCIES_INDEX),
+            shard.compute_stats(),
+            max_edits=1,
+        )
+
+        assert engine.process_query("onkology cat") == ["oncology", "cat"]
+        assert set(engine.query("carcinomma")) == {2}
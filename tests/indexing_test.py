@@ -1,6 +1,16 @@
 import pytest
-from beagle.index import InvertedIndex, InvertedIndexType
-from beagle.collection import Shard, Document
+import os
+from beagle.index import (
+    InvertedIndex,
+    InvertedIndexType,
+    IndexFormat,
+    load_index,
+    benchmark_codecs,
+)
+from beagle.postings import Codec
+from beagle.pipeline import Pipeline, StopWordsFilter, Lemmatizer
+from beagle.collection import Collection, Shard, Document, index_shard
+from beagle.lemmatizer import LemmaCache
 
 
 @pytest.fixture()
@@ -82,3 +92,208 @@ class TestIndexing:
             "4": [1, [(1, 1, [1])]],
             "5": [1, [(2, 1, [0])]],
         }
+
+
+class TestBinaryIndex:
+    @pytest.mark.parametrize("index_type", list(InvertedIndexType))
+    @pytest.mark.parametrize("codec", list(Codec))
+    def test_round_trip(self, shard, tmp_path, index_type, codec):
+        idx = shard.index(index_type)
+        path = str(tmp_path / "index.bin")
+        idx.save(path, IndexFormat.BINARY, codec)
+
+        loaded = load_index(path)
+        assert loaded.type == index_type
+        assert len(loaded.entries) == len(idx.entries)
+        assert sorted(loaded.entries) == sorted(idx.entries)
+        for term in idx.entries:
+            assert loaded.entries[term][0] == idx.entries[term][0]
+            assert loaded.entries[term][1] == idx.entries[term][1]
+
+    def test_missing_term(self, shard, tmp_path):
+        path = str(tmp_path / "index.bin")
+        shard.index(InvertedIndexType.DOCUMENTS_INDEX).save(path, IndexFormat.BINARY)
+
+        loaded = load_index(path)
+        assert "6" not in loaded.entries
+        with pytest.raises(KeyError):
+            loaded.entries["6"]
+
+    def test_bounded_caches(self, shard, tmp_path, monkeypatch):
+        monkeypatch.setattr("beagle.index.RECORDS_CACHE_SIZE", 3)
+        monkeypatch.setattr("beagle.index.POSTINGS_CACHE_SIZE", 2)
+        path = str(tmp_path / "index.bin")
+        shard.index(InvertedIndexType.FREQUENCIES_INDEX).save(path, IndexFormat.BINARY)
+
+        entries = load_index(path).entries
+        for term in ["0", "2", "3", "2", "missing"]:
+            if term in entries:
+                entries[term][1]
+        # the least recently used terms are dropped first
+        assert list(entries.records_cache) == ["3", "2", "missing"]
+        assert list(entries.postings_cache) == ["3", "2"]
+
+    def test_json_format_is_detected(self, shard, tmp_path):
+        path = str(tmp_path / "index.json")
+        shard.index(InvertedIndexType.FREQUENCIES_INDEX).save(path)
+
+        loaded = load_index(path)
+        assert loaded.type == InvertedIndexType.FREQUENCIES_INDEX
+        assert loaded.entries["2"] == [2, [[0, 1], [1, 3]]]
+
+
+class TestCompressedIndex:
+    @pytest.mark.parametrize("index_type", list(InvertedIndexType))
+    def test_compress(self, shard, index_type):
+        idx = shard.index(index_type)
+        expected = {term: list(idx.entries[term]) for term in idx.entries}
+
+        idx.compress(Codec.VBYTE)
+        assert {term: list(idx.entries[term]) for term in idx.entries} == expected
+
+    def test_save_compressed(self, shard, tmp_path):
+        idx = shard.index(InvertedIndexType.POSITIONS_INDEX)
+        idx.compress(Codec.PACKED)
+        path = str(tmp_path / "index.bin")
+        idx.save(path, IndexFormat.BINARY, Codec.PACKED)
+
+        assert load_index(path).entries["2"][1] == [(0, 1, [2]), (1, 3, [2, 3, 4])]
+
+    def test_derive(self, shard):
+        idx = shard.index(InvertedIndexType.POSITIONS_INDEX)
+        assert (
+            idx.derive(InvertedIndexType.FREQUENCIES_INDEX).entries
+            == shard.index(InvertedIndexType.FREQUENCIES_INDEX).entries
+        )
+        assert (
+            idx.derive(InvertedIndexType.DOCUMENTS_INDEX).entries
+            == shard.index(InvertedIndexType.DOCUMENTS_INDEX).entries
+        )
+
+    def test_benchmark(self, shard):
+        results = benchmark_codecs(shard.index(InvertedIndexType.POSITIONS_INDEX))
+        assert len(results) == len(InvertedIndexType) * len(Codec)
+
+
+@pytest.fixture()
+def dataset(tmp_path):
+    for shard in range(3):
+        (tmp_path / str(shard)).mkdir()
+        for i in range(5):
+            tokens = [f"t{(shard * 7 + i * j) % 11}" for j in range(2 + i)] + ["the"]
+            (tmp_path / str(shard) / f"doc{i}").write_text(" ".join(tokens))
+
+    return str(tmp_path)
+
+
+def as_lists(index):
+    return {term: list(index.entries[term]) for term in index.entries}
+
+
+def as_decoded(index):
+    return {
+        term: [df, [p if isinstance(p, int) else tuple(p) for p in postings]]
+        for term, (df, postings) in index.entries.items()
+    }
+
+
+class TestStreamIndexing:
+    @pytest.mark.parametrize("index_type", list(InvertedIndexType))
+    def test_same_as_multiple_passes(self, dataset, index_type, monkeypatch):
+        # the wordnet data is not needed to compare both pipelines
+        monkeypatch.setattr(Document, "lemmatize", lambda self: None)
+
+        passes = Collection("test", dataset)
+        passes.scan_shards()
+        passes.scan_documents()
+        passes.load_documents()
+        passes.stop_words = ["the"]
+        passes.filter_documents()
+        expected_index = passes.index(index_type)
+        expected_stats = passes.compute_stats()
+
+        stream = Collection("test", dataset)
+        stream.scan_shards()
+        stream.scan_documents()
+        pipeline = Pipeline([StopWordsFilter(["the"])])
+        index, stats = stream.index_stream(index_type, pipeline)
+
+        assert index.entries == expected_index.entries
+        assert stats.to_dict() == expected_stats.to_dict()
+        assert all(len(d.tokens) == 0 for s in stream.shards for d in s.documents)
+        assert pipeline.stages[0].tokens_in == pipeline.tokens_number
+        assert pipeline.stages[0].tokens_out == pipeline.tokens_number - 15
+
+
+class TestParallelIndexing:
+    @pytest.mark.parametrize("index_type", list(InvertedIndexType))
+    def test_same_as_sequential(self, dataset, index_type, monkeypatch):
+        monkeypatch.setattr(Document, "lemmatize", lambda self: None)
+
+        sequential = Collection("test", dataset)
+        sequential.scan_shards()
+        sequential.scan_documents()
+        sequential.load_documents()
+        sequential.stop_words = ["the"]
+        sequential.filter_documents()
+        expected_index = sequential.index(index_type)
+        expected_stats = sequential.compute_stats()
+
+        parallel = Collection("test", dataset)
+        parallel.scan_shards()
+        parallel.scan_documents()
+        pipeline = Pipeline([StopWordsFilter(["the"])])
+        index, stats = parallel.index_in_parallel(index_type, 2, pipeline)
+
+        assert "the" not in index.entries
+        assert as_lists(index) == as_decoded(expected_index)
+        assert pipeline.files_number == 15
+        assert stats.documents_number == expected_stats.documents_number
+        assert stats.to_dict() == expected_stats.to_dict()
+
+    def test_only_new_lemmas_sent_back(self, dataset, monkeypatch):
+        class IdentityLemmatizer:
+            def lemmatize(self, token):
+                return token
+
+        cache = LemmaCache()
+        cache.lemmatizer = IdentityLemmatizer()
+        cache.update({"the": "the", "t0": "t0"})
+        monkeypatch.setattr("beagle.lemmatizer.lemma_cache", cache)
+
+        collection = Collection("test", dataset)
+        collection.scan_shards()
+        collection.scan_documents()
+        _, _, lemmas, _ = index_shard(
+            collection.shards[0],
+            InvertedIndexType.DOCUMENTS_INDEX,
+            Pipeline([Lemmatizer()]),
+            Codec.VBYTE,
+        )
+
+        assert "t1" in lemmas
+        assert "the" not in lemmas and "t0" not in lemmas
+        assert cache.learned is None
+
+
+class TestSpimiIndexing:
+    @pytest.mark.parametrize("index_type", list(InvertedIndexType))
+    def test_same_as_in_memory(self, dataset, tmp_path, index_type):
+        in_memory = Collection("test", dataset)
+        in_memory.scan_shards()
+        in_memory.scan_documents()
+        in_memory.load_documents()
+        expected_index = in_memory.index(index_type)
+        expected_stats = in_memory.compute_stats()
+
+        spimi = Collection("test", dataset)
+        spimi.scan_shards()
+        spimi.scan_documents()
+        path = str(tmp_path / "out" / "index.bin")
+        # a tiny budget forces a flush after every document
+        stats = spimi.index_spimi(index_type, path, 1, Pipeline([]))
+        index = load_index(path)
+
+        assert os.listdir(str(tmp_path / "out")) == ["index.bin"]
+        assert as_lists(index) == as_decoded(expected_index)
+        assert stats.to_dict() == expected_stats.to_dict()
@@ -0,0 +1,106 @@
+import pytest
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from beagle.lemmatizer import LemmaCache, load_lemma_cache
+
+
+class CountingLemmatizer:
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    def lemmatize(self, token):
+        self.calls += 1
+        # lets the other threads run in the middle of a miss
+        time.sleep(self.delay)
+        return token.rstrip("s")
+
+
+@pytest.fixture()
+def lemmatizer():
+    return CountingLemmatizer()
+
+
+class TestLemmaCache:
+    def test_unique_forms_are_lemmatized_once(self, lemmatizer):
+        cache = LemmaCache()
+        cache.lemmatizer = lemmatizer
+
+        assert [cache.lemmatize(t) for t in ["cats", "dogs", "cats", "cats"]] == [
+            "cat",
+            "dog",
+            "cat",
+            "cat",
+        ]
+        assert lemmatizer.calls == 2
+        assert cache.hits == 2
+        assert cache.misses == 2
+        assert cache.hit_rate() == 0.5
+
+    def test_lru(self, lemmatizer):
+        cache = LemmaCache(2)
+        cache.lemmatizer = lemmatizer
+
+        for t in ["a", "b", "a", "c", "a", "b"]:
+            cache.lemmatize(t)
+
+        # "b" was evicted by "c" since "a" was more recently used
+        assert list(cache.lemmas) == ["a", "b"]
+        assert lemmatizer.calls == 4
+
+    def test_lru_threads(self, lemmatizer):
+        cache = LemmaCache(8)
+        cache.lemmatizer = lemmatizer
+        tokens = [f"t{i}s" for i in range(32)]
+
+        def lemmatize_all(offset):
+            for i in range(2000):
+                token = tokens[(offset + i * 7) % len(tokens)]
+                assert cache.lemmatize(token) == token[:-1]
+
+        # the threads keep evicting the tokens the others just looked up
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lemmatize_all, range(4)))
+
+        assert len(cache.lemmas) == 8
+        assert cache.hits + cache.misses == 8000
+
+    def test_lru_threads_share_misses(self):
+        cache = LemmaCache(8)
+        cache.lemmatizer = CountingLemmatizer(delay=0.01)
+
+        # the threads wait for the first one to lemmatize the token
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            assert list(executor.map(cache.lemmatize, ["cats"] * 4)) == ["cat"] * 4
+
+        assert cache.lemmatizer.calls == 1
+        assert (cache.hits, cache.misses) == (3, 1)
+
+    def test_report(self, lemmatizer):
+        cache = LemmaCache()
+        cache.lemmatizer = lemmatizer
+
+        assert cache.report() is None
+        cache.lemmatize("cats")
+        assert "1 misses" in cache.report()
+        assert cache.report() is None
+
+    def test_pickle(self, lemmatizer):
+        cache = LemmaCache()
+        cache.lemmatizer = lemmatizer
+        cache.lemmatize("cats")
+
+        copy = pickle.loads(pickle.dumps(cache))
+        assert copy.lemmatizer is None
+        assert copy.lemmatize("cats") == "cat"
+
+    def test_persistence(self, lemmatizer, tmp_path):
+        cache = LemmaCache()
+        cache.lemmatizer = lemmatizer
+        cache.lemmatize("cats")
+        cache.save(str(tmp_path / "lemmas.json"))
+
+        loaded = load_lemma_cache(str(tmp_path / "lemmas.json"))
+        assert loaded.lemmas == {"cats": "cat"}
+        assert load_lemma_cache(str(tmp_path / "missing.json")).lemmas == {}
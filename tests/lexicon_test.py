@@ -0,0 +1,102 @@
+import pytest
+import struct
+from beagle.index import (
+    BINARY_INDEX_MAGIC,
+    HEADER,
+    LEGACY_DICTIONARY_RECORD,
+    BinaryIndexWriter,
+    InvertedIndexType,
+    MappedEntries,
+)
+from beagle.lexicon import Lexicon, LexiconWriter, prefix_successor, terms_with_prefix
+from beagle.postings import Codec, encode_postings
+
+TERMS = sorted(
+    {f"{a}{b}{c}" for a in "abc" for b in "xyz" for c in ["", "a", "ab", "é"]}
+    | {"", "\xff", "ca"}
+)
+
+
+@pytest.fixture()
+def lexicon():
+    writer = LexiconWriter(block_size=4)
+    for term in TERMS:
+        writer.add(term.encode("utf-8"))
+    return Lexicon(writer.to_bytes(), 0, len(TERMS), block_size=4)
+
+
+class TestLexicon:
+    def test_terms(self, lexicon):
+        raw_terms = [t.encode("utf-8") for t in TERMS]
+        assert [lexicon.term(i) for i in range(len(TERMS))] == raw_terms
+        assert list(lexicon.iter_terms()) == raw_terms
+        assert list(lexicon.iter_terms(5, 11)) == raw_terms[5:11]
+        with pytest.raises(IndexError):
+            lexicon.term(len(TERMS))
+
+    def test_find(self, lexicon):
+        for (i, term) in enumerate(TERMS):
+            assert lexicon.find(term.encode("utf-8")) == i
+        assert lexicon.find(b"bw") == -1
+        assert lexicon.find(b"\xff") == -1
+        assert lexicon.lower_bound(b"bw") == TERMS.index("bx")
+        assert lexicon.lower_bound(b"\xff") == len(TERMS)
+
+    def test_prefix_range(self, lexicon):
+        start, end = lexicon.prefix_range(b"by")
+        assert TERMS[start:end] == ["by", "bya", "byab", "byé"]
+        start, end = lexicon.prefix_range(b"")
+        assert (start, end) == (0, len(TERMS))
+        assert prefix_successor(b"a\xff") == b"b"
+        assert prefix_successor(b"\xff") is None
+
+
+class TestMappedLexicon:
+    def test_with_prefix(self, tmp_path):
+        path = str(tmp_path / "index.bin")
+        with BinaryIndexWriter(path, InvertedIndexType.DOCUMENTS_INDEX) as writer:
+            for (i, term) in enumerate(TERMS):
+                writer.add(term, 1, [i])
+        entries = MappedEntries(path)
+
+        assert list(entries.with_prefix("cz")) == ["cz", "cza", "czab", "czé"]
+        assert entries.term_id("bya") == TERMS.index("bya")
+        assert entries.term_id("bw") is None
+        assert entries["czé"][1] == [TERMS.index("czé")]
+        assert list(entries) == TERMS
+        entries.close()
+
+    def test_legacy_file(self, tmp_path):
+        # second version: whole terms strings referenced by the dictionary records
+        terms = ["cat", "dog"]
+        postings = [
+            encode_postings([0, 2], False, False, Codec.VBYTE),
+            encode_postings([1], False, False, Codec.VBYTE),
+        ]
+        records = b""
+        strings = b""
+        offset = HEADER.size
+        for (term, data) in zip(terms, postings):
+            records += LEGACY_DICTIONARY_RECORD.pack(
+                len(strings), len(term), 1, offset, len(data)
+            )
+            strings += term.encode("utf-8")
+            offset += len(data)
+        header = HEADER.pack(
+            BINARY_INDEX_MAGIC, 2, 0, 1, 0, 2, offset, offset + len(records)
+        )
+        with open(tmp_path / "index.bin", "wb") as f:
+            f.write(header + b"".join(postings) + records + strings)
+
+        entries = MappedEntries(str(tmp_path / "index.bin"))
+        assert list(entries) == terms
+        assert entries["cat"][1] == [0, 2]
+        assert list(entries.with_prefix("d")) == ["dog"]
+        entries.close()
+
+
+def test_terms_with_prefix_of_a_dict():
+    assert list(terms_with_prefix({"dog": [], "cat": [], "do": []}, "do")) == [
+        "do",
+        "dog",
+    ]
@@ -0,0 +1,138 @@
+import pytest
+from beagle import metrics
+from beagle.metrics import Registry, Histogram
+from beagle.logging import timer, observers
+from beagle.binary_search_engine import BinarySearchEngine
+from beagle.collection import Shard, Document
+from beagle.index import InvertedIndexType
+from beagle.query_cache import QueryCache
+
+
+@pytest.fixture()
+def enabled():
+    metrics.registry.reset()
+    metrics.enable()
+    yield metrics.registry
+    metrics.disable()
+    metrics.registry.reset()
+
+
+@pytest.fixture()
+def engine(monkeypatch):
+    monkeypatch.setattr("beagle.binary_search_engine.lemmatize", lambda token: token)
+
+    s = Shard("", "")
+    for (i, tokens) in enumerate([["cat", "dog"], ["cat"], ["dog", "bird"]]):
+        d = Document(f"d{i}", f"/d{i}", i)
+        d.tokens = tokens
+        s.documents.append(d)
+
+    return BinarySearchEngine(s.index(InvertedIndexType.DOCUMENTS_INDEX))
+
+
+class TestRegistry:
+    def test_same_metric(self):
+        registry = Registry()
+        counter = registry.counter("requests_total", "requests", {"path": "/"})
+        counter.inc()
+        registry.counter("requests_total", "requests", {"path": "/"}).inc(2)
+        registry.counter("requests_total", "requests", {"path": "/stats"}).inc()
+
+        assert counter.value == 3
+        assert [v["value"] for v in registry.to_dict()["requests_total"]["values"]] == [
+            3,
+            1,
+        ]
+        with pytest.raises(Exception):
+            registry.gauge("requests_total", "requests", {"path": "/search"})
+
+    def test_gauge_function(self):
+        registry = Registry()
+        items = [1, 2]
+        registry.gauge("items", "items", function=lambda: len(items))
+        items.append(3)
+
+        assert registry.to_dict()["items"]["values"][0]["value"] == 3
+
+    def test_prometheus(self):
+        registry = Registry()
+        registry.counter("hits_total", "cache hits").inc(4)
+        histogram = registry.histogram(
+            "latency_seconds", "latency", {"stage": 'a "b"'}, buckets=[0.1, 1]
+        )
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        assert registry.to_prometheus().splitlines() == [
+            "# HELP hits_total cache hits",
+            "# TYPE hits_total counter",
+            "hits_total 4.0",
+            "# HELP latency_seconds latency",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{stage="a \\"b\\"",le="0.1"} 1.0',
+            'latency_seconds_bucket{stage="a \\"b\\"",le="1"} 2.0',
+            'latency_seconds_bucket{stage="a \\"b\\"",le="+Inf"} 3.0',
+            'latency_seconds_sum{stage="a \\"b\\""} 5.55',
+            'latency_seconds_count{stage="a \\"b\\""} 3.0',
+        ]
+
+    def test_reset(self):
+        registry = Registry()
+        counter = registry.counter("hits_total", "cache hits")
+        counter.inc()
+        registry.reset()
+
+        assert counter.value == 0
+        assert registry.counter("hits_total", "cache hits") is counter
+
+
+class TestHistogram:
+    def test_percentiles(self):
+        histogram = Histogram()
+        for _ in range(90):
+            histogram.observe(0.0015)
+        for _ in range(10):
+            histogram.observe(0.3)
+
+        assert histogram.percentile(0.5) == 0.002
+        assert histogram.percentile(0.95) == 0.5
+        assert histogram.to_dict()["count"] == 100
+
+
+class TestHooks:
+    def test_timer(self, enabled):
+        @timer
+        def stage():
+            pass
+
+        stage()
+        stage()
+
+        (value,) = [
+            v
+            for v in enabled.to_dict()["beagle_stage_seconds"]["values"]
+            if v["labels"]["stage"].endswith("stage")
+        ]
+        assert value["count"] == 2
+
+    def test_disabled(self, engine):
+        metrics.registry.reset()
+        engine.query("cat OR dog")
+
+        assert metrics.postings_scanned.value == 0
+        assert observers == []
+
+    def test_queries(self, enabled, engine):
+        engine.query("cat OR dog")
+
+        assert metrics.postings_scanned.value == 4
+        assert metrics.documents_scored.value == 3
+
+    def test_query_cache(self, enabled, engine):
+        engine.cache = QueryCache(10, 2 ** 20)
+        engine.search("cat")
+        engine.search("cat")
+
+        assert metrics.query_cache_hits.value == 1
+        assert metrics.query_cache_misses.value == 1
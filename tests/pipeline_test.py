@@ -0,0 +1,55 @@
+import pytest
+from beagle.pipeline import (
+    Pipeline,
+    StopWordsFilter,
+    Normalizer,
+    SAMPLING_PERIOD,
+    default_pipeline,
+)
+
+
+@pytest.fixture()
+def path(tmp_path):
+    p = tmp_path / "doc"
+    p.write_text("The Cat\nsat on the MAT\n\n the end")
+    return str(p)
+
+
+class TestPipeline:
+    def test_stages_order(self, path):
+        pipeline = Pipeline([Normalizer(), StopWordsFilter(["the", "on"])])
+        assert list(pipeline.tokens(path)) == ["cat", "sat", "mat", "end"]
+
+        pipeline = Pipeline([StopWordsFilter(["the", "on"]), Normalizer()])
+        assert list(pipeline.tokens(path)) == ["the", "cat", "sat", "mat", "end"]
+
+    def test_default_pipeline(self, path, monkeypatch):
+        monkeypatch.setattr("beagle.pipeline.lemmatize", lambda token: token)
+
+        pipeline = default_pipeline(["the", "on"])
+        assert list(pipeline.tokens(path)) == ["cat", "sat", "mat", "end"]
+        assert [stage.name() for stage in default_pipeline().stages] == [
+            "normalize",
+            "lemmatize",
+        ]
+
+    def test_counters(self, path):
+        pipeline = Pipeline([Normalizer(), StopWordsFilter(["the", "on"])])
+        for _ in range(SAMPLING_PERIOD):
+            list(pipeline.tokens(path))
+
+        assert pipeline.files_number == SAMPLING_PERIOD
+        assert pipeline.tokens_number == 8 * SAMPLING_PERIOD
+        assert pipeline.stages[1].tokens_in == 8 * SAMPLING_PERIOD
+        assert pipeline.stages[1].tokens_out == 4 * SAMPLING_PERIOD
+        assert pipeline.stages[0].sampled_tokens == 8
+        assert len(pipeline.report()) == 3
+
+    def test_merge(self, path):
+        pipeline = Pipeline([Normalizer()])
+        other = Pipeline([Normalizer()])
+        list(other.tokens(path))
+
+        pipeline.merge(other)
+        assert pipeline.tokens_number == 8
+        assert pipeline.stages[0].tokens_out == 8
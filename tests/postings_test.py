@@ -0,0 +1,102 @@
+import pytest
+from beagle.postings import (
+    Codec,
+    BLOCK_SIZE,
+    vbyte_encode,
+    vbyte_decode,
+    pack_encode,
+    pack_decode,
+    encode_postings,
+    decode_postings,
+    decode_doc_ids,
+    decode_positions,
+    concatenate_postings,
+    gallop,
+)
+
+
+class TestGallop:
+    def test_gallop(self):
+        values = [1, 3, 5, 7, 9, 11, 13]
+        for target in range(15):
+            for start in range(len(values) + 1):
+                expected = start
+                while expected < len(values) and values[expected] < target:
+                    expected += 1
+                assert gallop(values, target, start) == expected
+
+
+class TestIntegersCoding:
+    def test_vbyte(self):
+        values = [0, 1, 127, 128, 300, 2 ** 32 - 1]
+        out = bytearray()
+        vbyte_encode(values, out)
+        assert vbyte_decode(bytes(out), 0, len(values)) == (values, len(out))
+
+    def test_pack(self):
+        values = [i * 7 % 300 for i in range(3 * BLOCK_SIZE + 5)]
+        out = bytearray()
+        pack_encode(values, out)
+        assert pack_decode(bytes(out), 0, len(values)) == (values, len(out))
+
+    def test_pack_zeros(self):
+        out = bytearray()
+        pack_encode([0, 0, 0], out)
+        assert pack_decode(bytes(out), 0, 3) == ([0, 0, 0], len(out))
+
+
+@pytest.fixture()
+def ids():
+    return [5 * i + i % 3 for i in range(2 * BLOCK_SIZE + 10)]
+
+
+@pytest.mark.parametrize("codec", list(Codec))
+class TestPostingsCoding:
+    def test_documents(self, ids, codec):
+        data = encode_postings(ids, False, False, codec)
+        assert decode_postings(data, False, False, codec) == ids
+        assert decode_doc_ids(data, False, False, codec) == ids
+
+    def test_frequencies(self, ids, codec):
+        postings = [(id, id % 4 + 1) for id in ids]
+        data = encode_postings(postings, True, False, codec)
+        assert decode_postings(data, True, False, codec) == postings
+        assert decode_doc_ids(data, True, False, codec) == ids
+
+    def test_positions(self, ids, codec):
+        postings = [(id, 2, [id % 3, id % 3 + 10]) for id in ids]
+        data = encode_postings(postings, True, True, codec)
+        assert decode_postings(data, True, True, codec) == postings
+        assert decode_doc_ids(data, True, True, codec) == ids
+
+    def test_positions_of_documents(self, ids, codec):
+        postings = [(id, 2, [id % 3, id % 3 + 10]) for id in ids]
+        data = encode_postings(postings, True, True, codec)
+        wanted = [ids[0], ids[3], ids[BLOCK_SIZE + 1], ids[-1]]
+        assert decode_positions(data, wanted, codec) == [
+            [id % 3, id % 3 + 10] for id in wanted
+        ]
+        assert decode_positions(data, [], codec) == []
+
+    def test_concatenate(self, ids, codec):
+        postings = [(id, 1, [id % 3]) for id in ids]
+        chunks = [
+            encode_postings(postings[:150], True, True, codec),
+            encode_postings([], True, True, codec),
+            encode_postings(postings[150:], True, True, codec),
+        ]
+        data = concatenate_postings(chunks, True, True, codec)
+        assert decode_postings(data, True, True, codec) == postings
+
+    def test_empty(self, codec):
+        assert (
+            decode_postings(encode_postings([], True, True, codec), True, True, codec)
+            == []
+        )
+
+
+def test_compression_ratio(ids):
+    postings = [(id, 1, [id % 7]) for id in ids]
+    raw = encode_postings(postings, True, True, Codec.RAW)
+    assert len(encode_postings(postings, True, True, Codec.VBYTE)) < len(raw) / 3
+    assert len(encode_postings(postings, True, True, Codec.PACKED)) < len(raw) / 3
@@ -0,0 +1,116 @@
+import pytest
+from beagle.binary_search_engine import BinarySearchEngine
+from beagle.collection import Shard, Document
+from beagle.index import InvertedIndexType
+from beagle.query_cache import QueryCache, results_size
+from beagle.search_engines import DocumentPonderation, TermPonderation
+from beagle.vectorial_search_engine import VectorialSearchEngine
+
+
+class TestQueryCache:
+    def test_lru(self):
+        cache = QueryCache(2, 2 ** 20)
+        cache.put(("a",), {1: 1.0})
+        cache.put(("b",), {2: 1.0})
+        assert cache.get(("a",)) == {1: 1.0}
+        cache.put(("c",), {3: 1.0})
+
+        assert cache.get(("b",)) is None
+        assert cache.get(("a",)) == {1: 1.0}
+        assert cache.get(("c",)) == {3: 1.0}
+        assert (cache.hits, cache.misses) == (3, 1)
+
+    def test_memory_bound(self):
+        results = {i: 1.0 for i in range(100)}
+        size = results_size(("a",), results)
+        cache = QueryCache(100, 2 * size)
+        cache.put(("a",), results)
+        cache.put(("b",), results)
+        cache.put(("c",), results)
+
+        assert list(cache.entries.keys()) == [("b",), ("c",)]
+        assert cache.bytes_number == 2 * size
+
+        cache.put(("d",), {i: 1.0 for i in range(1000)})
+        assert cache.get(("d",)) is None
+
+    def test_clear(self):
+        cache = QueryCache(10, 2 ** 20)
+        cache.put(("a",), {1: 1.0})
+        cache.clear()
+        assert cache.get(("a",)) is None
+        assert cache.bytes_number == 0
+        assert cache.invalidations == 1
+
+
+@pytest.fixture()
+def shard():
+    s = Shard("", "")
+    for (i, tokens) in enumerate(
+        [["cat", "dog", "dog"], ["cat"], ["dog", "bird"], ["cow", "cat", "bird"]]
+    ):
+        d = Document("", "", i)
+        d.tokens = tokens
+        s.documents.append(d)
+
+    return s
+
+
+@pytest.fixture(autouse=True)
+def no_lemmatization(monkeypatch):
+    monkeypatch.setattr("beagle.binary_search_engine.lemmatize", lambda token: token)
+    monkeypatch.setattr("beagle.vectorial_search_engine.lemmatize", lambda token: token)
+
+
+class TestCachedEngines:
+    def test_binary_canonical_queries(self, shard):
+        engine = BinarySearchEngine(shard.index(InvertedIndexType.POSITIONS_INDEX))
+        engine.cache = QueryCache(10, 2 ** 20)
+
+        results = engine.search("cat AND (dog OR bird)")
+        assert engine.search("(bird OR dog) AND cat") == results
+        assert engine.normalize_query("cat AND dog") != engine.normalize_query(
+            "cat NAND dog"
+        )
+        assert engine.normalize_query("cat NEAR/2 dog") == engine.normalize_query(
+            "dog NEAR/2 cat"
+        )
+        assert engine.normalize_query('"cat dog"') != engine.normalize_query(
+            '"dog cat"'
+        )
+        assert engine.cache.hits == 1
+
+    def test_results_copies(self, shard, monkeypatch):
+        engine = VectorialSearchEngine(
+            shard.index(InvertedIndexType.FREQUENCIES_INDEX), shard.compute_stats()
+        )
+        engine.cache = QueryCache(10, 2 ** 20)
+        processed = []
+        process_query = engine.process_query
+        monkeypatch.setattr(
+            engine, "process_query", lambda q: processed.append(q) or process_query(q)
+        )
+
+        results = engine.search("cat dog")
+        assert processed == ["cat dog"]
+        results.clear()
+        assert engine.search("dog cat") == engine.query("cat dog") != {}
+
+    def test_vectorial_ponderations(self, shard):
+        engine = VectorialSearchEngine(
+            shard.index(InvertedIndexType.FREQUENCIES_INDEX), shard.compute_stats()
+        )
+        engine.cache = QueryCache(10, 2 ** 20)
+
+        tf = engine.search("cat dog")
+        assert engine.search("dog cat") == tf
+        assert engine.cache.hits == 1
+        engine.search("dog cat", 1)
+        assert engine.cache.hits == 1
+
+        engine.set_term_ponderation(TermPonderation.NONE)
+        assert len(engine.cache.entries) == 0
+        assert engine.search("cat dog") == engine.query("cat dog")
+
+        engine.set_document_ponderation(DocumentPonderation.BINARY)
+        assert engine.search("cat dog") != tf
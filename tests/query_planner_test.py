@@ -0,0 +1,226 @@
+import pytest
+import tt
+from beagle.binary_search_engine import BinarySearchEngine
+from beagle.bitmap import Bitmap
+from beagle.collection import Shard, Document
+from beagle.index import InvertedIndexType
+from beagle.query_planner import (
+    AndPlan,
+    OrPlan,
+    TermPlan,
+    match_near,
+    match_phrase,
+    plan_query,
+)
+
+POSTINGS = {
+    "the": list(range(100)),
+    "melanoma": [3, 7, 42],
+    "oncology": [7, 42, 55, 60],
+    "cancer": [7, 8],
+    "skin": [1, 2],
+}
+
+
+def df(term):
+    return len(POSTINGS.get(term, []))
+
+
+def plan(query):
+    return plan_query(tt.BooleanExpression(query).tree, df)
+
+
+class TermBitmaps:
+    def __init__(self):
+        self.looked_up = []
+
+    def __call__(self, term):
+        self.looked_up.append(term)
+        return Bitmap.from_ids(POSTINGS[term])
+
+
+class TestPlanner:
+    def test_flattened_and_ordered_by_df(self):
+        p = plan("the AND (melanoma AND oncology)")
+        assert isinstance(p, AndPlan)
+        assert [o.term for o in p.operands] == ["melanoma", "oncology", "the"]
+        assert p.estimate == 3
+        assert p.cost == 107
+
+    def test_flattened_or(self):
+        p = plan("melanoma OR (cancer OR oncology)")
+        assert isinstance(p, OrPlan)
+        assert [o.term for o in p.operands] == ["cancer", "melanoma", "oncology"]
+        assert p.evaluate(TermBitmaps()).to_list() == [3, 7, 8, 42, 55, 60]
+
+    def test_evaluation(self):
+        term_bitmaps = TermBitmaps()
+        assert plan("the AND melanoma AND oncology").evaluate(
+            term_bitmaps
+        ).to_list() == [7, 42]
+        assert term_bitmaps.looked_up == ["melanoma", "oncology", "the"]
+
+    def test_and_not(self):
+        p = plan("the AND oncology AND NOT cancer")
+        assert [o.term for o in p.operands] == ["oncology", "the"]
+        assert [o.term for o in p.excluded] == ["cancer"]
+        assert p.evaluate(TermBitmaps()).to_list() == [42, 55, 60]
+
+    def test_nand(self):
+        p = plan("(the AND oncology) NAND cancer")
+        assert isinstance(p, AndPlan)
+        assert [o.term for o in p.excluded] == ["cancer"]
+        assert p.evaluate(TermBitmaps()).to_list() == [42, 55, 60]
+
+    def test_short_circuit(self):
+        term_bitmaps = TermBitmaps()
+        p = plan("the AND unknown AND melanoma")
+        assert p.estimate == 0 and p.cost == 0
+        assert p.evaluate(term_bitmaps).to_list() == []
+        assert term_bitmaps.looked_up == []
+
+        term_bitmaps = TermBitmaps()
+        assert (
+            plan("melanoma AND skin AND the AND NOT oncology")
+            .evaluate(term_bitmaps)
+            .to_list()
+            == []
+        )
+        assert term_bitmaps.looked_up == ["skin", "melanoma"]
+
+    def test_negation_alone(self):
+        assert plan("NOT cancer").evaluate(TermBitmaps()).to_list() == []
+
+    def test_explain(self):
+        assert plan("the AND melanoma AND NOT cancer").explain() == [
+            "AND (estimated documents: 3, cost: 105)",
+            "  melanoma (df: 3)",
+            "  the (df: 100)",
+            "  NOT",
+            "    cancer (df: 2)",
+        ]
+
+
+class TestProximity:
+    def test_match_phrase(self):
+        assert match_phrase([[1, 5, 9], [2, 7], [3, 20]])
+        assert not match_phrase([[1, 5, 9], [7, 10], [3, 20]])
+        assert match_phrase([[0, 4], [5], [6]])
+        assert not match_phrase([[4], [3]])
+
+    def test_match_near(self):
+        assert match_near([1, 20], [23], 3)
+        assert match_near([23], [1, 20], 3)
+        assert not match_near([1, 20], [24], 3)
+        assert not match_near([], [1], 3)
+
+
+@pytest.fixture()
+def positions_shard():
+    s = Shard("", "")
+    documents = [
+        ["new", "york", "city"],
+        ["york", "new", "city"],
+        ["new", "big", "york"],
+        ["city", "new", "york", "new"],
+    ]
+    # enough documents to span several postings blocks
+    documents += [["filler", "new", "filler", "york"]] * 300
+    documents.append(["new", "york"])
+    for (i, tokens) in enumerate(documents):
+        d = Document("", "", i)
+        d.tokens = tokens
+        s.documents.append(d)
+
+    return s
+
+
+@pytest.fixture(autouse=True)
+def no_lemmatization(monkeypatch):
+    monkeypatch.setattr("beagle.binary_search_engine.lemmatize", lambda token: token)
+
+
+class TestPhraseQueries:
+    @pytest.mark.parametrize("compressed", [False, True])
+    @pytest.mark.parametrize(
+        "query,expected",
+        [
+            ('"new york"', [0, 3, 304]),
+            ('"new york city"', [0]),
+            ('"york new"', [1, 3]),
+            ('"new"', [0, 1, 2, 3] + list(range(4, 305))),
+            ('"new york" AND city', [0, 3]),
+            ('"new york" NAND city', [304]),
+            ('"new york" OR "york new"', [0, 1, 3, 304]),
+            ('"new unknown"', []),
+            ("new NEAR/1 york", [0, 1, 3, 304]),
+            ("new NEAR/2 york", list(range(0, 305))),
+            ("(city NEAR/1 york) AND new", [0]),
+            ("(city NEAR/2 york) AND new", [0, 1, 3]),
+        ],
+    )
+    def test_queries(self, positions_shard, compressed, query, expected):
+        index = positions_shard.index(InvertedIndexType.POSITIONS_INDEX)
+        if compressed:
+            index.compress()
+        engine = BinarySearchEngine(index)
+
+        assert list(engine.query(query).keys()) == expected
+
+    def test_requires_positions(self, positions_shard):
+        engine = BinarySearchEngine(
+            positions_shard.index(InvertedIndexType.FREQUENCIES_INDEX)
+        )
+        with pytest.raises(Exception):
+            engine.query('"new york"')
+
+    @pytest.mark.parametrize(
+        "query", ["new NEAR/1 york NEAR/2 city", "new NEAR/1", "(new) NEAR/1 york"]
+    )
+    def test_invalid_proximity(self, positions_shard, query):
+        engine = BinarySearchEngine(
+            positions_shard.index(InvertedIndexType.POSITIONS_INDEX)
+        )
+        with pytest.raises(Exception, match="cannot be chained"):
+            engine.query(query)
+
+    @pytest.mark.parametrize("filtered", [True, False])
+    def test_stop_words(self, filtered):
+        s = Shard("", "")
+        documents = [
+            ["cancer", "of", "the", "lung"],
+            ["lung", "of", "the", "cancer"],
+            ["cancer", "lung"],
+        ]
+        for (i, tokens) in enumerate(documents):
+            d = Document("", "", i)
+            d.tokens = tokens
+            s.documents.append(d)
+        if filtered:
+            s.filter_documents(["of", "the"])
+        engine = BinarySearchEngine(
+            s.index(InvertedIndexType.POSITIONS_INDEX), stop_words=["of", "the"]
+        )
+
+        # the stop words are looked for when the index kept them
+        expected = [0, 2] if filtered else [0]
+        assert list(engine.query('"cancer of the lung"').keys()) == expected
+        if filtered:
+            with pytest.raises(Exception, match="only has stop words"):
+                engine.query('"of the"')
+            with pytest.raises(Exception, match="is a stop word"):
+                engine.query("cancer NEAR/2 the")
+        else:
+            assert list(engine.query("cancer NEAR/2 the").keys()) == [0, 1]
+
+    def test_explain(self, positions_shard):
+        engine = BinarySearchEngine(
+            positions_shard.index(InvertedIndexType.POSITIONS_INDEX)
+        )
+        assert engine.explain('city AND "new york"').split("\n") == [
+            "AND (estimated documents: 3, cost: 613)",
+            "  city (df: 3)",
+            "  PHRASE (estimated documents: 305, cost: 610)",
+            "    new (df: 305)",
+            "    york (df: 305)",
+        ]
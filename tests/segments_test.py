@@ -0,0 +1,174 @@
+import pytest
+import os
+from beagle.binary_search_engine import BinarySearchEngine
+from beagle.vectorial_search_engine import VectorialSearchEngine
+from beagle.collection import Collection
+from beagle.index import InvertedIndexType
+from beagle.pipeline import Pipeline
+from beagle.segments import (
+    Segment,
+    SegmentWatcher,
+    add_segment,
+    merge_segments,
+    plan_merges,
+    load_segments,
+    load_manifest,
+)
+
+
+@pytest.fixture(autouse=True)
+def identity_lemmas(monkeypatch):
+    monkeypatch.setattr("beagle.binary_search_engine.lemmatize", lambda token: token)
+    monkeypatch.setattr("beagle.vectorial_search_engine.lemmatize", lambda token: token)
+
+
+@pytest.fixture()
+def dataset(tmp_path):
+    path = tmp_path / "dataset"
+    write(path, "0", "a", "cat dog")
+    write(path, "0", "b", "cat")
+    write(path, "1", "c", "dog bird dog")
+    return path
+
+
+def write(dataset, shard, name, content):
+    os.makedirs(dataset / shard, exist_ok=True)
+    path = dataset / shard / name
+    path.write_text(content)
+    # the files are told apart by their size and modification time
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+
+
+def add(dataset, output, index_type=InvertedIndexType.POSITIONS_INDEX):
+    return add_segment(str(dataset), str(output) + "/", index_type, Pipeline([]))
+
+
+def search(output, query):
+    index, _, doc_index, _ = load_segments(str(output) + "/")
+    results = BinarySearchEngine(index).query(query)
+    return sorted(doc_index.get(id)["name"] for id in results)
+
+
+class TestSegments:
+    def test_first_segment(self, dataset, tmp_path):
+        output = tmp_path / "index"
+        segment = add(dataset, output)
+
+        assert segment.documents == 3
+        assert search(output, "cat") == ["a", "b"]
+        assert search(output, "dog AND NOT cat") == ["c"]
+        assert search(output, '"cat dog"') == ["a"]
+        # nothing changed
+        assert add(dataset, output) is None
+
+    def test_changes(self, dataset, tmp_path):
+        output = tmp_path / "index"
+        add(dataset, output)
+        ids = {
+            name: record[0]
+            for records in load_manifest(str(output)).documents.values()
+            for (name, record) in records.items()
+        }
+
+        write(dataset, "1", "d", "cat bird")
+        write(dataset, "0", "a", "bird")
+        os.remove(dataset / "0" / "b")
+        segment = add(dataset, output)
+
+        assert segment.documents == 2
+        assert search(output, "cat") == ["d"]
+        assert search(output, "bird") == ["a", "c", "d"]
+        assert search(output, '"cat dog"') == []
+        manifest = load_manifest(str(output))
+        assert manifest.documents["0"]["a"][0] == ids["a"]
+        assert "b" not in manifest.documents["0"]
+        assert manifest.segments[0].deleted == {ids["a"], ids["b"]}
+
+    def test_reused_ids(self, dataset, tmp_path):
+        output = tmp_path / "index"
+        add(dataset, output)
+        os.remove(dataset / "0" / "a")
+        write(dataset, "1", "d", "cat bird")
+        write(dataset, "2", "e", "cat")
+        add(dataset, output)
+
+        # the id of a is reused by d, which is lower than the one of e
+        documents = load_manifest(str(output)).documents
+        assert documents["1"]["d"][0] == 0
+        assert documents["2"]["e"][0] == 3
+        assert search(output, "cat") == ["b", "d", "e"]
+
+    def test_scores_match_a_full_index(self, dataset, tmp_path):
+        output = tmp_path / "index"
+        add(dataset, output, InvertedIndexType.FREQUENCIES_INDEX)
+        write(dataset, "1", "d", "cat bird bird")
+        write(dataset, "0", "b", "cat cat")
+        add(dataset, output, InvertedIndexType.FREQUENCIES_INDEX)
+
+        index, stats, doc_index, _ = load_segments(str(output) + "/")
+        results = VectorialSearchEngine(index, stats).query("cat bird")
+        scores = {doc_index.get(id)["name"]: s for (id, s) in results.items()}
+
+        collection = Collection("", str(dataset))
+        collection.scan_shards()
+        collection.scan_documents()
+        full_index, full_stats = collection.index_stream(
+            InvertedIndexType.FREQUENCIES_INDEX, Pipeline([])
+        )
+        full_results = VectorialSearchEngine(full_index, full_stats).query("cat bird")
+        names = {d.id: d.name for s in collection.shards for d in s.documents}
+        full_scores = {names[id]: s for (id, s) in full_results.items()}
+
+        assert scores.keys() == full_scores.keys()
+        for name in scores:
+            assert scores[name] == pytest.approx(full_scores[name])
+
+    def test_merge(self, dataset, tmp_path):
+        output = tmp_path / "index"
+        add(dataset, output)
+        for i in range(3):
+            write(dataset, "2", f"e{i}", f"cat e{i}")
+            add(dataset, output)
+        write(dataset, "0", "a", "bird")
+        add(dataset, output)
+        before = search(output, "cat OR bird")
+
+        assert merge_segments(str(output) + "/", merge_factor=2) > 0
+        manifest = load_manifest(str(output))
+        assert len(manifest.segments) < 5
+        assert all(len(s.deleted) == 0 for s in manifest.segments)
+        assert search(output, "cat OR bird") == before
+        assert search(output, '"cat e1"') == ["e1"]
+        assert sorted(os.listdir(output / "segments")) == sorted(
+            s.name for s in manifest.segments
+        )
+
+    def test_watcher(self, dataset, tmp_path):
+        output = tmp_path / "index"
+        add(dataset, output)
+        changes = []
+        watcher = SegmentWatcher(
+            str(output) + "/",
+            lambda index, stats, doc_index: changes.append(stats.documents_number),
+            generation=load_manifest(str(output)).generation,
+            merge_factor=None,
+        )
+
+        watcher.check()
+        write(dataset, "1", "d", "cat")
+        add(dataset, output)
+        watcher.check()
+
+        assert changes == [4]
+
+
+class TestMergePolicy:
+    def test_tiers(self):
+        segments = [Segment(f"s{i}", 5) for i in range(4)] + [Segment("big", 50)]
+        assert [[s.name for s in plan] for plan in plan_merges(segments, 3)] == [
+            ["s0", "s1", "s2"]
+        ]
+
+    def test_deleted_documents(self):
+        segments = [Segment("s0", 10, set(range(6))), Segment("s1", 10, {1})]
+        assert [[s.name for s in plan] for plan in plan_merges(segments, 3)] == [["s0"]]
@@ -0,0 +1,170 @@
+import pytest
+import asyncio
+import json
+import threading
+from beagle import metrics
+from beagle.binary_search_engine import BinarySearchEngine
+from beagle.collection import Shard, Document
+from beagle.index import InvertedIndexType, DocIndex
+from beagle.query_cache import QueryCache
+from beagle.search_engines import EngineType
+from beagle.server import Server
+from beagle.vectorial_search_engine import VectorialSearchEngine
+
+
+@pytest.fixture()
+def server(monkeypatch):
+    monkeypatch.setattr("beagle.binary_search_engine.lemmatize", lambda token: token)
+    monkeypatch.setattr("beagle.vectorial_search_engine.lemmatize", lambda token: token)
+
+    s = Shard("", "")
+    doc_index = DocIndex()
+    for (i, tokens) in enumerate([["cat", "dog", "dog"], ["cat"], ["dog", "bird"]]):
+        d = Document(f"d{i}", f"/d{i}", i)
+        d.tokens = tokens
+        s.documents.append(d)
+        doc_index.add(i, d.name, d.path)
+    index = s.index(InvertedIndexType.FREQUENCIES_INDEX)
+    stats = s.compute_stats()
+    cache = QueryCache(10, 2 ** 20)
+
+    def load_engine(engine_name):
+        if engine_name == EngineType.BINARY_SEARCH:
+            engine = BinarySearchEngine(index)
+        else:
+            engine = VectorialSearchEngine(index, stats)
+        engine.cache = cache
+        return engine
+
+    return Server(load_engine, doc_index, cache, concurrency=1, max_pending=1)
+
+
+async def request(port, method, target, body=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    writer.write(
+        f"{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\n\r\n".encode(
+            "latin-1"
+        )
+        + data
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), json.loads(payload)
+
+
+def run(server, *requests):
+    async def main():
+        s = await server.start("127.0.0.1", 0)
+        port = s.sockets[0].getsockname()[1]
+        try:
+            return await asyncio.gather(*[request(port, *r) for r in requests])
+        finally:
+            s.close()
+            await s.wait_closed()
+
+    return asyncio.run(main())
+
+
+class TestServer:
+    def test_search(self, server):
+        [(status, payload)] = run(server, ("GET", "/search?q=cat+AND+dog"))
+        assert status == 200
+        assert payload["count"] == 1
+        assert payload["results"][0]["name"] == "d0"
+
+    def test_engine_and_ponderations(self, server):
+        [(status, payload), (_, binary)] = run(
+            server,
+            (
+                "POST",
+                "/search",
+                {
+                    "query": "dog",
+                    "engine": "vectorial",
+                    "document_ponderation": "binary",
+                    "term_ponderation": "none",
+                    "k": 1,
+                },
+            ),
+            ("POST", "/search", {"query": "dog"}),
+        )
+        assert status == 200
+        assert payload["count"] == 1
+        assert "binary, none" in payload["engine"]
+        assert binary["count"] == 2
+
+    def test_errors(self, server):
+        responses = run(
+            server,
+            ("GET", "/search"),
+            ("GET", "/search?q=dog&engine=unknown"),
+            ("GET", "/search?q=dog&k=x"),
+            ("DELETE", "/search?q=dog"),
+            ("GET", "/unknown"),
+        )
+        assert [status for (status, _) in responses] == [400, 400, 400, 405, 404]
+        assert all("error" in payload for (_, payload) in responses)
+
+    def test_stats(self, server):
+        run(server, ("GET", "/search?q=dog"), ("GET", "/search?q=dog"))
+        [(status, stats)] = run(server, ("GET", "/stats"))
+        assert status == 200
+        assert stats["latencies"]["search"]["count"] == 2
+        assert stats["latencies"]["binary"]["count"] == 2
+        assert stats["cache"]["hits"] == 1
+
+    def test_new_ponderations_keep_cache(self, server):
+        run(server, ("GET", "/search?q=dog"))
+        run(server, ("GET", "/search?q=dog&engine=vectorial&term_ponderation=none"))
+        run(server, ("GET", "/search?q=dog"))
+        [(_, stats)] = run(server, ("GET", "/stats"))
+        assert stats["cache"]["hits"] == 1
+
+    def test_metrics(self, server):
+        metrics.registry.reset()
+        metrics.enable()
+        try:
+            run(server, ("GET", "/search?q=dog"))
+            [(status, payload)] = run(server, ("GET", "/metrics?format=json"))
+        finally:
+            metrics.disable()
+
+        assert status == 200
+        assert payload["beagle_search_seconds"]["values"][0]["count"] == 1
+        assert payload["beagle_server_running_queries"]["values"][0]["value"] == 0
+        assert metrics.registry.to_prometheus().startswith("# HELP")
+
+    def test_backpressure(self, server):
+        # the only slot is held by a blocked query, and a single query can wait for it
+        release = threading.Event()
+        load_engine = server.load_engine
+
+        def blocking_engine(engine_name):
+            engine = load_engine(engine_name)
+            evaluate = engine.evaluate
+            engine.evaluate = lambda q, k=None: release.wait() and evaluate(q, k)
+            return engine
+
+        server.load_engine = blocking_engine
+
+        async def main():
+            s = await server.start("127.0.0.1", 0)
+            port = s.sockets[0].getsockname()[1]
+            blocked = asyncio.ensure_future(request(port, "GET", "/search?q=dog"))
+            waiting = asyncio.ensure_future(request(port, "GET", "/search?q=cat"))
+            while server.pending == 0:
+                await asyncio.sleep(0.01)
+            rejected = await request(port, "GET", "/search?q=bird")
+            release.set()
+            responses = [await blocked, await waiting, rejected]
+            s.close()
+            await s.wait_closed()
+            return responses
+
+        responses = asyncio.run(main())
+        assert [status for (status, _) in responses] == [200, 200, 503]
+        assert server.rejected == 1
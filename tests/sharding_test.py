@@ -0,0 +1,205 @@
+import pytest
+import itertools
+from beagle.binary_search_engine import BinarySearchEngine
+from beagle.collection import Collection
+from beagle.index import INDEX_FILE_NAMES, IndexFormat, InvertedIndexType
+from beagle.norms import Norms
+from beagle.pipeline import Pipeline
+from beagle.search_engines import DocumentPonderation, TermPonderation
+from beagle.sharding import (
+    ShardedSearchEngine,
+    load_sharded_index,
+    save_shards_manifest,
+    shard_path,
+)
+from beagle.vectorial_search_engine import VectorialSearchEngine, compute_norms
+
+QUERIES = ["t1", "t2 t3", "t4 t4 t7", "t1 t9 t10 t0", "t5 unknown"]
+BINARY_QUERIES = ["t1", "t2 AND t3", "t4 OR t7", "t1 AND NOT t9", '"t3 t6"', "t1*"]
+
+
+@pytest.fixture()
+def dataset(tmp_path):
+    for shard in range(3):
+        (tmp_path / "dataset" / str(shard)).mkdir(parents=True)
+        for i in range(5):
+            tokens = [f"t{(shard * 7 + i * j) % 11}" for j in range(2 + 2 * i)]
+            (tmp_path / "dataset" / str(shard) / f"doc{i}").write_text(" ".join(tokens))
+
+    collection = Collection("test", str(tmp_path / "dataset"))
+    collection.scan_shards()
+    collection.scan_documents()
+    return collection
+
+
+@pytest.fixture()
+def indexes(dataset, tmp_path):
+    # the whole collection's index, and the one of each shard loaded from the disk
+    index, stats = dataset.index_stream(InvertedIndexType.POSITIONS_INDEX, Pipeline([]))
+    shard_indexes, shard_stats = dataset.index_shards(
+        InvertedIndexType.POSITIONS_INDEX, Pipeline([])
+    )
+    assert shard_stats.to_dict() == stats.to_dict()
+
+    names = [s.name for s in dataset.shards]
+    output = str(tmp_path / "index") + "/"
+    for (name, shard_index) in zip(names, shard_indexes):
+        shard_index.save(
+            shard_path(output, name) + INDEX_FILE_NAMES[IndexFormat.BINARY],
+            IndexFormat.BINARY,
+        )
+    save_shards_manifest(output, names)
+
+    return index, load_sharded_index(output), stats
+
+
+@pytest.fixture(autouse=True)
+def no_lemmatization(monkeypatch):
+    monkeypatch.setattr("beagle.binary_search_engine.lemmatize", lambda token: token)
+    monkeypatch.setattr("beagle.vectorial_search_engine.lemmatize", lambda token: token)
+
+
+def sharded_engine(sharded, create, workers=1):
+    return ShardedSearchEngine(
+        [create(shard, sharded) for shard in sharded.shards], sharded.names, workers
+    )
+
+
+class TestShardedIndex:
+    def test_same_entries(self, indexes):
+        index, sharded, _ = indexes
+
+        assert list(sharded.entries) == sorted(index.entries)
+        for term in index.entries:
+            assert sharded.entries[term][0] == index.entries[term][0]
+            assert sharded.entries[term][1] == [
+                tuple(p) for p in index.entries[term][1]
+            ]
+        assert "unknown" not in sharded.entries
+        with pytest.raises(KeyError):
+            sharded.entries["unknown"]
+
+    def test_positions(self, indexes):
+        index, sharded, _ = indexes
+
+        ids = index.doc_ids("t3")[::2]
+        assert sharded.positions("t3", ids) == index.positions("t3", ids)
+
+    def test_same_norms(self, indexes):
+        index, sharded, stats = indexes
+
+        norms = compute_norms(index, stats)
+        sharded_norms = compute_norms(sharded, stats)
+        for pair in itertools.product(DocumentPonderation, TermPonderation):
+            assert sharded_norms.get(*pair) == pytest.approx(norms.get(*pair))
+
+
+class TestShardedSearchEngine:
+    @pytest.mark.parametrize(
+        "ponderations", list(itertools.product(DocumentPonderation, TermPonderation))
+    )
+    def test_same_scores(self, indexes, ponderations):
+        index, sharded, stats = indexes
+        engine = VectorialSearchEngine(index, stats, *ponderations)
+        # the shards share the norms of the whole collection, computed on the first use
+        norms = Norms()
+        shards_engine = sharded_engine(
+            sharded,
+            lambda shard, vocabulary: VectorialSearchEngine(
+                shard, stats, *ponderations, norms=norms, vocabulary=vocabulary
+            ),
+        )
+
+        for query in QUERIES:
+            expected = engine.query(query)
+            results = shards_engine.query(query)
+            assert sorted(results) == sorted(expected)
+            for id in expected:
+                assert results[id] == pytest.approx(expected[id])
+
+            top = shards_engine.query(query, 4)
+            assert list(top.values()) == pytest.approx(list(expected.values())[:4])
+
+    def test_norms_computed_once(self, indexes, monkeypatch):
+        _, sharded, stats = indexes
+        calls = []
+
+        def counted_compute_norms(*args):
+            calls.append(args)
+            return compute_norms(*args)
+
+        monkeypatch.setattr(
+            "beagle.vectorial_search_engine.compute_norms", counted_compute_norms
+        )
+        norms = Norms()
+        shards_engine = sharded_engine(
+            sharded,
+            lambda shard, vocabulary: VectorialSearchEngine(
+                shard, stats, norms=norms, vocabulary=vocabulary
+            ),
+        )
+
+        shards_engine.query("t1 t2", 3)
+        shards_engine.query("t3")
+        assert len(calls) == 1
+
+    def test_global_idf(self, indexes):
+        index, sharded, stats = indexes
+        engine = VectorialSearchEngine(
+            sharded.shards[0], stats, vocabulary=sharded, max_edits=1
+        )
+
+        assert engine.idf("t1") == VectorialSearchEngine(index, stats).idf("t1")
+        # the query terms are looked up in the whole collection
+        assert engine.process_query("t1* t0") == ["t1", "t10", "t0"]
+
+    def test_same_boolean_results(self, indexes):
+        index, sharded, _ = indexes
+        engine = BinarySearchEngine(index)
+        shards_engine = sharded_engine(
+            sharded,
+            lambda shard, vocabulary: BinarySearchEngine(shard, vocabulary=vocabulary),
+        )
+
+        for query in BINARY_QUERIES:
+            assert list(shards_engine.query(query)) == list(engine.query(query))
+            assert list(shards_engine.query(query, 3)) == list(engine.query(query, 3))
+        assert shards_engine.normalize_query("t2 AND t1") == engine.normalize_query(
+            "t1 AND t2"
+        )
+        assert "shard 2:" in shards_engine.explain("t1 AND t2")
+
+    def test_workers(self, indexes):
+        _, sharded, stats = indexes
+
+        def create(workers):
+            return sharded_engine(
+                sharded,
+                lambda shard, vocabulary: VectorialSearchEngine(
+                    shard, stats, vocabulary=vocabulary
+                ),
+                workers,
+            )
+
+        # the shards are evaluated one after the other unless workers are asked for
+        sequential = create(1)
+        threaded = create(3)
+        for query in QUERIES:
+            assert threaded.query(query, 4) == sequential.query(query, 4)
+        assert sequential.executor is None
+        assert threaded.executor is not None
+
+    def test_ponderations(self, indexes):
+        _, sharded, stats = indexes
+        shards_engine = sharded_engine(
+            sharded,
+            lambda shard, vocabulary: VectorialSearchEngine(
+                shard, stats, vocabulary=vocabulary
+            ),
+        )
+
+        shards_engine.set_term_ponderation(TermPonderation.NONE)
+        assert all(
+            e.term_ponderation == TermPonderation.NONE for e in shards_engine.engines
+        )
+        assert shards_engine.ponderations()[1] == TermPonderation.NONE
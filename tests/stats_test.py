@@ -1,5 +1,15 @@
 import pytest
-from beagle.stats import Stats
+import json
+import struct
+import numpy as np
+from beagle.stats import STATS_HEADER, Stats, load_stats
+
+DOCUMENT = {
+    "tokens_number": 6,
+    "max_frequency": 3,
+    "sum_frequency": 6,
+    "unique_terms_number": 1,
+}
 
 
 class TestStatsUpdate:
@@ -7,31 +17,81 @@ class TestStatsUpdate:
         stats = Stats()
         stats.update(Stats())
 
-        assert len(stats.documents) == 0
+        assert len(stats) == 0
 
     def test_one_empty_update(self):
         stats = Stats()
-        initial_stats = {
-            "1": [3, [0, 2, 6]],
-            "2": [2, [3, 5]],
-            "3": [1, [1]],
-            "4": [1, [4]],
-        }
-        stats.documents["0"] = initial_stats
+        stats.add(0, DOCUMENT)
         stats.update(Stats())
 
-        assert len(stats.documents) == 1
-        assert stats.documents["0"] == initial_stats
+        assert len(stats) == 1
+        assert stats.get(0) == DOCUMENT
 
     def test_one_document_to_update(self):
         stats1 = Stats()
         stats2 = Stats()
 
-        stats1.documents["0"] = {"1": [3, [0, 2, 6]], "2": [2, [3, 5]]}
-        stats2.documents["1"] = {"3": [1, [1]], "4": [1, [4]]}
+        stats1.add(0, DOCUMENT)
+        stats2.add(10001, {**DOCUMENT, "tokens_number": 2})
 
         stats1.update(stats2)
 
-        assert len(stats1.documents) == 2
-        assert stats1.documents["0"] == {"1": [3, [0, 2, 6]], "2": [2, [3, 5]]}
-        assert stats1.documents["1"] == {"3": [1, [1]], "4": [1, [4]]}
+        assert stats1.ids().tolist() == [0, 10001]
+        assert stats1.get(0) == DOCUMENT
+        assert stats1.get(10001) == {**DOCUMENT, "tokens_number": 2}
+        assert 1 not in stats1
+
+    def test_selected_documents(self):
+        stats1 = Stats()
+        stats2 = Stats()
+        stats2.add(1, DOCUMENT)
+        stats2.add(2, DOCUMENT)
+
+        stats1.update(stats2, [2])
+
+        assert stats1.ids().tolist() == [2]
+        assert stats1.documents_number == 1
+
+
+class TestStatsFiles:
+    def test_save_and_load(self, tmp_path):
+        stats = Stats()
+        stats.add(3, DOCUMENT)
+        stats.add(10000, {**DOCUMENT, "max_frequency": 1})
+        stats.documents_number = 2
+        stats.save(str(tmp_path / "stats.bin"))
+
+        loaded = load_stats(str(tmp_path / "stats.bin"))
+
+        assert loaded.to_dict() == stats.to_dict()
+        assert loaded.documents_number == 2
+        assert loaded.tokens_number[3] == 6
+        # loaded columns are read-only views of the file, copied when changed
+        loaded.add(4, DOCUMENT)
+        assert loaded.ids().tolist() == [3, 4, 10000]
+
+    def test_little_endian(self, tmp_path):
+        stats = Stats()
+        stats.add(0, DOCUMENT)
+        stats.add(1, {**DOCUMENT, "tokens_number": 2 ** 20})
+        stats.documents_number = 2
+        stats.save(str(tmp_path / "stats.bin"))
+        data = (tmp_path / "stats.bin").read_bytes()
+        assert data[STATS_HEADER.size :].startswith(struct.pack("<II", 6, 2 ** 20))
+
+        # columns held in the other byte order are saved the same way
+        stats.columns = stats.columns.astype(">u4")
+        stats.save(str(tmp_path / "swapped.bin"))
+        assert (tmp_path / "swapped.bin").read_bytes() == data
+        loaded = load_stats(str(tmp_path / "swapped.bin"))
+        assert loaded.to_dict() == stats.to_dict()
+        assert loaded.columns.dtype == np.dtype("<u4")
+
+    def test_legacy_json(self, tmp_path):
+        with open(tmp_path / "stats.json", "w") as f:
+            json.dump({"documents_number": 1, "documents": {"7": DOCUMENT}}, f)
+
+        stats = load_stats(str(tmp_path / "stats.json"))
+
+        assert stats.to_dict() == {7: DOCUMENT}
+        assert stats.documents_number == 1
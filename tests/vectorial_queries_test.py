@@ -1,7 +1,13 @@
 import pytest
 import itertools
-from beagle.index import load_index, load_doc_index, InvertedIndex, DocIndex
-from beagle.stats import load_stats, Stats
+from beagle.index import (
+    load_index,
+    load_doc_index,
+    find_doc_index_file,
+    InvertedIndex,
+    DocIndex,
+)
+from beagle.stats import find_stats_file, load_stats, Stats
 from beagle.search_engines import DocumentPonderation, TermPonderation
 from beagle.vectorial_search_engine import VectorialSearchEngine
 from typing import List
@@ -16,12 +22,12 @@ def index() -> InvertedIndex:
 
 @pytest.fixture
 def stats() -> Stats:
-    return load_stats("./index/stats.json")
+    return load_stats(find_stats_file("./index/"))
 
 
 @pytest.fixture
 def mapping() -> DocIndex:
-    return load_doc_index("./index/doc_index.json")
+    return load_doc_index(find_doc_index_file("./index/"))
 
 
 def load_query(id: int) -> List[str]:
@@ -0,0 +1,233 @@
+import pytest
+import itertools
+import json
+import math
+import random
+from beagle.collection import Shard, Document
+from beagle.index import InvertedIndexType
+from beagle.norms import find_norms_file, load_norms, ponderations_key
+from beagle.search_engines import DocumentPonderation, TermPonderation
+from beagle.vectorial_search_engine import (
+    DEFAULT_PONDERATIONS,
+    VectorialSearchEngine,
+    compute_norms,
+)
+
+
+@pytest.fixture()
+def shard():
+    s = Shard("", "")
+    for (i, tokens) in enumerate(
+        [
+            ["cat", "dog", "dog", "bird"],
+            ["cat", "cat", "cat"],
+            ["dog", "fish", "bird", "bird", "cow"],
+            ["cow", "cat"],
+        ]
+    ):
+        d = Document("", "", i)
+        d.tokens = tokens
+        s.documents.append(d)
+
+    return s
+
+
+PONDERATIONS = list(itertools.product(DocumentPonderation, TermPonderation))
+
+
+class TestNorms:
+    @pytest.mark.parametrize("ponderations", PONDERATIONS)
+    def test_cosine(self, shard, ponderations):
+        index = shard.index(InvertedIndexType.FREQUENCIES_INDEX)
+        stats = shard.compute_stats()
+        engine = VectorialSearchEngine(index, stats, *ponderations)
+
+        scores = engine.compute_query(["cat", "bird"])
+
+        q, q_norm = engine.build_query_vector(["cat", "bird"])
+        for d in shard.documents:
+            if d.id not in scores:
+                continue
+            vector = {
+                t: engine.get_document_weight(f, t, d.id)
+                for (t, f) in d.term_frequencies().items()
+            }
+            norm = math.sqrt(sum(w ** 2 for w in vector.values()))
+            dot = sum(q[t] * vector.get(t, 0) for t in q)
+            expected = dot / (q_norm * norm) if norm > 0 else dot
+            assert scores[d.id] == pytest.approx(expected)
+
+    def test_lazy_norms_match_precomputed(self, shard, tmp_path):
+        index = shard.index(InvertedIndexType.FREQUENCIES_INDEX)
+        stats = shard.compute_stats()
+
+        compute_norms(index, stats).save(str(tmp_path / "norms.bin"))
+        norms = load_norms(str(tmp_path / "norms.bin"))
+
+        for ponderations in PONDERATIONS:
+            lazy = VectorialSearchEngine(index, stats, *ponderations)
+            assert lazy.document_norms() == pytest.approx(norms.get(*ponderations))
+            assert lazy.term_bounds() == pytest.approx(norms.get_bounds(*ponderations))
+
+    def test_pairs_read_on_use(self, shard, tmp_path):
+        index = shard.index(InvertedIndexType.FREQUENCIES_INDEX)
+        stats = shard.compute_stats()
+        compute_norms(index, stats, [DEFAULT_PONDERATIONS]).save(
+            str(tmp_path / "norms.bin")
+        )
+
+        norms = load_norms(str(tmp_path / "norms.bin"))
+        assert norms.records is None
+        assert norms.get(DocumentPonderation.LOG, TermPonderation.NONE) is None
+        assert norms.documents == {}
+        assert not norms.get(*DEFAULT_PONDERATIONS).flags.writeable
+        assert (
+            load_norms(str(tmp_path / "missing.bin")).get_bounds(*DEFAULT_PONDERATIONS)
+            is None
+        )
+
+    def test_legacy_norms(self, shard, tmp_path):
+        index = shard.index(InvertedIndexType.FREQUENCIES_INDEX)
+        stats = shard.compute_stats()
+        expected = compute_norms(index, stats, [DEFAULT_PONDERATIONS])
+        key = ponderations_key(*DEFAULT_PONDERATIONS)
+        (tmp_path / "norms.json").write_text(
+            json.dumps(
+                {
+                    "documents": {key: expected.documents[key].tolist()},
+                    "bounds": {key: {"cat": [0, 1]}},
+                }
+            )
+        )
+
+        norms = load_norms(find_norms_file(str(tmp_path)))
+        assert norms.get(*DEFAULT_PONDERATIONS) == pytest.approx(
+            expected.get(*DEFAULT_PONDERATIONS)
+        )
+        # the bounds of the legacy files were saved by term, and are computed again
+        assert norms.get_bounds(*DEFAULT_PONDERATIONS) is None
+        engine = VectorialSearchEngine(index, stats, norms=norms)
+        assert engine.term_bounds() == pytest.approx(
+            expected.get_bounds(*DEFAULT_PONDERATIONS)
+        )
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = random.Random(4)
+    vocabulary = [f"t{i}" for i in range(40)]
+
+    s = Shard("", "")
+    for i in range(300):
+        d = Document("", "", i)
+        d.tokens = [
+            vocabulary[min(int(rng.paretovariate(0.8)) - 1, 39)]
+            for _ in range(rng.randint(1, 30))
+        ]
+        s.documents.append(d)
+
+    index = s.index(InvertedIndexType.FREQUENCIES_INDEX)
+    stats = s.compute_stats()
+    return index, stats, compute_norms(index, stats)
+
+
+class TestTopK:
+    @pytest.mark.parametrize(
+        "ponderations",
+        [p + q for (p, q) in itertools.product(PONDERATIONS, repeat=2)][::11],
+    )
+    @pytest.mark.parametrize("k", [1, 10, 1000])
+    def test_same_as_exhaustive(self, corpus, ponderations, k):
+        index, stats, norms = corpus
+        engine = VectorialSearchEngine(index, stats, *ponderations, norms=norms)
+        query = ["t0", "t1", "t5", "t5", "t20"]
+
+        expected = sorted(engine.compute_query(query).values(), reverse=True)[:k]
+        top = engine.compute_top_k(query, k)
+
+        assert [score for (_, score) in top] == pytest.approx(expected)
+        scores = engine.compute_query(query)
+        for (id, score) in top:
+            assert scores[id] == pytest.approx(score)
+
+    def test_unknown_terms(self, corpus):
+        index, stats, norms = corpus
+        engine = VectorialSearchEngine(index, stats, norms=norms)
+        assert engine.compute_top_k(["unknown"], 10) == []
+
+    def test_ties_by_doc_id(self):
+        s = Shard("", "")
+        for (i, tokens) in enumerate([["b"], ["a"], ["c"], ["a", "b"]]):
+            d = Document("", "", i)
+            d.tokens = tokens
+            s.documents.append(d)
+        engine = VectorialSearchEngine(
+            s.index(InvertedIndexType.FREQUENCIES_INDEX), s.compute_stats()
+        )
+
+        # the documents 0 and 1 have the same score, and 1 matches first
+        assert list(engine.compute_query(["a", "b"]))[:2] == [1, 3]
+        assert list(engine.evaluate(["a", "b"])) == [3, 0, 1]
+        assert list(engine.evaluate(["a", "b"], 2)) == [3, 0]
+
+    def test_bounds_by_term_id(self, shard):
+        index = shard.index(InvertedIndexType.FREQUENCIES_INDEX)
+        stats = shard.compute_stats()
+        norms = compute_norms(index, stats, [DEFAULT_PONDERATIONS])
+        engine = VectorialSearchEngine(index, stats)
+
+        assert norms.get(DocumentPonderation.LOG, TermPonderation.NONE) is None
+        bounds = norms.get_bounds(*DEFAULT_PONDERATIONS)
+        assert bounds.shape == (2, len(index.entries))
+        assert index.term_id("bird") == 0 and index.term_id("unknown") is None
+        for term in index.entries:
+            weights = [
+                engine.get_document_weight(f, term, id)
+                / norms.get(*DEFAULT_PONDERATIONS)[id]
+                for (id, f) in index.entries[term][1]
+            ]
+            assert list(bounds[:, index.term_id(term)]) == pytest.approx(
+                [min(weights), max(weights)]
+            )
+
+
+class TestVectorized:
+    @pytest.mark.parametrize("ponderations", PONDERATIONS)
+    def test_same_as_scalar(self, corpus, ponderations):
+        index, stats, norms = corpus
+        query = ["t0", "t1", "t5", "t5", "t20"]
+
+        for query_ponderations in PONDERATIONS[:: len(TermPonderation) + 1]:
+            scalar = VectorialSearchEngine(
+                index, stats, *ponderations, *query_ponderations, vectorized=False
+            )
+            vectorized = VectorialSearchEngine(
+                index, stats, *ponderations, *query_ponderations
+            )
+
+            expected = scalar.compute_query(query)
+            scores = vectorized.compute_query(query)
+
+            assert list(scores.keys()) == list(expected.keys())
+            assert list(scores.values()) == pytest.approx(list(expected.values()))
+
+    def test_unknown_terms(self, corpus):
+        index, stats, norms = corpus
+        engine = VectorialSearchEngine(index, stats, norms=norms)
+        assert engine.compute_query(["unknown"]) == {}
+
+    def test_norms_match_scalar_weights(self, shard):
+        index = shard.index(InvertedIndexType.FREQUENCIES_INDEX)
+        stats = shard.compute_stats()
+        norms = compute_norms(index, stats)
+
+        for ponderations in PONDERATIONS:
+            engine = VectorialSearchEngine(index, stats, *ponderations)
+            for d in shard.documents:
+                weights = [
+                    engine.get_document_weight(f, t, d.id)
+                    for (t, f) in d.term_frequencies().items()
+                ]
+                assert norms.get(*ponderations)[d.id] == pytest.approx(
+                    math.sqrt(sum(w ** 2 for w in weights))
+                )
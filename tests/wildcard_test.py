@@ -0,0 +1,110 @@
+import pytest
+from beagle.binary_search_engine import BinarySearchEngine
+from beagle.collection import Shard, Document
+from beagle.index import InvertedIndex, InvertedIndexType, IndexFormat, load_index
+from beagle.vectorial_search_engine import VectorialSearchEngine
+from beagle.wildcard import KGramIndex, load_kgrams, pattern_kgrams
+
+TERMS = ["carcinoma", "oncology", "oncologist", "red", "rated", "dread", "été"]
+
+
+@pytest.fixture()
+def index():
+    index = InvertedIndex(InvertedIndexType.FREQUENCIES_INDEX)
+    for (i, term) in enumerate(TERMS):
+        # the df of a term is its rank in TERMS
+        index.entries[term] = [i + 1, [(id, 1) for id in range(i + 1)]]
+    return index
+
+
+class TestKGramIndex:
+    def test_pattern_kgrams(self):
+        assert pattern_kgrams("onc*") == ["$on", "onc"]
+        assert pattern_kgrams("*oma") == ["ma$", "oma"]
+        assert pattern_kgrams("*a*") == []
+
+    def test_expand(self, index):
+        assert index.expand("oncolog*") == ["oncologist", "oncology"]
+        assert index.expand("*carcinoma") == ["carcinoma"]
+        assert index.expand("*olog*") == ["oncologist", "oncology"]
+        assert index.expand("*t*") == ["oncologist", "rated", "été"]
+        assert index.expand("*zz*") == []
+        assert index.expand("oncology") == ["oncology"]
+
+    def test_post_filter(self, index):
+        # "dread" has all the k-grams of the pattern but does not start with "r"
+        assert index.expand("r*d") == ["rated", "red"]
+
+    def test_max_expansions(self, index):
+        kgrams = KGramIndex.build(index.entries)
+        # the most frequent terms are kept
+        assert kgrams.expand("*r*", index.entries, max_expansions=2) == [
+            "dread",
+            "rated",
+        ]
+        assert kgrams.expand("o*", index.entries, max_expansions=1) == ["oncologist"]
+
+    def test_save_and_load(self, index, tmp_path):
+        index.save(str(tmp_path / "index.bin"), IndexFormat.BINARY)
+        mapped = load_index(str(tmp_path / "index.bin"))
+        KGramIndex.build(mapped.entries).save(str(tmp_path / "kgrams.bin"))
+        mapped.kgrams = load_kgrams(str(tmp_path / "kgrams.bin"))
+
+        assert mapped.kgrams.terms_number == len(TERMS)
+        assert mapped.expand("*olog*") == ["oncologist", "oncology"]
+        assert mapped.expand("*té") == ["été"]
+        assert mapped.expand("r*d") == ["rated", "red"]
+        # term ids are the same in the binary index and in the sorted vocabulary
+        assert KGramIndex.build(index.entries).kgrams["$on"].tolist() == (
+            mapped.kgrams.kgrams["$on"].tolist()
+        )
+
+    def test_rebuilt_when_the_vocabulary_changes(self, index):
+        assert index.expand("onc*") == ["oncologist", "oncology"]
+        index.add_document(10, {"oncogene": (1, [0])})
+        assert index.expand("*gene") == ["oncogene"]
+
+
+@pytest.fixture()
+def shard():
+    s = Shard("", "")
+    for (i, tokens) in enumerate(
+        [["oncology", "cat"], ["oncologist"], ["carcinoma", "cat"], ["dog"]]
+    ):
+        d = Document("", "", i)
+        d.tokens = tokens
+        s.documents.append(d)
+
+    return s
+
+
+@pytest.fixture(autouse=True)
+def no_lemmatization(monkeypatch):
+    monkeypatch.setattr("beagle.binary_search_engine.lemmatize", lambda token: token)
+    monkeypatch.setattr("beagle.vectorial_search_engine.lemmatize", lambda token: token)
+
+
+class TestWildcardQueries:
+    def test_binary(self, shard):
+        engine = BinarySearchEngine(shard.index(InvertedIndexType.DOCUMENTS_INDEX))
+
+        assert list(engine.query("Oncolog*")) == [0, 1]
+        assert list(engine.query("*noma OR dog")) == [2, 3]
+        assert list(engine.query("cat AND NOT onco*")) == [2]
+        assert list(engine.query("xyz*")) == []
+
+    def test_canonical_query(self, shard):
+        engine = BinarySearchEngine(shard.index(InvertedIndexType.DOCUMENTS_INDEX))
+
+        assert engine.normalize_query("onco*") == engine.normalize_query(
+            "oncologist OR oncology"
+        )
+        assert engine.normalize_query("xyz* AND dog") == "(dog AND xyz*)"
+
+    def test_vectorial(self, shard):
+        engine = VectorialSearchEngine(
+            shard.index(InvertedIndexType.FREQUENCIES_INDEX), shard.compute_stats()
+        )
+
+        assert engine.process_query("oncolog* cat") == ["oncologist", "oncology", "cat"]
+        assert set(engine.query("oncolog*")) == {0, 1}